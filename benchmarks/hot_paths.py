@@ -0,0 +1,280 @@
+"""Benchmark the operations an annotator waits on.
+
+Usage::
+
+    python benchmarks/hot_paths.py [--output results.json]
+                                   [--baseline baseline.json]
+                                   [--save-baseline baseline.json]
+                                   [--tolerance 0.25] [--quick]
+
+Every benchmark is ran at several sizes using synthetic models and landmarks
+(see :mod:`synthetic`). Results (median and minimum seconds per call) are
+printed and optionally written as JSON. If a baseline from a previous run is
+given then any benchmark which has slowed down by more than **tolerance** (as
+a fraction) is reported and the exit code is non-zero.
+
+Runs without a display by using Qt's offscreen platform unless one is already
+configured (e.g. Xvfb).
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+from pathlib import Path
+
+if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+
+import synthetic
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """Register a benchmark. Benchmarks are generators which yield a callable
+    to be timed for each size they want to be timed at."""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def time_calls(call, repeat):
+    """Time **repeat** invocations of **call** (after one warm up)."""
+    call()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "repeat": repeat
+    }
+
+
+# --- Benchmarks ---
+
+
+@benchmark
+def open_model(root, sizes):
+    from tomial_clicky_tooth._clicker import ClickableFigure
+
+    self = ClickableFigure()
+    for size in sizes["meshes"]:
+        path = synthetic.write_stl(root / f"open-{size}.stl.xz",
+                                   synthetic.arch_mesh(size))
+        yield size, lambda: self.open_model(path)
+    self.close()
+
+
+@benchmark
+def switch_model(root, sizes):
+    from tomial_clicky_tooth._ui import UI
+
+    for size in sizes["meshes"]:
+        paths = synthetic.write_dataset(root / f"switch-{size}", 3, size,
+                                        ".stl.xz")
+        self = UI(["a", "b", "c"], paths[0])
+        yield size, lambda: self.switch_model(">")
+        self.close()
+
+
+def _figure_with_landmarks(count):
+    from tomial_clicky_tooth._clicker import ClickableFigure
+
+    self = ClickableFigure()
+    vectors = synthetic.arch_mesh(1000)
+    points = synthetic.landmarks(vectors, count, missing=0)
+    self.landmarks = np.arange(count), points
+    return self, points
+
+
+@benchmark
+def set_landmarks(root, sizes):
+    for count in sizes["landmarks"]:
+        self, points = _figure_with_landmarks(count)
+        keys = np.arange(count)
+
+        def _set():
+            self.landmarks = keys, points
+
+        yield count, _set
+        self.close()
+
+
+@benchmark
+def highlight(root, sizes):
+    for count in sizes["landmarks"]:
+        self, _ = _figure_with_landmarks(count)
+        keys = list(range(0, count, 3))
+        yield count, lambda: self.highlight(keys)
+        self.close()
+
+
+@benchmark
+def nearest_marker(root, sizes):
+    for count in sizes["landmarks"]:
+        self, points = _figure_with_landmarks(count)
+        target = points[count // 2] + .1
+        yield count, lambda: self._nearest_marker(target)
+        self.close()
+
+
+@benchmark
+def table_bulk_assignment(root, sizes):
+    from tomial_clicky_tooth._table import LandmarkTable
+
+    for count in sizes["landmarks"]:
+        self = LandmarkTable([f"landmark {i}" for i in range(count)])
+        points = synthetic.landmarks(synthetic.arch_mesh(1000), count)
+
+        def _assign():
+            self[:] = points
+
+        yield count, _assign
+        self.close()
+
+
+@benchmark
+def history_growth(root, sizes):
+    """Time recording one more undo state once there are already n states."""
+    from tomial_clicky_tooth._ui import UI
+
+    for length in sizes["history"]:
+        self = UI([f"landmark {i}" for i in range(32)])
+        for _ in range(length):
+            self._log_state()
+        yield length, self._log_state
+        self.close()
+
+
+@benchmark
+def csv_writes(root, sizes):
+    from tomial_clicky_tooth import _csv_io
+
+    for count in sizes["landmarks"]:
+        points = synthetic.landmarks(synthetic.arch_mesh(1000), count)
+        names = [f"landmark {i}" for i in range(count)]
+        yield count, lambda: _csv_io.writes(points, names=names)
+
+
+@benchmark
+def csv_read(root, sizes):
+    from tomial_clicky_tooth import _csv_io
+
+    for count in sizes["landmarks"]:
+        points = synthetic.landmarks(synthetic.arch_mesh(1000), count)
+        path = root / f"read-{count}.csv"
+        path.write_text(_csv_io.writes(points), encoding="utf-8")
+        yield count, lambda: _csv_io.read(path)
+
+
+@benchmark
+def csv_parse_points(root, sizes):
+    from tomial_clicky_tooth import _csv_io
+
+    for count in sizes["landmarks"]:
+        points = synthetic.landmarks(synthetic.arch_mesh(1000), count)
+        text = "\n".join("\t".join(map(str, i)) for i in points)
+        text = text.replace("nan", "")
+        yield count, lambda: _csv_io.parse_points(text)
+
+
+# --- Running and comparing ---
+
+sizes_default = {
+    "meshes": synthetic.MESH_SIZES,
+    "landmarks": synthetic.LANDMARK_COUNTS,
+    "history": [10, 1_000],
+}
+sizes_quick = {"meshes": [1_000], "landmarks": [10], "history": [10]}
+
+
+def run(names=None, sizes=None, repeat=5):
+    """Run benchmarks.
+
+    Returns:
+        dict: ``{"benchmark[size]": {"median": ..., "min": ..., ...}}``
+
+    """
+    from tomial_clicky_tooth._qapp import app
+
+    sizes = sizes or sizes_default
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        for name in names or BENCHMARKS:
+            for (size, call) in BENCHMARKS[name](Path(root), sizes):
+                key = f"{name}[{size}]"
+                results[key] = time_calls(call, repeat)
+                app.processEvents()
+                print(f"{key:>36}: {results[key]['median'] * 1000:10.3f} ms",
+                      file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance=.25):
+    """Find benchmarks which have slowed down relative to a baseline.
+
+    Returns:
+        dict: ``{"benchmark[size]": slowdown_ratio}`` for each regression.
+
+    """
+    regressions = {}
+    for (key, result) in results.items():
+        if key not in baseline:
+            continue
+        ratio = result["median"] / baseline[key]["median"]
+        if ratio > 1 + tolerance:
+            regressions[key] = ratio
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "names", nargs="*", help="Benchmarks to run. Defaults to all of them. "
+        f"Choose from {', '.join(BENCHMARKS)}.")
+    parser.add_argument("--output", help="Write results to a JSON file.")
+    parser.add_argument("--baseline", help="Compare against a JSON file.")
+    parser.add_argument("--save-baseline", help="Write results as a baseline.")
+    parser.add_argument("--tolerance", type=float, default=.25)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true",
+                        help="Only use the smallest sizes.")
+    options = parser.parse_args(args)
+    for name in options.names:
+        if name not in BENCHMARKS:
+            parser.error(f"Unknown benchmark '{name}'.")
+
+    results = run(options.names, sizes_quick if options.quick else None,
+                  options.repeat)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for path in filter(None, [options.output, options.save_baseline]):
+        Path(path).write_text(json.dumps(report, indent=2))
+
+    if options.baseline:
+        baseline = json.loads(Path(options.baseline).read_text())["results"]
+        regressions = compare(results, baseline, options.tolerance)
+        for (key, ratio) in regressions.items():
+            print(f"REGRESSION: {key} is {ratio:.2f}x slower than baseline.",
+                  file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Measure how long tomial_clicky_tooth takes to start up.
+
+Three milestones are recorded, each relative to the start of the script:
+
+* ``import``: The GUI modules (Qt, VTK, etc) have been imported.
+* ``first_frame``: The main window has been shown and painted.
+* ``interactive``: The initial model has been loaded and rendered.
+
+Additionally, ``total`` is the wall clock time of the whole process including
+interpreter startup and shutdown and ``first_frame_modules`` lists which of
+this package's modules had been imported by the first frame. Feature modules
+(registration, the annotation server, the dataset browser, ...) should only
+appear there once their features are used.
+
+Usage::
+
+    python benchmarks/startup.py [path/to/model.stl.xz] [--repeat 5]
+
+If no model is given, a synthetic one (see :mod:`synthetic`) is used.
+
+Each repeat is ran in a fresh interpreter so that imports are always cold.
+Results are printed as JSON.
+
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+from pathlib import Path
+
+_CHILD_ENV = "_TOMIAL_CLICKY_TOOTH_STARTUP_CHILD"
+
+
+def _child(path):
+    """Time a single startup. Runs inside the child interpreter."""
+    # Interpreter startup time (before this script got control) can't be
+    # observed from inside so is measured by the parent instead.
+    start = time.perf_counter()
+
+    from tomial_clicky_tooth._ui import UI
+    from tomial_clicky_tooth._qapp import app
+    imported = time.perf_counter()
+
+    self = UI(["a", "b", "c"])
+    self.show()
+    app.processEvents()
+    first_frame = time.perf_counter()
+    modules = sorted(
+        i for i in sys.modules if i.startswith("tomial_clicky_tooth."))
+
+    self._open_model(path, background=True)
+    while self._pending_load is not None:
+        app.processEvents()
+    self.clicker.update()
+    app.processEvents()
+    interactive = time.perf_counter()
+
+    return {
+        "import": imported - start,
+        "first_frame": first_frame - start,
+        "interactive": interactive - start,
+        "first_frame_modules": modules,
+    }
+
+
+def measure(path, repeat=5):
+    """Time **repeat** cold startups, each in a separate process, and return
+    the median of each milestone (in seconds) plus the modules imported by the
+    first frame."""
+    env = {**os.environ, _CHILD_ENV: "1"}
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, __file__, str(path)], env=env,
+            stdout=subprocess.PIPE, check=True)
+        total = time.perf_counter() - start
+        sample = json.loads(output.stdout.splitlines()[-1])
+        sample["total"] = total
+        samples.append(sample)
+    modules = samples[0].pop("first_frame_modules")
+    for sample in samples[1:]:
+        sample.pop("first_frame_modules")
+    return {
+        **{
+            key: statistics.median(i[key] for i in samples)
+            for key in samples[0]
+        },
+        "first_frame_modules": modules,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", help="A model to open.")
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as root:
+        if options.path is None:
+            import synthetic
+            options.path = synthetic.write_stl(
+                Path(root) / "synthetic.stl.xz", synthetic.arch_mesh(30_000))
+        results = measure(options.path, options.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    if os.environ.get(_CHILD_ENV):
+        print(json.dumps(_child(sys.argv[1])))
+    else:
+        main()
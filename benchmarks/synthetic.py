@@ -0,0 +1,110 @@
+"""Generate synthetic models and landmarks so that benchmarks don't depend on
+any real (and access controlled) dental models.
+
+The meshes are a bumpy horseshoe shaped strip vaguely resembling a dental arch
+which is enough to give realistic triangle counts, bounding boxes and picking
+behaviour. They are not good enough to fool tomial_odometry.
+
+"""
+
+import bz2
+import gzip
+import lzma
+from pathlib import Path
+
+import numpy as np
+
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# Small, typical and large (high resolution scanner) model sizes.
+MESH_SIZES = [1_000, 30_000, 300_000]
+LANDMARK_COUNTS = [10, 32, 200]
+
+
+def arch_mesh(n_triangles, seed=0):
+    """Create an arch shaped mesh with **n_triangles** triangles.
+
+    Returns:
+        numpy.ndarray:
+            A ``(n, 3, 3)`` float32 array of triangle corners.
+
+    """
+    across = 20
+    along = max(-(-n_triangles // (2 * (across - 1))) + 1, 2)
+    u = np.linspace(0, np.pi, along)[:, np.newaxis]
+    v = np.linspace(-1, 1, across)[np.newaxis]
+
+    # A parabola-ish arch, 50mm wide, with a 10mm wide strip following it.
+    radius = 25 + 5 * v
+    x = radius * np.cos(u)
+    y = radius * np.sin(u) * 1.2
+    # Cusp-like bumps along the arch and a rounded cross section.
+    random = np.random.default_rng(seed)
+    phase = random.uniform(0, 2 * np.pi)
+    z = 4 * (1 - v**2) + 1.5 * np.sin(16 * u + phase)**2 * (1 - v**2)
+    grid = np.stack(np.broadcast_arrays(x, y, z), axis=-1).astype(np.float32)
+
+    # Split each grid quad into 2 triangles. Keep each pair adjacent so that
+    # trimming off the excess triangles just shortens the arch slightly.
+    a, b = grid[:-1, :-1], grid[1:, :-1]
+    c, d = grid[:-1, 1:], grid[1:, 1:]
+    vectors = np.stack([
+        np.stack([a, b, d], axis=-2),
+        np.stack([a, d, c], axis=-2),
+    ], axis=-3).reshape((-1, 3, 3))
+    return vectors[:n_triangles]
+
+
+def landmarks(vectors, n, missing=.1, seed=0):
+    """Pick **n** points lying on a mesh's surface.
+
+    A fraction **missing** of the points are NaN, mimicking landmarks which are
+    yet to be placed.
+
+    """
+    random = np.random.default_rng(seed)
+    ids = random.integers(0, len(vectors), n)
+    weights = random.dirichlet(np.ones(3), n)
+    points = np.einsum("ijk,ij->ik", vectors[ids], weights.astype(np.float32))
+    points = points.astype(float)
+    points[random.random(n) < missing] = np.nan
+    return points
+
+
+_STL_DTYPE = np.dtype([("normal", "<f4", 3), ("vectors", "<f4", (3, 3)),
+                       ("attribute", "<u2")])
+
+
+def write_stl(path, vectors):
+    """Write a binary STL file, compressing it if **path** ends with one of
+    the suffixes in :data:`OPENERS`."""
+    path = Path(path)
+    data = np.zeros(len(vectors), _STL_DTYPE)
+    data["vectors"] = vectors
+    normals = np.cross(vectors[:, 1] - vectors[:, 0],
+                       vectors[:, 2] - vectors[:, 0])
+    lengths = np.linalg.norm(normals, axis=-1, keepdims=True)
+    data["normal"] = normals / np.where(lengths, lengths, 1)
+
+    opener = OPENERS.get(path.suffix, open)
+    with opener(path, "wb") as f:
+        f.write(b"synthetic".ljust(80, b"\0"))
+        f.write(np.uint32(len(data)).tobytes())
+        f.write(data.tobytes())
+    return path
+
+
+def write_dataset(root, n_models, n_triangles, suffix=".stl", seed=0):
+    """Fill a directory with synthetic models.
+
+    Returns:
+        list[pathlib.Path]: The model filenames.
+
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    return [
+        write_stl(root / f"synthetic-{i}{suffix}",
+                  arch_mesh(n_triangles, seed=seed + i))
+        for i in range(n_models)
+    ]
@@ -1,4 +1,5 @@
 import os
+import shutil
 from pathlib import Path
 import re
 
@@ -40,6 +41,48 @@ def pytest_report_header(config):
     return ["Xvfb display: {}".format(xvfb_size())]
 
 
+@pytest.fixture(autouse=True, scope="session")
+def isolated_cache(tmp_path_factory):
+    """Prevent tests from reading or polluting the real user cache."""
+    from tomial_clicky_tooth._cache import CACHE_ENV
+    old = os.environ.get(CACHE_ENV)
+    os.environ[CACHE_ENV] = str(tmp_path_factory.mktemp("cache"))
+    yield
+    if old is None:
+        del os.environ[CACHE_ENV]
+    else:
+        os.environ[CACHE_ENV] = old
+
+
+@pytest.fixture
+def write_dataset(tmp_path):
+    """Populate a dataset directory from ``{filename: contents}`` pairs.
+
+    Contents may be a path to copy, a :class:`motmot.Mesh` (encoded to suit
+    the filename's ``.mesh`` or ``.mesh.gz`` suffix), text or bytes. The
+    directory defaults to **tmp_path** and is returned.
+
+    """
+    def write_dataset(files, root=tmp_path):
+        from tomial_clicky_tooth import _meshfile
+
+        root.mkdir(parents=True, exist_ok=True)
+        for (name, contents) in files.items():
+            path = root / name
+            if isinstance(contents, Path):
+                shutil.copy(contents, path)
+            elif isinstance(contents, str):
+                path.write_text(contents, encoding="utf-8")
+            elif isinstance(contents, bytes):
+                path.write_bytes(contents)
+            else:
+                suffix = "".join(path.suffixes)
+                path.write_bytes(_meshfile.encode(contents, suffix))
+        return root
+
+    return write_dataset
+
+
 @pytest.fixture(autouse=True)
 def close_all_windows():
     """Close all open Qt Windows before and after each test."""
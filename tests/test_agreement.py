@@ -0,0 +1,158 @@
+import json
+
+import numpy as np
+import pytest
+
+from tomial_clicky_tooth import _agreement, _cli, _csv_io
+
+pytestmark = pytest.mark.order(1)
+
+NAMES = [f"L{i}" for i in range(8)]
+
+
+def random_rotation(generator):
+    q, r = np.linalg.qr(generator.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    if np.linalg.det(q) < 0:
+        q[:, 0] *= -1
+    return q
+
+
+def write_annotators(root, models=6, annotators=3, seed=0):
+    """Several annotators landmarking the same randomly posed, similar shapes
+    with a little noise."""
+    generator = np.random.default_rng(seed)
+    mean = generator.normal(scale=10, size=(len(NAMES), 3))
+    shapes = [(mean + generator.normal(scale=.5, size=mean.shape))
+              @ random_rotation(generator) + generator.normal(size=3) * 50
+              for _ in range(models)]  # yapf: disable
+    for i in range(annotators):
+        folder = root / f"annotator{i}"
+        folder.mkdir()
+        for (j, shape) in enumerate(shapes):
+            points = shape + generator.normal(scale=.1, size=shape.shape)
+            (folder / f"{j}L.csv").write_text(
+                _csv_io.writes(points.tolist(), names=NAMES))
+
+
+def test_load(tmp_path):
+    for name in "ab":
+        (tmp_path / name).mkdir()
+    (tmp_path / "a" / "1L.csv").write_text(
+        _csv_io.writes([(1, 2, 3), None], names=["x", "y"]))
+    (tmp_path / "a" / "1L.proposals.csv").write_text("garbage")
+    (tmp_path / "b" / "1L.csv").write_text(
+        _csv_io.writes([(4, 5, 6), (7, 8, 9)], names=["z", "x"]))
+    (tmp_path / "b" / "2L.csv").write_bytes(b"\xff\xfe")
+
+    self = _agreement.load([tmp_path / "a", tmp_path / "b"])
+    assert self.annotators == ["a", "b"]
+    assert self.models == ["1L"]
+    assert self.names == ["x", "y", "z"]
+    assert self.points.shape == (2, 1, 3, 3)
+    assert self.points[0, 0, 0].tolist() == [1, 2, 3]
+    assert np.isnan(self.points[0, 0, 1:]).all()
+    assert self.points[1, 0].tolist()[0] == [7, 8, 9]
+    assert self.points[1, 0].tolist()[2] == [4, 5, 6]
+    assert len(self.errors) == 1 and self.errors[0][0].endswith("2L.csv")
+
+    self = _agreement.load([tmp_path / "a", tmp_path / "b"], names=["z"])
+    assert self.points.shape == (2, 1, 1, 3)
+
+
+def test_icc():
+    # Shrout and Fleiss (1979)'s worked example: 6 targets, 4 judges.
+    ratings = np.array([[9, 2, 5, 8], [6, 1, 3, 2], [8, 4, 6, 8],
+                        [7, 1, 2, 6], [10, 5, 6, 9], [6, 2, 4, 7]], float)
+    points = np.repeat(ratings.T[:, :, np.newaxis, np.newaxis], 3, axis=-1)
+    assert _agreement.icc(points) == pytest.approx([.29], abs=.005)
+    # Perfect agreement.
+    assert _agreement.icc(points[[0, 0]]) == pytest.approx([1])
+    # Too few models or annotators to say anything.
+    assert np.isnan(_agreement.icc(points[:1])).all()
+    assert np.isnan(_agreement.icc(points[:, :1])).all()
+
+
+def test_procrustes():
+    generator = np.random.default_rng(1)
+    shape = generator.normal(scale=10, size=(8, 3))
+    posed = np.array([
+        shape @ random_rotation(generator) + generator.normal(size=3) * 50
+        for _ in range(5)
+    ])
+    posed[2, 3] = np.nan
+    aligned, mean = _agreement.procrustes(posed[np.newaxis])
+    assert aligned.shape == posed[np.newaxis].shape
+    residuals = np.linalg.norm(aligned - mean, axis=-1)
+    assert np.nanmax(residuals) < 1e-6
+    assert np.isnan(aligned[0, 2, 3]).all()
+    # Rigid alignment keeps the shape's size.
+    assert np.linalg.norm(mean[0] - mean[1]) \
+        == pytest.approx(np.linalg.norm(shape[0] - shape[1]))
+
+
+def test_outlier_scores():
+    distances = np.array([1., 1.1, .9, 1., 10., np.nan])[:, np.newaxis]
+    scores = _agreement.outlier_scores(distances)
+    assert scores[4, 0] == pytest.approx(10)
+    assert (scores[:4] < 1.2).all()
+    # Near perfect placements don't blow up.
+    assert _agreement.outlier_scores(distances / 1000)[4, 0] \
+        == pytest.approx(.1)
+    assert np.isnan(scores[5, 0])
+
+
+def test_analyse(tmp_path):
+    write_annotators(tmp_path, models=20)
+    # One annotator puts one landmark on the wrong tooth.
+    csv = tmp_path / "annotator1" / "3L.csv"
+    names, points = _csv_io.read_named(csv)
+    points[4] = tuple(np.add(points[4], 5))
+    csv.write_text(_csv_io.writes(points, names=names))
+
+    annotations = _agreement.load(sorted(tmp_path.iterdir()))
+    report = _agreement.analyse(annotations)
+    assert report["annotators"] == ["annotator0", "annotator1", "annotator2"]
+    assert len(report["landmarks"]) == len(NAMES)
+    for landmark in report["landmarks"]:
+        assert landmark["placed"] == 60
+        assert (landmark["icc"] < .5) == (landmark["name"] == "L4")
+    assert report["landmarks"][4]["mean_distance"] \
+        > report["landmarks"][3]["mean_distance"]
+
+    flagged = [i for i in report["models"] if i["flags"]]
+    assert [i["model"] for i in flagged] == ["3L"]
+    assert {(i["annotator"], i["landmark"]) for i in flagged[0]["flags"]} \
+        >= {("annotator1", "L4")}
+    assert {i["kind"] for i in flagged[0]["flags"]} \
+        == {"disagreement", "outlier"}
+    assert flagged[0]["path"] is None
+
+    # Round trip.
+    path = tmp_path / "qa.json"
+    _agreement.write_report(path, report)
+    assert _agreement.read_report(path) == json.loads(json.dumps(report))
+    path.write_text("[]")
+    with pytest.raises(ValueError):
+        _agreement.read_report(path)
+
+    text = _agreement.format_report(report)
+    assert "FLAG  3L\n" in text
+    assert "L4 by annotator1 is an outlier" in text
+    assert text.endswith("1/20 models flagged.")
+
+
+def test_cli(tmp_path, capsys):
+    write_annotators(tmp_path, models=4, annotators=2)
+    folders = [str(tmp_path / "annotator0"), str(tmp_path / "annotator1")]
+    assert _cli.main(["agreement", *folders]) == 0
+    assert "0/4 models flagged." in capsys.readouterr().out
+
+    (tmp_path / "annotator1" / "2L.csv").write_text(
+        _csv_io.writes([(100, 100, 100)] * len(NAMES), names=NAMES))
+    output = tmp_path / "qa.json"
+    assert _cli.main(["agreement", *folders, "--json", "-o",
+                      str(output)]) == 1
+    report = json.loads(capsys.readouterr().out)
+    assert report == _agreement.read_report(output)
+    assert [i["model"] for i in report["models"] if i["flags"]] == ["2L"]
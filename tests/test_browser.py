@@ -0,0 +1,146 @@
+import time
+import shutil
+from pathlib import Path
+
+import pytest
+from PyQt5 import QtCore, QtTest
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth._qapp import app
+from tomial_clicky_tooth import _browser, _csv_io, _dataset, _snapshots
+
+pytestmark = pytest.mark.order(5)
+
+
+def dataset(root, n=3):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    suffix = "".join(model.suffixes)
+    return [Path(shutil.copy(model, root / f"{i}{suffix}")) for i in range(n)]
+
+
+def wait(model, timeout=60):
+    start = time.time()
+    while model.pending:
+        assert time.time() - start < timeout
+        app.processEvents()
+        time.sleep(.01)
+
+
+def test_completion(tmp_path):
+    paths = dataset(tmp_path, 4)
+    assert _browser.completion(paths[0]) is None
+    _dataset.csv_path(paths[1]).write_text(
+        _csv_io.writes([(1, 2, 3), None], names=["a", "b"]))
+    assert _browser.completion(paths[1]) == (1, 2)
+    _dataset.csv_path(paths[2]).write_text(
+        _csv_io.writes([(1, 2, 3)], names=["a"]))
+    _dataset.proposals_path(paths[3]).write_text(
+        _csv_io.writes([(1, 2, 3)], names=["a"]))
+
+    self = _browser.ThumbnailModel(paths)
+    assert self.rowCount() == 4
+    assert self.data(self.index(1)) == "1"
+    brushes = [self.data(self.index(i), QtCore.Qt.BackgroundRole)
+               for i in range(4)]
+    assert brushes[0] is None
+    assert brushes[1].color() == _browser.StatusColors.PARTIAL
+    assert brushes[2].color() == _browser.StatusColors.COMPLETE
+    assert brushes[3].color() == _browser.StatusColors.PROPOSED
+    assert self.data(self.index(1), QtCore.Qt.ToolTipRole) \
+        == "1: 1/2 landmarks"
+    assert self.status_text(paths[0]) == "not started"
+    assert self.status_text(paths[3]) == "proposals only"
+
+    # Statuses follow changes to the landmarks files.
+    _dataset.csv_path(paths[0]).write_text(
+        _csv_io.writes([None], names=["a"]))
+    assert self.status(paths[0]) == (0, 1)
+    assert self.data(self.index(0), QtCore.Qt.BackgroundRole) is None
+
+
+def test_thumbnails(tmp_path):
+    paths = dataset(tmp_path)
+    paths.append(tmp_path / "invalid.stl")
+    paths[-1].write_bytes(b"not an STL")
+    self = _browser.ThumbnailModel(paths, (40, 30), jobs=1, capacity=2)
+    changed = []
+    self.dataChanged.connect(lambda a, b, roles: changed.append(a.row()))
+    try:
+        placeholder = self.placeholder.toImage()
+        assert self.data(self.index(0), QtCore.Qt.DecorationRole) \
+            is self.placeholder
+
+        self.request([0, 3])
+        assert self.pending == 2
+        wait(self)
+        assert sorted(changed) == [0, 3]
+        thumbnail = self.data(self.index(0), QtCore.Qt.DecorationRole)
+        assert thumbnail.size() == QtCore.QSize(40, 30)
+        assert thumbnail.toImage() != placeholder
+        # Unreadable models just keep the placeholder.
+        assert self.data(self.index(3), QtCore.Qt.DecorationRole) \
+            .toImage() == placeholder
+
+        # Only the most recently requested thumbnails are kept.
+        self.request([1])
+        wait(self)
+        assert len(self._thumbnails) == 2
+        assert list(self._thumbnails)[-1] == paths[1]
+
+        # Loads for rows which scroll out of view are abandoned. Only as many
+        # as there are workers are in flight at once so only those can still
+        # finish.
+        self.request([0, 2])
+        assert len(self._pending) <= 1
+        changed.clear()
+        self.request([])
+        wait(self)
+        assert len(changed) <= 1
+    finally:
+        self.shutdown()
+    assert self.pending == 0
+
+
+def test_browser(tmp_path):
+    # The grid's layout doesn't care that these don't exist.
+    paths = [tmp_path / f"{i}.stl" for i in range(200)]
+    self = _browser.DatasetBrowser(paths, (40, 30), jobs=1)
+    self.resize(4 * self.gridSize().width() + 40, 3 * self.gridSize().height())
+    self.show()
+    app.processEvents()
+    try:
+        # Only the tiles in view are rendered.
+        rows = self.visible_rows()
+        assert 0 < len(rows) < 40
+        for row in rows:
+            assert self.visualRect(self.model().index(row)) \
+                .intersects(self.viewport().rect())
+        assert not self.visualRect(self.model().index(rows.stop)) \
+            .intersects(self.viewport().rect())
+
+        self.verticalScrollBar().setValue(self.gridSize().height() * 10 + 5)
+        rows = self.visible_rows()
+        assert rows.start > 0
+        for row in rows:
+            assert self.visualRect(self.model().index(row)) \
+                .intersects(self.viewport().rect())
+        assert not self.visualRect(self.model().index(rows.start - 1)) \
+            .intersects(self.viewport().rect())
+
+        # Scrolled past tiles are never loaded. (These ones fail instantly.)
+        while self._timer.isActive():
+            QtTest.QTest.qWait(10)
+        wait(self.model())
+        loaded = set(self.model()._thumbnails)
+        assert {paths[i] for i in rows} <= loaded
+        assert len(loaded) < 2 * len(rows)
+
+        chosen = []
+        self.model_chosen.connect(chosen.append)
+        self.scroll_to(paths[0])
+        index = self.model().index(0)
+        self.doubleClicked.emit(index)
+        assert chosen == [paths[0]]
+    finally:
+        self.close()
+    assert self.model().pending == 0
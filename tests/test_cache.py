@@ -0,0 +1,73 @@
+import os
+from pathlib import Path
+
+import pytest
+import numpy as np
+
+from tomial_clicky_tooth import _cache
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_cache_root(monkeypatch, tmp_path):
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path))
+    assert _cache.cache_root() == tmp_path
+
+    monkeypatch.delenv(_cache.CACHE_ENV)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert _cache.cache_root() == tmp_path / "tomial_clicky_tooth"
+
+
+def test_json(monkeypatch, tmp_path):
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path))
+    self = _cache.Cache("foo")
+    key = _cache.hash_bytes(b"bar")
+    assert key == _cache.hash_bytes(b"bar") != _cache.hash_bytes(b"baz")
+
+    assert self.read_json(key) is None
+    self.clear()
+    assert self.write_json(key, {"a": [1, 2]})
+    assert self.read_json(key) == {"a": [1, 2]}
+    assert self.root == tmp_path / "foo"
+    assert [i.name for i in self.root.iterdir()] == [f"{key}-v1.json"]
+
+    # Entries written under an old format version should be invisible.
+    assert _cache.Cache("foo", version=2).read_json(key) is None
+
+    # Corrupt entries should be treated as missing.
+    self.path(key, ".json").write_bytes(b"{not json")
+    assert self.read_json(key) is None
+
+    self.clear()
+    assert list(self.root.iterdir()) == []
+
+
+def test_array(monkeypatch, tmp_path):
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path))
+    self = _cache.Cache("foo")
+    assert self.read_array("bar") is None
+    assert self.write_array("bar", np.arange(6.).reshape((2, 3)))
+    assert self.read_array("bar").tolist() == [[0, 1, 2], [3, 4, 5]]
+
+    self.path("bar", ".npy").write_bytes(b"not an array")
+    assert self.read_array("bar") is None
+    self.path("bar", ".npy").write_bytes(b"")
+    assert self.read_array("bar") is None
+
+
+def test_prune(monkeypatch, tmp_path):
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path))
+    self = _cache.Cache("foo", max_size=25)
+    for (i, key) in enumerate("abc"):
+        self.write_bytes(key, ".bin", b"x" * 10)
+        os.utime(self.path(key, ".bin"), (i, i))
+    # Reading an entry counts as using it.
+    assert self.read_bytes("a", ".bin") == b"x" * 10
+    self.prune()
+    assert sorted(i.name for i in self.root.iterdir()) == ["a-v1.bin",
+                                                           "c-v1.bin"]
+
+    # Unbounded caches are never pruned.
+    _cache.Cache("foo").prune()
+    assert len(list(self.root.iterdir())) == 2
+
@@ -0,0 +1,152 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from motmot import Mesh
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _cleaning, _dataset, _meshfile, _cli
+
+pytestmark = pytest.mark.order(1)
+
+
+def sorted_triangles(vectors):
+    """Put triangles into a canonical order for comparison."""
+    vectors = np.asarray(vectors).reshape((-1, 9))
+    return vectors[np.lexsort(vectors.T[::-1])]
+
+
+def test_index_dtype():
+    assert _cleaning.index_dtype(0) == np.uint16
+    assert _cleaning.index_dtype(1 << 16) == np.uint16
+    assert _cleaning.index_dtype((1 << 16) + 1) == np.uint32
+    assert _cleaning.index_dtype(1 << 40) == np.uint64
+
+
+def test_weld():
+    vectors = np.array([
+        [[0, 0, 0], [1, 0, 0], [0, 1, 0]],
+        [[1, 0, 0], [-0., 0, 0], [1, 1, 0]],
+        [[1.01, 0, 0], [1, 1, 0], [2, 0, 0]],
+    ], np.float32)
+    vertices, faces = _cleaning.weld(vectors)
+    # -0.0 and 0.0 are the same vertex. Vertices are in order of first use.
+    assert faces.tolist() == [[0, 1, 2], [1, 0, 3], [4, 3, 5]]
+    assert vertices[faces] == pytest.approx(vectors)
+
+    vertices, faces = _cleaning.weld(vectors, tolerance=.1)
+    assert faces.tolist() == [[0, 1, 2], [1, 0, 3], [1, 3, 4]]
+    assert vertices[1].tolist() == [1, 0, 0]
+
+
+def test_clean():
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    vertices, faces, report = _cleaning.clean(mesh)
+    assert faces.dtype == np.uint16
+    assert len(vertices) == len(mesh.vertices)
+    assert sorted_triangles(vertices[faces]) == \
+        pytest.approx(sorted_triangles(mesh.vectors))
+    assert report == {
+        "triangles": len(mesh),
+        "degenerate": 0,
+        "duplicates": 0,
+        "vertices": len(mesh.vertices),
+        "before": mesh.vectors.nbytes,
+        "after": _cleaning.nbytes(Mesh(vertices, faces)),
+    }
+    assert report["after"] < report["before"]
+
+    # Add a reversed and a rotated copy of some triangles, a triangle with a
+    # repeated corner, a flat one and one on its own so that its vertices
+    # become unused once it's removed.
+    vectors = np.concatenate([
+        mesh.vectors,
+        mesh.vectors[:5, ::-1],
+        np.roll(mesh.vectors[5:7], 1, axis=1),
+        mesh.vectors[:1, [0, 0, 1]],
+        [[[100, 0, 0], [101, 0, 0], [102, 0, 0]]],
+    ])
+    vertices, faces, report = _cleaning.clean(Mesh(vectors))
+    assert (report["degenerate"], report["duplicates"]) == (2, 7)
+    assert report["vertices"] == len(mesh.vertices) == len(vertices)
+    # The first of each duplicate is kept.
+    assert sorted_triangles(vertices[faces]) == \
+        pytest.approx(sorted_triangles(mesh.vectors))
+
+    # An already indexed mesh.
+    indexed = Mesh(mesh.vertices, mesh.faces)
+    assert _cleaning.clean(indexed)[2]["before"] == \
+        mesh.vertices.nbytes + mesh.faces.nbytes
+
+
+def test_load(monkeypatch):
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    cleaned, report = _cleaning.load(mesh)
+    assert cleaned.is_faces_mesh
+    assert cleaned.path == mesh.path
+    assert len(cleaned) == report["triangles"]
+    assert _cleaning.nbytes(cleaned) == report["after"]
+
+    # Second time round should come straight out of the cache.
+    def fail(*_):
+        raise AssertionError
+
+    monkeypatch.setattr(_cleaning, "clean", fail)
+    (cached, cached_report) = _cleaning.load(mesh)
+    assert cached_report == report
+    assert np.array_equal(cached.vertices, cleaned.vertices)
+    assert np.array_equal(cached.faces, cleaned.faces)
+    # But changing the tolerance invalidates it.
+    with pytest.raises(AssertionError):
+        _cleaning.load(mesh, .01)
+
+    # Cached meshes are stored compressed.
+    cache = _cleaning._cleaning_cache
+    sizes = [i.stat().st_size for i in cache.root.glob("*.mesh.gz")]
+    assert sizes and max(sizes) < report["after"] / 2
+
+
+def test_cache_size(monkeypatch):
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    cache = _cleaning._cleaning_cache
+    cache.clear()
+    _cleaning.load(mesh)
+    size = sum(i.stat().st_size for i in cache.root.iterdir())
+    # Leave room for just one cleaned mesh.
+    monkeypatch.setattr(cache, "max_size", size * 1.5)
+    _cleaning.load(mesh, .01)
+    assert len(list(cache.root.glob("*.mesh.gz"))) == 1
+
+
+def test_read_model():
+    path = tomial_tooth_collection_api.model("1L")
+    (mesh, _) = _dataset.read_model(path, clean=True)
+    assert mesh.is_faces_mesh
+    assert not _dataset.read_model(path)[0].is_faces_mesh
+
+
+def test_cli(tmp_path, capsys):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    mesh = Mesh(model)
+    shutil.copy(model, tmp_path / "1L.stl.gz")
+    (tmp_path / "2L.mesh").write_bytes(
+        _meshfile.encode(Mesh(mesh.vertices, mesh.faces[[0, 0, 1]]), ".mesh"))
+    (tmp_path / "3L.mesh.gz").write_bytes(b"garbage")
+
+    args = ["clean", str(tmp_path), "-j", "1"]
+    assert _cli.main(args) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith(f"1L: {len(mesh)} triangles -> ")
+    assert lines[1].startswith("2L: 3 triangles -> 4 vertices, "
+                               "0 degenerate, 1 duplicates, ")
+    assert lines[-1] == "1 errors."
+
+    (tmp_path / "3L.mesh.gz").unlink()
+    assert _cli.main(args + ["--json"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert json.loads(lines[0])["triangles"] == len(mesh)
+    summary = json.loads(lines[-1])["summary"]
+    assert summary["models"] == 2
+    assert summary["before"] > summary["after"]
@@ -1,8 +1,10 @@
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 import tomial_tooth_collection_api
 import vtkplotlib as vpl
+from motmot.geometry import UnitVector
 
 from tomial_clicky_tooth._qapp import app
 from tomial_clicky_tooth._clicker import ClickableFigure
@@ -56,3 +58,40 @@ def test_non_dental_model():
     assert self.mesh is not None
 
     self.close()
+
+
+def test_crop():
+    self = ClickableFigure()
+    self.show(block=False)
+    path = tomial_tooth_collection_api.model("1L")
+    self.open_model(path)
+    self.odometry = SimpleNamespace(occlusal=UnitVector([0, 1, 0]))
+    full = self.mesh_plot.polydata.points.shape
+
+    # Without odometry, or with cropping disabled, the whole model is shown.
+    assert self.visible_mesh() is self.mesh
+    self.set_crop(True, 5.)
+    app.processEvents()
+    assert len(self.plots) == 1
+    cropped = self.visible_mesh()
+    assert 0 < len(cropped) < len(self.mesh)
+    assert self.mesh_plot.polydata.points.shape[0] < full[0]
+    assert self.odometry.occlusal(cropped.vertices).min() >= \
+        self.odometry.occlusal(self.mesh.vertices).max() - 5 - 1
+    # The cropped mesh is reused until the depth changes.
+    self.set_crop(False)
+    assert self.visible_mesh() is self.mesh
+    self.set_crop(True)
+    assert self.visible_mesh() is cropped
+    self.set_crop(True, 10.)
+    assert len(self.visible_mesh()) > len(cropped)
+    # A depth of 0 is a depth, not a request for the default.
+    self.set_crop(True, 0.)
+    assert 0 < len(self.visible_mesh()) < len(cropped)
+
+    # The setting outlives the model but the cropped mesh doesn't.
+    self.close_model()
+    assert self.crop
+    assert self._cropped is None
+
+    self.close()
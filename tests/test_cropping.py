@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+from motmot import Mesh
+from motmot.geometry import UnitVector
+
+from tomial_clicky_tooth import _cropping
+
+pytestmark = pytest.mark.order(1)
+
+
+def tower(height=40.):
+    """A tall, open-ended square tube with a ring of triangles every 1mm."""
+    z = np.arange(0, height, 1.)
+    corners = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=float)
+    vectors = []
+    for (a, b) in zip(corners, np.roll(corners, -1, axis=0)):
+        for (bottom, top) in zip(z[:-1], z[1:]):
+            quad = [[*a, bottom], [*b, bottom], [*b, top], [*a, top]]
+            vectors += [quad[:3], [quad[0], quad[2], quad[3]]]
+    return Mesh(np.array(vectors, dtype=np.float32))
+
+
+def test_crop_mask():
+    mesh = tower()
+    keep = _cropping.crop_mask(mesh.vectors, [0, 0, 1], 10)
+    assert keep.shape == (len(mesh),)
+    # Triangles which reach at least 29mm up are kept.
+    assert (keep == (mesh.vectors[:, :, 2].max(axis=1) >= 29)).all()
+
+    # Measured along the occlusal axis, not just z.
+    keep = _cropping.crop_mask(mesh.vectors, UnitVector([0, 0, -1]), 10)
+    assert (keep == (mesh.vectors[:, :, 2].min(axis=1) <= 10)).all()
+
+    assert _cropping.crop_mask(np.empty((0, 3, 3)), [0, 0, 1]).shape == (0,)
+
+
+def test_crop():
+    mesh = tower()
+    cropped = _cropping.crop(mesh, UnitVector([0, 0, 1]), 10)
+    # 11 rings of 8 triangles reach 29mm or higher.
+    assert len(cropped) == 88
+    assert cropped.z.min() == 28
+    assert cropped.z.max() == 39
+
+    # Indexed meshes stay indexed, without the unused vertices.
+    indexed = _cropping.crop(Mesh(mesh.vertices, mesh.faces),
+                             UnitVector([0, 0, 1]), 10)
+    assert indexed.is_faces_mesh
+    assert len(indexed.vertices) == 4 * 12
+    assert indexed.vectors == pytest.approx(cropped.vectors)
+
+    # Nothing to remove.
+    assert _cropping.crop(mesh, UnitVector([0, 0, 1]), 100) is mesh
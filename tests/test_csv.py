@@ -4,7 +4,8 @@
 import numpy as np
 import pytest
 
-from tomial_clicky_tooth._csv_io import parse_points, read, writes
+from tomial_clicky_tooth._csv_io import parse_points, read, read_named, \
+    writes
 
 pytestmark = pytest.mark.order(1)
 
@@ -44,6 +45,12 @@ def test_read():
     ]
 
 
+def test_read_named():
+    names, points = read_named(Path(__file__).with_name("points.csv"))
+    assert names == list("abcdefgh")
+    assert points == read(Path(__file__).with_name("points.csv"))
+
+
 def test_writes():
     """Test tomial_clicky_tooth._csv_io.writes() on both NumPy arrays and plain
     lists of tuples."""
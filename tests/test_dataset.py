@@ -0,0 +1,26 @@
+from pathlib import Path
+
+import pytest
+
+from tomial_clicky_tooth import _dataset
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_names():
+    assert _dataset.model_name("foo/1L.stl.xz") == "1L"
+    assert _dataset.model_name("1U.stl") == "1U"
+    assert _dataset.csv_path("foo/1L.stl.bz2") == Path("foo/1L.csv")
+    assert _dataset.proposals_path("foo/1L.stl.bz2") == \
+           Path("foo/1L.proposals.csv")
+    assert _dataset.is_model("bar.stl.gz")
+    assert _dataset.model_name("foo/1L.mesh.gz") == "1L"
+    assert not _dataset.is_model("bar.csv")
+    assert not _dataset.is_model("bar.stl.zip")
+
+
+def test_model_paths(tmp_path):
+    for name in ["b.stl", "a.stl.xz", "a.csv", "c.txt"]:
+        (tmp_path / name).touch()
+    assert _dataset.model_paths(tmp_path) == \
+           [tmp_path / "a.stl.xz", tmp_path / "b.stl"]
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+import numpy as np
+from motmot import Mesh
+from motmot.geometry import UnitVector
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _features
+
+pytestmark = pytest.mark.order(1)
+
+
+def bump(height=1.):
+    """A square grid with a gaussian bump in the middle."""
+    x, y = np.meshgrid(np.linspace(-5, 5, 41), np.linspace(-5, 5, 41))
+    z = height * np.exp(-(x**2 + y**2) / 2)
+    grid = np.stack([x, y, z], axis=-1)
+    a, b, c, d = grid[:-1, :-1], grid[:-1, 1:], grid[1:, 1:], grid[1:, :-1]
+    vectors = np.concatenate([np.stack([a, b, c], -2), np.stack([a, c, d], -2)])
+    return Mesh(vectors.reshape((-1, 3, 3)).astype(np.float32))
+
+
+def test_vertex_convexity():
+    mesh = bump()
+    convexity = _features.vertex_convexity(mesh)
+    assert convexity.shape == (len(mesh.vertices),)
+    assert np.isfinite(convexity).all()
+    # Peak of the bump is convex, its foot is concave.
+    peak = np.argmin(np.linalg.norm(mesh.vertices, axis=1))
+    foot = np.argmin(np.abs(np.linalg.norm(mesh.vertices[:, :2], axis=1) - 2))
+    assert convexity[peak] > 0 > convexity[foot]
+
+
+def test_find_features():
+    mesh = bump()
+    features = _features.find_features(mesh)
+    assert features == pytest.approx(np.array([[0, 0, 1]]))
+
+    # Sideways, the highest points are all on the mesh's edge which never
+    # counts.
+    sideways = SimpleNamespace(occlusal=UnitVector([1, .1, .05]))
+    features = _features.find_features(mesh, sideways)
+    assert features == pytest.approx(np.array([[0, 0, 1]]))
+
+    # The bottom of a pit isn't convex but is the highest point if upside down.
+    upside_down = SimpleNamespace(occlusal=UnitVector([0, 0, -1]))
+    features = _features.find_features(bump(-1.), upside_down)
+    assert [0, 0, -1] in features.tolist()
+    assert (np.abs(features[:, :2]) < 5).all()
+
+    assert len(_features.find_features(Mesh(np.empty((0, 3, 3))))) == 0
+
+
+def test_snap():
+    self = _features.Features([[0, 0, 0], [10, 0, 0]])
+    assert len(self) == 2
+    assert self.snap([9.5, 0, 0]).tolist() == [10, 0, 0]
+    assert self.snap([0, .5, 0], radius=.6).tolist() == [0, 0, 0]
+    assert self.snap([0, .5, 0], radius=.4) == [0, .5, 0]
+    assert _features.Features([]).snap((1, 2, 3)) == (1, 2, 3)
+
+
+def test_load(monkeypatch):
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    features = _features.load(mesh)
+    assert len(features)
+    assert np.isin(features.points, mesh.vertices).all()
+
+    # Second time round should come straight out of the cache.
+    def fail(*_):
+        raise AssertionError
+
+    monkeypatch.setattr(_features, "find_features", fail)
+    assert _features.load(mesh).points == pytest.approx(features.points)
+    # But changing the orientation invalidates it.
+    with pytest.raises(AssertionError):
+        _features.load(mesh, SimpleNamespace(occlusal=UnitVector([0, 0, 1])))
@@ -0,0 +1,132 @@
+import heapq
+from pathlib import Path
+
+import numpy as np
+import pytest
+from motmot import Mesh
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _geodesics, _cli, _csv_io
+from tomial_clicky_tooth._geodesics import MeshGraph
+
+pytestmark = pytest.mark.order(1)
+
+
+def folded_strip():
+    """A 1 wide strip lying flat for 3 units then folded straight up for
+    another 3."""
+    vertices = [(x, y, 0) for y in range(4) for x in (0, 1)] + \
+        [(x, 3, z) for z in range(1, 4) for x in (0, 1)]
+    vertices = np.array(vertices, dtype=np.float64)
+    faces = []
+    for i in range(0, len(vertices) - 2, 2):
+        faces += [(i, i + 1, i + 3), (i, i + 3, i + 2)]
+    return vertices, np.array(faces)
+
+
+def dijkstra(graph, sources, initial):
+    """A plain priority queue Dijkstra to check against."""
+    distances = np.full(len(graph), np.inf)
+    queue = []
+    for (source, distance) in zip(sources, initial):
+        distances[source] = min(distances[source], distance)
+        heapq.heappush(queue, (distance, source))
+    while queue:
+        (distance, u) = heapq.heappop(queue)
+        if distance > distances[u]:
+            continue
+        for edge in range(graph.indptr[u], graph.indptr[u + 1]):
+            v = graph.indices[edge]
+            if distance + graph.weights[edge] < distances[v]:
+                distances[v] = distance + graph.weights[edge]
+                heapq.heappush(queue, (distances[v], v))
+    return distances
+
+
+def test_graph():
+    vertices, faces = folded_strip()
+    self = MeshGraph(vertices, faces)
+    assert len(self) == 14
+    # Every interior edge is shared by two triangles but appears once.
+    assert len(self.indices) == 2 * (13 + 12)
+    assert (np.diff(self.indptr) >= 2).all()
+    assert self.weights.min() == 1
+    assert self.weights.max() == pytest.approx(2**.5)
+
+    distance, points = self.path((0, 0, 0), (0, 3, 3))
+    assert distance == pytest.approx(6)
+    assert points[0].tolist() == [0, 0, 0]
+    assert points[-1].tolist() == [0, 3, 3]
+    assert np.linalg.norm(np.diff(points, axis=0), axis=1).sum() \
+        == pytest.approx(distance)
+    # The path stays on the surface rather than cutting the corner.
+    assert points[:, 1].max() == 3
+    assert points[:, 2].max() == 3
+    assert np.all((points[:, 1] == 3) | (points[:, 2] == 0))
+
+    # Points off the vertices.
+    assert self.distance((0, 0, .1), (0, .5, 0)) \
+        == pytest.approx(.1 + .5, abs=1e-9)
+
+    # Disconnected surfaces.
+    self = MeshGraph(np.r_[vertices, vertices + 10], np.r_[faces, faces + 14])
+    assert self.distance((0, 0, 0), (10, 10, 10)) == np.inf
+    assert self.path((0, 0, 0), (10, 10, 10))[1] is None
+    assert MeshGraph(np.empty((0, 3)), np.empty((0, 3))).distance(
+        (0, 0, 0), (1, 1, 1)) == np.inf
+
+
+def test_against_dijkstra():
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    self = MeshGraph.from_mesh(mesh)
+    generator = np.random.default_rng(0)
+    for _ in range(3):
+        a, b = self.vertices[generator.integers(len(self), size=2)] + .05
+        sources, initial = self._attach(a)
+        targets, offsets = self._attach(b)
+        reference = dijkstra(self, sources, initial)
+        assert self.distance(a, b) \
+            == pytest.approx((reference[targets] + offsets).min())
+        assert self.distance(a, b) >= np.linalg.norm(a - b)
+        assert self.shortest_paths(sources, initial)[0] \
+            == pytest.approx(reference)
+
+
+def dataset_files():
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    vertices = Mesh(model).vertices
+    return {
+        "1L" + "".join(model.suffixes): model,
+        "2L" + "".join(model.suffixes): model,
+        "1L.csv": _csv_io.writes([vertices[0], vertices[100], None],
+                                 names=["a", "b", "c"]),
+        "3L.stl": b"garbage",
+        "3L.csv": _csv_io.writes([], names=[]),
+    }
+
+
+def test_measure_dataset(tmp_path, write_dataset):
+    write_dataset(dataset_files())
+    vertices = Mesh(tomial_tooth_collection_api.model("1L")).vertices
+    pairs = [("a", "b"), ("a", "c"), ("a", "d")]
+    reports = list(_geodesics.measure_dataset(tmp_path, pairs, jobs=1))
+    assert len(reports) == 2
+    assert reports[0]["measurements"]["a to b"] == pytest.approx(
+        MeshGraph.from_mesh(Mesh(reports[0]["model"])).distance(
+            vertices[0], vertices[100]))
+    assert reports[0]["measurements"]["a to c"] is None
+    assert reports[0]["errors"] == [("missing landmark", "d")]
+    assert reports[1]["errors"][0][0] == "unreadable"
+    assert list(reports[1]["measurements"]) == ["a to b", "a to c", "a to d"]
+
+
+def test_cli(tmp_path, capsys, write_dataset):
+    write_dataset(dataset_files())
+    assert _cli.main(["geodesic", str(tmp_path), "--pair", "a", "b",
+                      "-j", "1"]) == 1
+    captured = capsys.readouterr()
+    lines = captured.out.splitlines()
+    assert lines[0] == "Model,a to b"
+    assert lines[1].startswith("1L,")
+    assert lines[2] == "3L,"
+    assert "3L.stl: unreadable" in captured.err
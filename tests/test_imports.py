@@ -0,0 +1,87 @@
+"""Guard against heavy GUI dependencies creeping into the headless APIs."""
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.order(1)
+
+# Modules which must be usable without Qt, VTK or a display.
+HEADLESS = [
+    "tomial_clicky_tooth",
+    "tomial_clicky_tooth._agreement",
+    "tomial_clicky_tooth._batch",
+    "tomial_clicky_tooth._cache",
+    "tomial_clicky_tooth._cleaning",
+    "tomial_clicky_tooth._cli",
+    "tomial_clicky_tooth._colors",
+    "tomial_clicky_tooth._cropping",
+    "tomial_clicky_tooth._csv_io",
+    "tomial_clicky_tooth._dataset",
+    "tomial_clicky_tooth._features",
+    "tomial_clicky_tooth._geodesics",
+    "tomial_clicky_tooth._landmark_templates",
+    "tomial_clicky_tooth._licenses",
+    "tomial_clicky_tooth._measurements",
+    "tomial_clicky_tooth._meshfile",
+    "tomial_clicky_tooth._migration",
+    "tomial_clicky_tooth._profiling",
+    "tomial_clicky_tooth._recompression",
+    "tomial_clicky_tooth._registration",
+    "tomial_clicky_tooth._resources",
+    "tomial_clicky_tooth._scan",
+    "tomial_clicky_tooth._server",
+    "tomial_clicky_tooth._snapping",
+    "tomial_clicky_tooth._snapshots",
+    "tomial_clicky_tooth._timing",
+    "tomial_clicky_tooth._tracing",
+    "tomial_clicky_tooth._validation",
+    "tomial_clicky_tooth._watchdog",
+]
+
+FORBIDDEN = ["PyQt5", "vtk", "vtkmodules", "vtkplotlib", "pyperclip"]
+
+
+def test_headless_imports():
+    """Import each headless module in a clean interpreter and check that no GUI
+    libraries were dragged in with it."""
+    code = "\n".join([
+        "import sys",
+        *(f"import {i}" for i in HEADLESS),
+        "print(' '.join(sys.modules))",
+    ])
+    # Deliberately break any attempt to open a display.
+    env = {**os.environ, "QT_QPA_PLATFORM": "not-a-platform", "DISPLAY": ""}
+    output = subprocess.run([sys.executable, "-c", code], env=env,
+                            stdout=subprocess.PIPE, check=True).stdout
+    loaded = {i.split(".")[0] for i in output.decode().split()}
+    assert not loaded.intersection(FORBIDDEN)
+
+
+def test_lazy_gui():
+    import tomial_clicky_tooth
+    from tomial_clicky_tooth import _ui
+
+    assert tomial_clicky_tooth.UI is _ui.UI
+    assert tomial_clicky_tooth.main is _ui.main
+    with pytest.raises(AttributeError, match="no attribute 'Cake'"):
+        tomial_clicky_tooth.Cake
+
+
+def test_lazy_features():
+    """Feature modules mustn't slow down the UI's startup. They should only be
+    imported once the features using them are."""
+    code = "\n".join([
+        "import sys",
+        "import tomial_clicky_tooth._ui",
+        "print(' '.join(sys.modules))",
+    ])
+    output = subprocess.run([sys.executable, "-c", code],
+                            stdout=subprocess.PIPE, check=True).stdout
+    loaded = set(output.decode().split())
+    assert not loaded.intersection(f"tomial_clicky_tooth.{i}" for i in [
+        "_agreement", "_browser", "_cropping", "_features", "_geodesics",
+        "_migration", "_profiling", "_registration", "_server", "_snapshots"
+    ])
@@ -1,12 +1,15 @@
 import io
 from pathlib import Path
 import re
+import shutil
 
 import pytest
+import strictyaml
 from pangolin import JawType, Palmer
 
 from tomial_clicky_tooth._landmark_templates import LandmarksContext, \
     LandmarksTemplate, LandmarksUndefined, InvalidKey, ParseError
+from tomial_clicky_tooth import _cache
 
 pytestmark = pytest.mark.order(1)
 
@@ -57,3 +60,116 @@ def test_asymmetric():
 
     with pytest.raises(ParseError, match="Value at primary should.*not a str."):
         LandmarksTemplate.from_file(io.StringIO("primary: eggs"))
+
+
+MEASUREMENTS = """
+adult:
+  - '(a)(s)(1-6)'
+measurements:
+  upper:
+    - name: (A) intermolar width
+      offset:
+        - (a)L6
+        - (a)R6
+      axis: right
+    - name: (A) (S) canine angle
+      angle:
+        - (a)(s)1
+        - (a)(s)3
+        - (a)(s)6
+    - name: (a)(s)(4,5) to 6
+      distance:
+        - (a)(s)(4,5)
+        - (a)(s)6
+"""
+
+
+def test_measurements():
+    self = LandmarksTemplate.from_file(io.StringIO(MEASUREMENTS), cache=False)
+    measurements = self.measurements(JawType(arch_type="U"))
+    assert [(i.name, i.kind, i.landmarks, i.axis) for i in measurements] == [
+        ("Upper intermolar width", "offset", ("UL6", "UR6"), "right"),
+        ("Upper left canine angle", "angle", ("UL1", "UL3", "UL6"), None),
+        ("Upper right canine angle", "angle", ("UR1", "UR3", "UR6"), None),
+        ("UL4 to 6", "distance", ("UL4", "UL6"), None),
+        ("UL5 to 6", "distance", ("UL5", "UL6"), None),
+        ("UR4 to 6", "distance", ("UR4", "UR6"), None),
+        ("UR5 to 6", "distance", ("UR5", "UR6"), None),
+    ]
+    assert self.measurements(JawType(arch_type="L")) == []
+    # Templates without any measurements.
+    self = LandmarksTemplate.from_file(io.StringIO("- '(a)(s)(-)'"))
+    assert self.measurements(JawType(arch_type="L")) == []
+
+    # Every bundled measurement refers to real landmarks.
+    self = LandmarksTemplate.from_file(
+        Path(__file__).parent.parent / "tomial_clicky_tooth" / "MHB.yaml")
+    for jaw_type in [JawType(arch_type=i, primary=j)
+                     for i in "UL" for j in (False, True)]:
+        names = self.evaluate(jaw_type)
+        measurements = self.measurements(jaw_type)
+        assert measurements
+        for measurement in measurements:
+            assert set(measurement.landmarks) <= set(names)
+
+    # Sequences of different lengths can't be zipped together.
+    self = LandmarksTemplate.from_file(io.StringIO("""
+measurements:
+  - name: (a)(1,2)
+    distance:
+      - (a)(1-3)
+      - (a)4
+"""))
+    with pytest.raises(ParseError, match="mismatched"):
+        self.measurements(JawType(arch_type="U"))
+
+
+@pytest.mark.parametrize("measurement, error", [
+    ("- cake", "should be a mapping"),
+    ("- name: x", "exactly one of the keys 'distance', 'offset', 'angle'"),
+    ("- name: x\n  distance:\n    - a", "should list 2 landmarks"),
+    ("- name: x\n  offset:\n    - a\n    - b", "an 'axis' of 'right'"),
+    ("- name: x\n  offset:\n    - a\n    - b\n  axis: sideways",
+     "an 'axis' of"),
+    ("- name: x\n  distance:\n    - a\n    - b\n  axis: right",
+     "'axis' .* is not a valid key"),
+])
+def test_invalid_measurements(measurement, error):
+    text = "adult:\n  - a\nmeasurements:\n" + "\n".join(
+        "  " + i for i in measurement.split("\n"))
+    with pytest.raises(ParseError, match=error):
+        LandmarksTemplate.from_file(io.StringIO(text), cache=False)
+    with pytest.raises(ParseError, match=error):
+        LandmarksTemplate.from_file(io.StringIO(text))
+
+
+def test_cache(monkeypatch, tmp_path):
+    """Test that templates are only parsed once unless they change."""
+    monkeypatch.setenv(_cache.CACHE_ENV, str(tmp_path / "cache"))
+    path = tmp_path / "template.yaml"
+    shutil.copy(Path(__file__).with_name("asymmetric.yaml"), path)
+
+    reference = LandmarksTemplate.from_file(path, cache=False)
+    assert not (tmp_path / "cache").exists()
+    self = LandmarksTemplate.from_file(path)
+    assert len(list((tmp_path / "cache" / "templates").iterdir())) == 1
+
+    # Invalid templates must still raise and must not be cached.
+    path.write_text("cake:\n  - 'foo'\n")
+    with pytest.raises(InvalidKey):
+        LandmarksTemplate.from_file(path)
+    path.write_text("primary: eggs")
+    with pytest.raises(ParseError):
+        LandmarksTemplate.from_file(path)
+    assert len(list((tmp_path / "cache" / "templates").iterdir())) == 1
+
+    # An unchanged template should be loaded without touching strictyaml.
+    shutil.copy(Path(__file__).with_name("asymmetric.yaml"), path)
+
+    def _fail(*_):
+        raise AssertionError("Template was re-parsed.")
+
+    monkeypatch.setattr(strictyaml, "load", _fail)
+    self = LandmarksTemplate.from_file(path)
+    assert self.template == reference.template
+    assert self.rules == reference.rules
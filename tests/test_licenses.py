@@ -0,0 +1,38 @@
+import pickle
+
+import pytest
+
+from tomial_clicky_tooth import _licenses
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_cached(monkeypatch):
+    """The inventory should only ever be collected once."""
+    monkeypatch.setattr(_licenses, "_future", None)
+    calls = []
+
+    def _collect():
+        calls.append(None)
+        return {"python": "foo"}
+
+    monkeypatch.setattr(_licenses, "collect", _collect)
+    future = _licenses.prefetch()
+    assert _licenses.prefetch() is future
+    assert _licenses.inventory() == {"python": "foo"}
+    assert _licenses.inventory() == {"python": "foo"}
+    assert len(calls) == 1
+
+
+def test_bundled(monkeypatch, tmp_path):
+    """Frozen applications should use the inventory collected at build time."""
+    monkeypatch.setattr(_licenses, "_future", None)
+    monkeypatch.setattr(_licenses, "BUNDLED", tmp_path / "licenses.pickle")
+    _licenses.BUNDLED.write_bytes(pickle.dumps({"foo": "bar"}))
+    assert _licenses.inventory() == {"foo": "bar"}
+
+
+def test_collect():
+    components = _licenses.collect()
+    assert "python" in components
+    assert len(components) > 1
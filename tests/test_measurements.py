@@ -0,0 +1,159 @@
+import io
+import csv
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from tomial_clicky_tooth import _measurements, _cli, _csv_io
+from tomial_clicky_tooth._landmark_templates import Measurement
+
+pytestmark = pytest.mark.order(1)
+
+TEMPLATE = """
+upper:
+  - '(a)(s)(1,3)'
+measurements:
+  upper:
+    - name: Width
+      offset:
+        - UL3
+        - UR3
+      axis: right
+    - name: Length
+      distance:
+        - UL1
+        - UL3
+    - name: Angle
+      angle:
+        - UL1
+        - UL3
+        - UR3
+"""
+
+
+def test_evaluate():
+    measurements = [
+        Measurement("distance", "distance", ["a", "b"]),
+        Measurement("offset", "offset", ["a", "b"], "forwards"),
+        Measurement("angle", "angle", ["b", "a", "c"]),
+        Measurement("missing", "distance", ["a", "nonexistent"]),
+    ]
+    points = np.array([
+        [[0, 0, 0], [3, 4, 0], [0, 0, 2]],
+        [[1, 1, 1], [1, 1, 1], [np.nan] * 3],
+    ])
+    axes = np.array([np.eye(3), np.eye(3)[::-1]])
+    scores = _measurements.evaluate(measurements, ["a", "b", "c"], points,
+                                    axes)
+    assert scores.shape == (2, 4)
+    assert scores[0, :3] == pytest.approx([5, 4, 90])
+    assert scores[1, :2] == pytest.approx([0, 0])
+    # Unset or missing landmarks and unknown axes.
+    assert np.isnan(scores[1, 2:]).all()
+    assert np.isnan(scores[:, 3]).all()
+    scores = _measurements.evaluate(measurements, ["a", "b", "c"], points)
+    assert np.isnan(scores[:, 1]).all()
+    assert scores[0, 0] == 5
+
+    # Degenerate inputs.
+    assert _measurements.evaluate([], ["a"], points[:, :1]).shape == (2, 0)
+    assert _measurements.evaluate(measurements, [], np.empty((0, 0, 3))) \
+        .shape == (0, 4)
+
+
+NAMES = ["UL3", "UL1", "UR1", "UR3"]
+POINTS = [(-2, 0, 0), (-1, 1, 0), (1, 1, 0), (2, 0, 0)]
+DATASET = {
+    "template.yaml": TEMPLATE,
+    **{f"{name}.stl": name for name in ["1U", "2U", "3U", "1L", "cake"]},
+    "1U.csv": _csv_io.writes(POINTS, names=NAMES),
+    "2U.csv": _csv_io.writes(POINTS[:3] + [None], names=NAMES),
+    "1L.csv": _csv_io.writes(POINTS, names=NAMES),
+}
+
+
+@pytest.fixture
+def axes(monkeypatch):
+    """Make each model's odometry axes the identity matrix."""
+    def read_model(path):
+        return None, SimpleNamespace(axes=np.eye(3))
+
+    monkeypatch.setattr(_measurements._dataset, "read_model", read_model)
+
+
+def test_measure_dataset(tmp_path, axes, monkeypatch, write_dataset):
+    write_dataset(DATASET)
+    reports = _measurements.measure_dataset(tmp_path,
+                                            tmp_path / "template.yaml",
+                                            jobs=1)
+    reports = {Path(i["model"]).name: i for i in reports}
+    assert reports["1U.stl"]["measurements"] == pytest.approx({
+        "Width": 4,
+        "Length": 2 ** .5,
+        "Angle": 45,
+    })
+    assert reports["1U.stl"]["errors"] == []
+    assert reports["2U.stl"]["measurements"] == {
+        "Width": None,
+        "Length": pytest.approx(2 ** .5),
+        "Angle": None,
+    }
+    assert reports["3U.stl"]["errors"][0][0] == "missing csv"
+    assert reports["1L.stl"]["measurements"] == {}
+    assert reports["1L.stl"]["errors"] == []
+    assert reports["cake.stl"]["errors"][0][0] == "unknown arch type"
+
+    # Only models whose CSVs have changed are re-evaluated.
+    evaluated = []
+
+    def evaluate(measurements, names, points, axes=None):
+        evaluated.append(len(points))
+        return original(measurements, names, points, axes)
+
+    original = _measurements.evaluate
+    monkeypatch.setattr(_measurements, "evaluate", evaluate)
+    assert _measurements.measure_dataset(
+        tmp_path, tmp_path / "template.yaml", jobs=1) \
+        == list(reports.values())
+    assert evaluated == []
+
+    names, points = _csv_io.read_named(tmp_path / "1U.csv")
+    points[0] = (-3, 0, 0)
+    (tmp_path / "1U.csv").write_text(_csv_io.writes(points, names=names))
+    reports = _measurements.measure_dataset(tmp_path,
+                                            tmp_path / "template.yaml",
+                                            jobs=1)
+    assert evaluated == [1]
+    assert reports[1]["measurements"]["Width"] == 5
+
+
+def test_table():
+    reports = [
+        {"model": "a/1U.stl", "measurements": {"x": 1.5, "y": None}},
+        {"model": "a/1L.stl.gz", "measurements": {"z": 1 / 3}},
+    ]  # yapf: disable
+    rows = list(csv.reader(io.StringIO(_measurements.table(reports))))
+    assert rows == [["Model", "x", "y", "z"], ["1U", "1.5", "", ""],
+                    ["1L", "", "", "0.333333"]]
+
+
+def test_cli(tmp_path, axes, capsys, write_dataset):
+    write_dataset(DATASET)
+    args = ["measure", str(tmp_path), "--template",
+            str(tmp_path / "template.yaml"), "-j", "1"]
+    assert _cli.main(args) == 1
+    captured = capsys.readouterr()
+    assert captured.out.startswith("Model,Width,Length,Angle\n")
+    assert "3U.stl: missing csv: 3U.csv does not exist." in captured.err
+
+    assert _cli.main(args + ["-o", str(tmp_path / "scores.csv")]) == 1
+    assert capsys.readouterr().out == ""
+    assert (tmp_path / "scores.csv").read_text() == captured.out
+
+    assert _cli.main(args + ["--json"]) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert json.loads(lines[1])["model"].endswith("1U.stl")
+    assert json.loads(lines[1])["measurements"]["Width"] == 4
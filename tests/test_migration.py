@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from tomial_clicky_tooth import _migration, _cli, _csv_io
+
+pytestmark = pytest.mark.order(1)
+
+TEMPLATE = """
+upper:
+  - '(a)(s)(1,3)'
+lower:
+  - '(a)(s)(1,2)'
+"""
+
+
+def test_remap():
+    names = ["b", "a", "c", "a"]
+    points = [(1, 1, 1), (2, 2, 2), (3, 3, 3), (4, 4, 4)]
+    assert _migration.remap(names, points, ["a", "b", "d"]) \
+        == ([(2, 2, 2), (1, 1, 1), None], ["c", "a (row 4)"])
+    assert _migration.remap(names, [None] * 4, ["a"]) == ([None], [])
+    # Only placed repeats are lost.
+    assert _migration.remap(["a", "a", "b"], [None, (2, 2, 2), None],
+                            ["a", "b"]) == ([None, None], ["a (row 2)"])
+    assert _migration.remap(["a", "a", "b"], [(1, 1, 1), None, None],
+                            ["a", "b"]) == ([(1, 1, 1), None], [])
+
+    # Unnamed landmarks are kept in order.
+    assert _migration.remap(["", ""], points[:2], ["x", "y", "z"]) \
+        == ([(1, 1, 1), (2, 2, 2), None], [])
+    assert _migration.remap(["", "", ""], points[:2] + [None], ["x"]) \
+        == ([(1, 1, 1)], ["#2"])
+
+
+DATASET = {
+    "template.yaml": TEMPLATE,
+    **{f"{name}.stl": b"" for name in ["1U", "2U", "3U", "1L", "2L", "cake"]},
+    # Up to date.
+    "1U.csv": _csv_io.writes([(1, 0, 0), None, (3, 0, 0), (4, 0, 0)],
+                             names=["UL3", "UL1", "UR1", "UR3"]),
+    # Reordered, with UR3 missing and an obsolete, unset UL2.
+    "2U.csv": _csv_io.writes([(1, 0, 0), (2, 0, 0), (3, 0, 0), None],
+                             names=["UR1", "UL1", "UL3", "UL2"]),
+    # Would lose a placed landmark.
+    "1L.csv": _csv_io.writes([(1, 0, 0), (2, 0, 0)], names=["LL1", "LL3"]),
+    "2L.csv": b"\xff\xfe",
+    "cake.csv": "",
+}
+
+
+def test_migrate_dataset(tmp_path, write_dataset):
+    write_dataset(DATASET)
+    template = tmp_path / "template.yaml"
+    before = {i.name: i.read_bytes() for i in tmp_path.glob("*.csv")}
+    reports = list(_migration.migrate_dataset(tmp_path, template, jobs=1))
+    assert [i["model"] for i in reports] \
+        == [str(tmp_path / f"{i}.stl") for i in ["1L", "1U", "2L", "2U",
+                                                 "cake"]]
+    reports = {i["model"][len(str(tmp_path)) + 1:-4]: i for i in reports}
+    # Nothing is written by default.
+    assert {i.name: i.read_bytes() for i in tmp_path.glob("*.csv")} == before
+
+    assert not reports["1U"]["changed"]
+    assert reports["1U"]["diff"] == ""
+    assert reports["1U"]["errors"] == []
+
+    report = reports["2U"]
+    assert report["changed"] and not report["written"]
+    assert report["added"] == ["UR3"]
+    assert report["removed"] == ["UL2"]
+    assert report["dropped"] == []
+    assert report["errors"] == []
+    assert report["diff"].startswith("--- a/2U.csv\n+++ b/2U.csv\n")
+    assert "-UL2,,,\n" in report["diff"]
+    assert "+UR3,,,\n" in report["diff"]
+
+    assert reports["1L"]["dropped"] == ["LL3"]
+    assert reports["1L"]["errors"] == [("would drop", "LL3")]
+    assert reports["2L"]["errors"][0][0] == "unreadable csv"
+    assert reports["cake"]["errors"][0][0] == "unknown arch type"
+
+    text = _migration.format_report(reports["2U"], diff=True)
+    assert text.startswith("2U: 1 added, 1 removed\n--- a/2U.csv")
+    assert _migration.format_report(reports["1U"]) == "1U: up to date"
+
+    reports = list(_migration.migrate_dataset(tmp_path, template, write=True,
+                                              jobs=1))
+    assert [i["written"] for i in reports] == [False, False, False, True, False]
+    assert _csv_io.read_named(tmp_path / "2U.csv") == (
+        ["UL3", "UL1", "UR1", "UR3"], [(3, 0, 0), (2, 0, 0), (1, 0, 0), None])
+    assert (tmp_path / "1L.csv").read_bytes() == before["1L.csv"]
+
+    # Dropping placed landmarks must be asked for.
+    report = next(_migration.migrate_dataset(tmp_path, template, write=True,
+                                             drop=True, jobs=1))
+    assert report["written"] and report["errors"] == []
+    assert _csv_io.read_named(tmp_path / "1L.csv") == (
+        ["LL2", "LL1", "LR1", "LR2"], [None, (1, 0, 0), None, None])
+
+    # Migrating again changes nothing.
+    reports = _migration.migrate_dataset(tmp_path, template, jobs=1)
+    assert [i["changed"] for i in reports] == [False] * 5
+
+
+def test_cli(tmp_path, capsys, write_dataset):
+    write_dataset(DATASET)
+    args = ["migrate", str(tmp_path), "--template",
+            str(tmp_path / "template.yaml"), "-j", "1"]
+    assert _cli.main(args + ["--diff", "-q"]) == 1
+    out = capsys.readouterr().out
+    assert "1U:" not in out
+    assert "2U: 1 added, 1 removed\n--- a/2U.csv" in out
+    assert "2/5 CSVs need migrating.\n0 CSVs rewritten." in out
+
+    assert _cli.main(args + ["--write", "--json"]) == 1
+    lines = capsys.readouterr().out.splitlines()
+    assert json.loads(lines[-1])["summary"]["written"] == 1
+    assert json.loads(lines[3])["written"]
+
+
+def test_duplicate_names(tmp_path):
+    (tmp_path / "template.yaml").write_text(TEMPLATE)
+    (tmp_path / "1L.stl").write_bytes(b"")
+    csv = tmp_path / "1L.csv"
+    csv.write_text(
+        _csv_io.writes([(1, 0, 0), (2, 0, 0)], names=["LL1", "LL1"]))
+    template = tmp_path / "template.yaml"
+    (report, ) = _migration.migrate_dataset(tmp_path, template, write=True,
+                                            jobs=1)
+    assert report["dropped"] == ["LL1 (row 2)"]
+    assert report["errors"] == [("duplicate names", "LL1"),
+                                ("would drop", "LL1 (row 2)")]
+    assert not report["written"]
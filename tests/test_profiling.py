@@ -0,0 +1,78 @@
+import json
+import time
+import pstats
+import threading
+
+import pytest
+
+from tomial_clicky_tooth import _profiling
+
+pytestmark = pytest.mark.order(1)
+
+
+def busy_leaf(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_caller(seconds):
+    busy_leaf(seconds)
+
+
+def recursive(n, seconds):
+    if n:
+        return recursive(n - 1, seconds)
+    busy_leaf(seconds)
+
+
+def test_profile(tmp_path):
+    profiler = _profiling.start(interval=.001)
+    assert _profiling.start() is profiler
+    assert profiler.running
+
+    worker = threading.Thread(target=busy_caller, args=(.2,),
+                              name="some worker")
+    worker.start()
+    recursive(3, .2)
+    worker.join()
+
+    assert _profiling.stop() is profiler
+    assert not profiler.running
+    assert _profiling.profiler is None
+    assert _profiling.stop() is None
+
+    # speedscope
+    profiler.save(tmp_path / "profile.json")
+    profile = json.loads((tmp_path / "profile.json").read_text())
+    frames = [i["name"] for i in profile["shared"]["frames"]]
+    threads = {i["name"]: i for i in profile["profiles"]}
+    assert "sampling profiler" not in threads
+    worker = threads["some worker"]
+    assert worker["type"] == "sampled"
+    assert len(worker["samples"]) == len(worker["weights"])
+    # Consecutive identical stacks should be merged.
+    assert len(worker["samples"]) < 10
+    stack = [frames[i] for i in worker["samples"][-1]]
+    assert stack[-2:] == ["busy_caller", "busy_leaf"]
+
+    main = threads["MainThread"]
+    assert .1 < main["endValue"] < profiler.duration + .01
+    assert any(
+        [frames[i] for i in stack[-5:]] == ["recursive"] * 4 + ["busy_leaf"]
+        for stack in main["samples"])
+
+    # pstats
+    profiler.save(tmp_path / "profile.prof")
+    stats = pstats.Stats(str(tmp_path / "profile.prof")).stats
+    by_name = {key[2]: value for (key, value) in stats.items()}
+    n, _, own, cumulative, callers = by_name["busy_leaf"]
+    assert own == pytest.approx(cumulative)
+    assert .3 < own < profiler.duration * 2
+    assert {i[2] for i in callers} == {"busy_caller", "recursive"}
+
+    # Recursion shouldn't multiply the cumulative time.
+    _, _, own, cumulative, callers = by_name["recursive"]
+    assert own < .05
+    assert .1 < cumulative < profiler.duration + .01
+    assert {i[2] for i in callers} >= {"recursive", "test_profile"}
@@ -0,0 +1,114 @@
+import gzip
+import lzma
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from motmot import Mesh
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _meshfile, _recompression, _dataset, _cli
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_round_trip(tmp_path):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    mesh = Mesh(model)
+    for suffix in _meshfile.SUFFIXES:
+        data = _meshfile.encode(mesh, suffix)
+        copy = _meshfile.decode(data, suffix)
+        assert np.array_equal(copy.vectors, mesh.vectors)
+        assert copy.faces.dtype == np.intp
+        path = tmp_path / ("1L" + suffix)
+        path.write_bytes(data)
+        assert np.array_equal(_dataset.read_mesh(path).vectors, mesh.vectors)
+    # Deterministic.
+    assert _meshfile.encode(mesh) == _meshfile.encode(mesh)
+    assert len(_meshfile.encode(mesh, ".mesh.gz")) \
+        < len(_meshfile.encode(mesh, ".mesh"))
+
+    # STLs in any compression.
+    raw = gzip.decompress(model.read_bytes())
+    for (suffix, data) in [(".stl", raw), (".stl.xz", lzma.compress(raw))]:
+        assert np.array_equal(
+            _meshfile.decode(data, suffix).vectors, mesh.vectors)
+
+    empty = Mesh(np.empty((0, 3), np.float32), np.empty((0, 3), np.intp))
+    assert len(_meshfile.decode(_meshfile.encode(empty, ".mesh"), ".mesh")) \
+        == 0
+
+    data = _meshfile.encode(mesh, ".mesh")
+    for corrupt in [b"", b"cake" * 10, data[:-1],
+                    data[:-4] + b"\xff" * 4]:  # yapf: disable
+        with pytest.raises(ValueError):
+            _meshfile.decode(corrupt, ".mesh")
+    with pytest.raises(ValueError):
+        _meshfile.encode(mesh, ".stl")
+
+
+def dataset_files():
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    raw = gzip.decompress(model.read_bytes())
+    return {
+        "1L.stl.xz": lzma.compress(raw),
+        "2L.stl.gz": model,
+        "3L.stl": b"garbage",
+        "1L.csv": "",
+    }
+
+
+def test_recompress_dataset(tmp_path, write_dataset):
+    write_dataset(dataset_files())
+    before = sorted(tmp_path.iterdir())
+    reports = list(_recompression.recompress_dataset(tmp_path, jobs=1))
+    assert sorted(tmp_path.iterdir()) == before
+    assert len(reports) == 3
+
+    report = reports[0]
+    assert report["before"]["format"] == ".stl.xz"
+    assert report["before"]["size"] == (tmp_path / "1L.stl.xz").stat().st_size
+    assert len(report["candidates"]) == len(_recompression.CANDIDATES)
+    assert report["after"]["decode"] < report["before"]["decode"]
+    assert report["after"]["size"] <= report["before"]["size"]
+    assert report["output"] == str(tmp_path / "1L.mesh.gz") \
+        or report["output"] == str(tmp_path / "1L.mesh")
+    assert not report["written"]
+    assert reports[2]["errors"][0][0] == "unreadable"
+    assert "3L: unreadable" in _recompression.format_report(reports[2])
+    assert "x faster" in _recompression.format_report(report)
+
+    reports = list(_recompression.recompress_dataset(tmp_path, write=True,
+                                                     jobs=1))
+    assert reports[0]["written"]
+    assert not (tmp_path / "1L.stl.xz").exists()
+    converted = Path(reports[0]["output"])
+    assert _dataset.model_paths(tmp_path)[0] == converted
+    assert _dataset.csv_path(converted) == tmp_path / "1L.csv"
+    # Loading it is transparent.
+    (loaded, _) = _dataset.read_model(converted)
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    assert np.array_equal(loaded.vectors, mesh.vectors)
+
+    # Converting again has nothing left to gain.
+    report = next(_recompression.recompress_dataset(tmp_path, write=True,
+                                                    jobs=1))
+    assert report["model"] == str(converted)
+    assert report["output"] is None
+    assert "already fastest" in _recompression.format_report(report)
+
+
+def test_cli(tmp_path, capsys, write_dataset):
+    write_dataset(dataset_files())
+    args = ["recompress", str(tmp_path), "-j", "1", "--repeats", "1"]
+    assert _cli.main(args) == 1
+    out = capsys.readouterr().out
+    assert out.startswith("1L: .stl.xz ")
+    assert "0 models converted." in out
+
+    (tmp_path / "3L.stl").unlink()
+    assert _cli.main(args + ["--json", "--write"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert json.loads(lines[0])["written"]
+    assert json.loads(lines[-1])["summary"]["models"] == 2
@@ -0,0 +1,165 @@
+import json
+import shutil
+from types import SimpleNamespace
+from pathlib import Path
+
+import pytest
+import numpy as np
+from motmot import Mesh
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _registration, _csv_io, _cli
+
+pytestmark = pytest.mark.order(1)
+
+
+def rotation_matrix(degrees, axis):
+    a = np.radians(degrees)
+    out = np.eye(3)
+    i, j = [k for k in range(3) if k != axis]
+    out[[i, i, j, j], [i, j, i, j]] = [np.cos(a), -np.sin(a), np.sin(a),
+                                       np.cos(a)]
+    return out
+
+
+MATRIX = _registration._homogeneous(
+    rotation_matrix(8, 2) @ rotation_matrix(3, 0), [1, -2, .5])
+
+
+def test_fits():
+    random = np.random.default_rng(0)
+    points = random.normal(size=(100, 3))
+    moved = _registration.transform(MATRIX, points)
+    assert _registration.rigid_fit(points, moved) == pytest.approx(MATRIX)
+    assert _registration.affine_fit(points, moved) == pytest.approx(MATRIX)
+
+    stretched = MATRIX.copy()
+    stretched[:3, :3] *= [1, 1.1, .9]
+    moved = _registration.transform(stretched, points)
+    assert _registration.affine_fit(points, moved) == pytest.approx(stretched)
+    rigid = _registration.rigid_fit(points, moved)
+    assert np.linalg.det(rigid[:3, :3]) == pytest.approx(1)
+
+
+def test_initial_transform():
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    target = Mesh(_registration.transform(MATRIX, mesh.vectors))
+    initial = _registration.initial_transform(mesh, target)
+    assert initial[:3, :3] == pytest.approx(np.eye(3))
+    assert _registration.transform(initial, mesh.vertices.mean(axis=0)) == \
+        pytest.approx(target.vertices.mean(axis=0), abs=1e-4)
+
+    # Given both models' orientations, the rotation between them is known.
+    axes = rotation_matrix(40, 1)
+    initial = _registration.initial_transform(
+        mesh, target, SimpleNamespace(axes=axes),
+        SimpleNamespace(axes=axes @ MATRIX[:3, :3].T))
+    assert initial[:3, :3] == pytest.approx(MATRIX[:3, :3])
+    assert initial[:3, 3] == pytest.approx(MATRIX[:3, 3], abs=1e-4)
+
+
+@pytest.mark.parametrize("affine", [False, True])
+def test_icp(affine):
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    target = Mesh(_registration.transform(MATRIX, mesh.vectors))
+    points = _registration.sample_vertices(mesh, 500)
+    assert len(points) == 500
+    assert _registration.sample_vertices(mesh, 500) == pytest.approx(points)
+
+    initial = _registration.initial_transform(mesh, target)
+    _, rms = _registration.icp(points, target, initial, iterations=0)
+    assert rms > .1
+    matrix, rms = _registration.icp(points, target, initial, affine)
+    assert rms < 1e-3
+    assert _registration.transform(matrix, points) == pytest.approx(
+        _registration.transform(MATRIX, points), abs=1e-3)
+
+
+def test_match_names():
+    points = np.arange(6.).reshape((2, 3))
+    out = _registration.match_names(["a", "b"], points, ["b", "c", "a"])
+    assert out[0] == pytest.approx(points[1])
+    assert np.isnan(out[1]).all()
+    assert out[2] == pytest.approx(points[0])
+    # Unrelated names of the same length are assumed to be in the same order.
+    assert _registration.match_names(["", ""], points, ["a", "b"]) == \
+        pytest.approx(points)
+    assert np.isnan(_registration.match_names(["x"], points[:1], ["a", "b"])) \
+        .all()
+
+
+def reference_dataset(tmp_path):
+    """Write a reference model with landmarks and a dataset containing a moved
+    copy of it."""
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    mesh = Mesh(model)
+    points = list(mesh.centers[[0, 3000, 6000, 9000]].astype(float)) + [None]
+    names = ["a", "b", "c", "d", "e"]
+    (tmp_path / "reference").mkdir()
+    shutil.copy(model, tmp_path / "reference" / "1L.stl.gz")
+    (tmp_path / "reference" / "1L.csv").write_text(
+        _csv_io.writes(points, names=names))
+
+    dataset = tmp_path / "dataset"
+    dataset.mkdir()
+    Mesh(_registration.transform(MATRIX, mesh.vectors).astype(
+        np.float32)).save(dataset / "2L.stl")
+    return tmp_path / "reference" / "1L.stl.gz", dataset, \
+        _registration.transform(MATRIX, np.array(points[:4]))
+
+
+def test_propose_dataset(tmp_path):
+    reference, dataset, expected = reference_dataset(tmp_path)
+    shutil.copy(dataset / "2L.stl", dataset / "3L.stl")
+    (dataset / "3L.csv").write_text("")
+    shutil.copy(dataset / "2L.stl", dataset / "4U.stl")
+    (dataset / "5L.stl").write_bytes(b"not an STL")
+
+    reports = list(_registration.propose_dataset(dataset, [reference], jobs=2))
+    assert [i["skipped"] for i in reports] == \
+           [None, "annotated", None, None]
+    assert reports[0]["written"]
+    assert reports[0]["placed"] == 4
+    assert reports[0]["rms"] < 1e-3
+    assert reports[2]["errors"][0][0] == "no reference"
+    assert reports[3]["errors"][0] == \
+           ("unreadable", "ValueError: The model has no triangles.")
+
+    names, points = _registration.read_proposals(dataset / "2L.stl")
+    assert names == ["a", "b", "c", "d", "e"]
+    assert points[:4] == pytest.approx(expected, abs=1e-3)
+    assert np.isnan(points[4]).all()
+    assert _registration.read_proposals(dataset / "3L.stl") is None
+
+    # Existing proposals are kept unless asked to overwrite them.
+    report = _registration.propose(dataset / "2L.stl",
+                                   [_registration.Reference(reference)])
+    assert report["skipped"] == "exists"
+    report = _registration.propose(reference,
+                                   [_registration.Reference(reference)])
+    assert report["skipped"] == "reference"
+
+
+def test_cli(tmp_path, capsys):
+    reference, dataset, _ = reference_dataset(tmp_path)
+
+    args = ["propose", str(dataset), "--reference", str(reference), "-j", "1"]
+    assert _cli.main(args) == 0
+    out = capsys.readouterr().out
+    assert "2L: 4 landmarks from 1L, RMS" in out
+    assert "Proposed landmarks for 1/1 models (0 skipped)." in out
+
+    assert _cli.main(args + ["--quiet"]) == 0
+    assert capsys.readouterr().out.startswith("Proposed landmarks for 0/1")
+
+    assert _cli.main(args + ["--json", "--overwrite", "--affine"]) == 0
+    report, summary = map(json.loads, capsys.readouterr().out.splitlines())
+    assert report["written"]
+    assert summary["summary"]["written"] == 1
+
+    (dataset / "3U.stl").write_bytes(b"")
+    assert _cli.main(args) == 1
+    out = capsys.readouterr().out
+    assert "2L: skipped (exists)" in out
+    assert "3U: failed\n    no reference" in out
+    assert "1 errors." in out
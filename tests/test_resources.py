@@ -0,0 +1,80 @@
+import gc
+import shutil
+from pathlib import Path
+
+import pytest
+import numpy as np
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _resources
+
+pytestmark = pytest.mark.order(1)
+
+
+class Blob:
+    def __init__(self):
+        self.a = np.empty(100, np.uint8)
+        self.b = np.empty(10, np.float64)
+        self.c = "not an array"
+
+
+def test_track():
+    blobs = [_resources.track("blobs", Blob()) for i in range(3)]
+    assert len(_resources.live("blobs")) == 3
+    assert _resources.snapshot()["blobs"] == 3
+    del blobs[0]
+    gc.collect()
+    assert len(_resources.live("blobs")) == 2
+
+    assert _resources.nbytes(blobs[0]) == 180
+    assert _resources.snapshot()["rss bytes"] > 1 << 20
+
+
+def test_format_bytes():
+    assert _resources.format_bytes(None) == "?"
+    assert _resources.format_bytes(100) == "100B"
+    assert _resources.format_bytes(2000) == "2.0kB"
+    assert _resources.format_bytes(3 << 20) == "3.0MB"
+    assert _resources.format_bytes(5 << 30) == "5.0GB"
+
+
+def test_soak(tmp_path):
+    """Switch between models many times and check that nothing accumulates."""
+    from pangolin import Palmer
+    from tomial_clicky_tooth._qapp import app
+    from tomial_clicky_tooth._ui import UI
+
+    for name in ["1L", "1U", "2L", "2U"]:
+        shutil.copy(tomial_tooth_collection_api.model(name), tmp_path)
+    self = UI(Palmer.range(), sorted(tmp_path.iterdir())[0])
+    self.show()
+    random = np.random.default_rng(0)
+
+    def cycle(n):
+        for _ in range(n):
+            # Add some markers, save them so that they're reloaded the next
+            # time round, then move on.
+            points = random.uniform(-20, 20, (len(self.table.names), 3))
+            points[::3] = np.nan
+            self.points = points
+            self._log_state()
+            self.table.save()
+            self.switch_model(">")
+            app.processEvents()
+        gc.collect()
+        return self.resources()
+
+    # Go round once so that every model has landmarks and any one-off
+    # allocations (e.g. OpenGL buffers) are out of the way.
+    before = cycle(4)
+    after = cycle(24)
+
+    for (key, value) in before.items():
+        if key != "rss bytes":
+            assert after[key] == value, key
+    assert after["meshes"] == 1
+    assert after["mesh plots"] == 1
+    assert after["actors"] == after["markers"] + 1
+    assert after["rss bytes"] - before["rss bytes"] < 30 << 20
+
+    self.close()
@@ -0,0 +1,114 @@
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from motmot import Mesh
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _scan, _meshfile, _cli
+
+pytestmark = pytest.mark.order(1)
+
+
+def rotation(angle):
+    (c, s) = (np.cos(angle), np.sin(angle))
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+
+
+def test_fingerprint():
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    reference = _scan.fingerprint(mesh)
+    assert reference[4:].sum() == pytest.approx(1)
+
+    # Invariant to pose and triangle order.
+    moved = Mesh(mesh.vectors[::-1] @ rotation(1).T + 30)
+    assert _scan.difference(_scan.fingerprint(moved), reference) < 1e-6
+    # Barely changed by noise.
+    generator = np.random.default_rng(0)
+    noisy = Mesh(mesh.vertices + generator.normal(scale=.01,
+                                                  size=mesh.vertices.shape),
+                 mesh.faces)
+    assert _scan.difference(_scan.fingerprint(noisy), reference) < .02
+    # But not by scaling.
+    scaled = Mesh(mesh.vectors * 1.1)
+    assert _scan.difference(_scan.fingerprint(scaled), reference) \
+        == pytest.approx(1 - 1 / 1.1**2)
+
+    # Broadcasting.
+    assert _scan.difference(reference, [reference] * 3).shape == (3,)
+
+
+def dataset_files():
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    mesh = Mesh(model)
+    generator = np.random.default_rng(0)
+    noisy = Mesh(mesh.vertices + generator.normal(scale=.01,
+                                                  size=mesh.vertices.shape),
+                 mesh.faces)
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [2, 0, 0]],
+                        np.float32)
+    return {
+        "1L.stl.gz": model,
+        "2L.stl.gz": model,
+        "3L.mesh.gz": mesh,
+        "4L.mesh": noisy,
+        "5L.mesh": Mesh(mesh.vertices * 1.1, mesh.faces),
+        "6L.mesh.gz": b"garbage",
+        "7L.mesh": Mesh(vertices, np.array([[0, 1, 2], [0, 1, 3]])),
+        "8L.mesh": Mesh(vertices[:0], np.empty((0, 3), int)),
+    }
+
+
+def test_scan_dataset(tmp_path, write_dataset):
+    write_dataset(dataset_files())
+    report = _scan.scan_dataset(tmp_path, jobs=1)
+    assert report["scanned"] == 8
+    models = {Path(i["model"]).name[:2]: i for i in report["models"]}
+    assert models["1L"]["hash"] == models["2L"]["hash"]
+    assert models["1L"]["hash"] != models["3L"]["hash"]
+    assert models["1L"]["geometry"] == models["3L"]["geometry"]
+    assert models["1L"]["triangles"] == len(Mesh(tmp_path / "1L.stl.gz"))
+    assert models["1L"]["errors"] == []
+
+    assert models["6L"]["errors"][0][0] == "unreadable"
+    assert models["6L"]["fingerprint"] is None
+    assert models["7L"]["errors"] == [("degenerate", "1 of 2 triangles have "
+                                       "zero area.")]
+    assert models["8L"]["errors"] == [("empty",
+                                       "The model has no triangles.")]
+
+    groups = [(i["kind"], [Path(j).name[:2] for j in i["models"]])
+              for i in report["duplicates"]]  # yapf: disable
+    assert groups == [("identical", ["1L", "2L"]),
+                      ("same geometry", ["1L", "2L", "3L"]),
+                      ("similar", ["1L", "4L"])]
+
+    text = _scan.format_report(report)
+    assert "6L: unreadable: " in text
+    assert "identical: 1L.stl.gz, 2L.stl.gz\n" in text
+    assert "similar: 1L.stl.gz, 4L.mesh (" in text
+    assert text.endswith("8 models, 3 with problems, 3 duplicate groups "
+                         "(8 read, the rest cached).")
+
+    # Only changed files are re-read.
+    (tmp_path / "2L.stl.gz").write_bytes(
+        _meshfile.encode(_meshfile.read(tmp_path / "5L.mesh"), ".mesh.gz"))
+    os.rename(tmp_path / "2L.stl.gz", tmp_path / "2L.mesh.gz")
+    again = _scan.scan_dataset(tmp_path, jobs=1)
+    assert again["scanned"] == 1
+    assert again["models"][0] == report["models"][0]
+    assert [i["kind"] for i in again["duplicates"]] \
+        == ["same geometry", "same geometry", "similar"]
+
+
+def test_cli(tmp_path, capsys, write_dataset):
+    write_dataset(dataset_files())
+    assert _cli.main(["scan", str(tmp_path), "-j", "1", "--json"]) == 1
+    assert len(json.loads(capsys.readouterr().out)["models"]) == 8
+    for name in ["2L.stl.gz", "3L.mesh.gz", "4L.mesh", "6L.mesh.gz", "7L.mesh",
+                 "8L.mesh"]:
+        (tmp_path / name).unlink()
+    assert _cli.main(["scan", str(tmp_path), "-j", "1"]) == 0
+    assert capsys.readouterr().out.startswith("2 models, 0 with problems")
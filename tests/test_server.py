@@ -0,0 +1,169 @@
+import sys
+import sqlite3
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tomial_clicky_tooth import _server, _csv_io
+
+pytestmark = pytest.mark.order(1)
+
+
+@pytest.fixture
+def server(tmp_path):
+    self = _server.serve(tmp_path, host="localhost", port=0)
+    thread = threading.Thread(target=self.serve_forever, daemon=True)
+    thread.start()
+    yield self
+    self.shutdown()
+    self.server_close()
+
+
+def test_leases(tmp_path):
+    self = _server.Store(tmp_path / "db.sqlite")
+    assert self.lease("1L", "alice", 10) > 0
+    # Renewing your own lease is fine.
+    self.lease("1L", "alice", 10)
+    with pytest.raises(_server.LeaseError, match="being annotated by alice"):
+        self.lease("1L", "bob")
+    assert self.landmarks("1L")["holder"] == "alice"
+    # Other models are unaffected.
+    self.lease("2L", "bob")
+
+    # Releasing someone else's lease does nothing.
+    self.release("1L", "bob")
+    with pytest.raises(_server.LeaseError):
+        self.lease("1L", "bob")
+    self.release("1L", "alice")
+    self.lease("1L", "bob")
+
+    # Expired leases are up for grabs.
+    self.lease("3L", "alice", -1)
+    assert self.landmarks("3L")["holder"] is None
+    self.lease("3L", "bob")
+
+
+def test_update(tmp_path):
+    self = _server.Store(tmp_path / "db.sqlite", dataset=tmp_path)
+    assert self.landmarks("1L") == {
+        "names": [],
+        "points": [],
+        "revision": 0,
+        "holder": None,
+        "expires": None,
+    }
+    with pytest.raises(_server.LeaseError, match="has not been leased"):
+        self.update("1L", "alice", ["a"], [(1, 2, 3)])
+
+    self.lease("1L", "alice")
+    assert self.update("1L", "alice", ["b", "a"], [(1, 2, 3), None]) == 1
+    # Only the landmarks given are touched and names keep their order.
+    assert self.update("1L", "alice", ["a"], [(4, 5, 6)], revision=1) == 2
+    landmarks = self.landmarks("1L")
+    assert landmarks["names"] == ["b", "a"]
+    assert landmarks["points"] == [[1, 2, 3], [4, 5, 6]]
+    assert landmarks["revision"] == 2
+    assert _csv_io.read_named(tmp_path / "1L.csv") \
+        == (["b", "a"], [(1, 2, 3), (4, 5, 6)])
+
+    # Changes based on an old revision are rejected outright.
+    with pytest.raises(_server.ConflictError, match="revision 2"):
+        self.update("1L", "alice", ["a", "c"], [None, (0, 0, 0)], revision=1)
+    with pytest.raises(_server.LeaseError):
+        self.update("1L", "bob", ["a"], [None])
+    with pytest.raises(ValueError):
+        self.update("1L", "alice", ["a"], [(1, 2)])
+    for model in ["../1L", "", ".hidden", "a/b"]:
+        with pytest.raises(ValueError, match="Invalid model name"):
+            self.lease(model, "alice")
+    assert self.landmarks("1L")["points"] == [[1, 2, 3], [4, 5, 6]]
+
+    # Reopening the database keeps everything.
+    assert _server.Store(tmp_path / "db.sqlite").landmarks("1L") \
+        == self.landmarks("1L")
+    connection = sqlite3.connect(tmp_path / "db.sqlite")
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_client(server):
+    alice = _server.Client(server.url, "alice")
+    bob = _server.Client(server.url + "/", "bob")
+    assert alice.lease("1L upper")
+    with pytest.raises(_server.LeaseError) as info:
+        bob.lease("1L upper")
+    assert info.value.holder == "alice"
+
+    assert alice.update("1L upper", ["a"], [(1., 2., 3.)], 0) == 1
+    landmarks = bob.landmarks("1L upper")
+    assert landmarks["points"] == [[1, 2, 3]]
+    assert landmarks["holder"] == "alice"
+    with pytest.raises(_server.ConflictError) as info:
+        alice.update("1L upper", ["a"], [None], 0)
+    assert info.value.revision == 1
+    with pytest.raises(_server.LeaseError):
+        bob.update("1L upper", ["a"], [None])
+
+    alice.release("1L upper")
+    bob.lease("1L upper")
+
+    # Garbage gets a 400 rather than killing the server.
+    with pytest.raises(OSError, match="400"):
+        bob._request("2L", "landmarks", {})
+    with pytest.raises(OSError, match="400"):
+        bob.lease("..")
+    with pytest.raises(OSError, match="404"):
+        bob._request("2L", "nonsense", {})
+    assert _server.Client(server.url).owner == _server.default_owner()
+
+
+def test_concurrency(server, tmp_path):
+    """Dozens of clients hammering the same server at once."""
+    def annotate(i):
+        client = _server.Client(server.url, f"annotator{i}")
+        model = f"model{i % 8}"
+        saved = 0
+        for j in range(10):
+            try:
+                client.lease(model)
+            except _server.LeaseError:
+                continue
+            revision = client.landmarks(model)["revision"]
+            client.update(model, [f"{i}-{j}"], [(i, j, 0)], revision)
+            client.release(model)
+            saved += 1
+        return saved
+
+    with ThreadPoolExecutor(32) as pool:
+        saved = sum(pool.map(annotate, range(32)))
+    assert saved > 0
+
+    # Every accepted update made it in exactly once.
+    store = server.store
+    landmarks = [store.landmarks(f"model{i}") for i in range(8)]
+    assert sum(i["revision"] for i in landmarks) == saved
+    assert sum(len(i["names"]) for i in landmarks) == saved
+    for (i, landmarks) in enumerate(landmarks):
+        if landmarks["revision"]:
+            assert _csv_io.read_named(tmp_path / f"model{i}.csv")[0] \
+                == landmarks["names"]
+
+
+def test_cli(tmp_path):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "tomial_clicky_tooth", "serve",
+         str(tmp_path), "--port", "0"], stdout=subprocess.PIPE, text=True)
+    try:
+        line = process.stdout.readline()
+        assert line.startswith(f"Serving {tmp_path} at http://")
+        client = _server.Client(line.split()[-1], "alice")
+        client.lease("1L")
+        client.update("1L", ["a"], [(1, 2, 3)])
+    finally:
+        process.terminate()
+        process.wait()
+    # The database defaults to a local disk, not the (shared) dataset.
+    assert _server.default_database(tmp_path).exists()
+    assert not list(tmp_path.glob("*.sqlite"))
+    assert _csv_io.read(tmp_path / "1L.csv") == [(1, 2, 3)]
@@ -0,0 +1,163 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+import numpy as np
+from motmot import Mesh
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _snapping, _csv_io, _cli, _meshfile
+
+pytestmark = pytest.mark.order(1)
+
+
+def brute_force(points, vectors, resolution=60):
+    """Approximate the closest point on each triangle by dense sampling."""
+    u, v = np.meshgrid(np.linspace(0, 1, resolution),
+                       np.linspace(0, 1, resolution))
+    mask = u + v <= 1
+    weights = np.stack([1 - u[mask] - v[mask], u[mask], v[mask]], axis=-1)
+    samples = np.einsum("sj,tjk->tsk", weights, vectors).reshape((-1, 3))
+    distances = np.linalg.norm(points[:, None] - samples[None], axis=-1)
+    return distances.min(axis=1)
+
+
+def test_closest_points_on_triangles():
+    random = np.random.default_rng(0)
+    triangles = random.normal(size=(200, 3, 3))
+    # Include some degenerate triangles.
+    triangles[0, 1] = triangles[0, 0]
+    triangles[1] = triangles[1, 0]
+    triangles[2, 2] = (triangles[2, 0] + triangles[2, 1]) / 2
+    points = random.normal(size=(200, 3)) * 2
+
+    out = _snapping.closest_points_on_triangles(points, triangles[:, 0],
+                                                triangles[:, 1],
+                                                triangles[:, 2])
+    assert np.isfinite(out[3:]).all()
+    distances = np.linalg.norm(out - points, axis=1)
+    for (point, triangle, distance) in zip(points, triangles, distances):
+        # Sampling can only overestimate the distance, and only slightly.
+        reference = brute_force(point[None], triangle[None])[0]
+        assert reference - .05 <= distance <= reference + 1e-9
+
+
+def test_closest_points():
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    random = np.random.default_rng(1)
+    points = mesh.vectors[random.integers(0, len(mesh), 30)].mean(axis=1)
+    points = points + random.normal(scale=.5, size=points.shape)
+    points[3] = np.nan
+
+    out = _snapping.closest_points(mesh, points)
+    assert np.isnan(out[3]).all()
+    distances = np.linalg.norm(out - points, axis=1)
+    vectors = mesh.vectors.astype(float)
+    everything = _snapping.closest_points_on_triangles(
+        points[:, None], vectors[:, 0], vectors[:, 1], vectors[:, 2])
+    reference = np.linalg.norm(everything - points[:, None], axis=-1)
+    reference = reference.min(axis=1, initial=np.inf, where=~np.isnan(
+        reference))
+    reference[3] = np.nan
+    assert distances == pytest.approx(reference, nan_ok=True)
+
+
+def test_closest_points_large_triangles():
+    """Check a point whose nearest triangle has a distant center (which
+    requires retrying with more candidate triangles)."""
+    small = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]]) \
+        + np.arange(20)[:, None, None] * [0, 0, 1.]
+    big = np.array([[[-1000, -1000, 5.5], [1000, -1000, 5.5], [0, 1000, 5.5]]])
+    mesh = Mesh(np.concatenate([small, big]).astype(np.float32))
+    out = _snapping.closest_points(mesh, [[50, 50, 5.4]], k=2)
+    assert out[0] == pytest.approx([50, 50, 5.5])
+
+    mesh = Mesh(np.empty((0, 3, 3), np.float32))
+    assert np.isnan(_snapping.closest_points(mesh, [[1, 2, 3]])).all()
+
+
+def test_snap_dataset(tmp_path):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    mesh = Mesh(model)
+    on_surface = mesh.centers[[0, 100, 2000, 5000]].astype(float)
+    lifts = [.01, .02, .03, .1]
+    lifted = on_surface + mesh.units[[0, 100, 2000, 5000]] * np.c_[lifts]
+    names = ["a", "b", "c", "d", "e"]
+    points = list(lifted) + [None]
+
+    suffix = "".join(model.suffixes)
+    for name in ["1L", "2L"]:
+        shutil.copy(model, tmp_path / (name + suffix))
+        (tmp_path / f"{name}.csv").write_text(
+            _csv_io.writes(points, names=names))
+    # A model without landmarks should be skipped.
+    shutil.copy(model, tmp_path / ("3L" + suffix))
+    # An unreadable model is an error.
+    (tmp_path / "4L.stl").write_bytes(b"not an STL")
+    (tmp_path / "4L.csv").write_text("")
+    # As is one which can't be snapped onto. Neither stops the others.
+    broken = Mesh(mesh.vertices.copy(), mesh.faces)
+    broken.vertices[0] = np.nan
+    (tmp_path / "5L.mesh").write_bytes(_meshfile.encode(broken, ".mesh"))
+    (tmp_path / "5L.csv").write_text(_csv_io.writes(points, names=names))
+
+    reports = list(_snapping.snap_dataset(tmp_path, jobs=2))
+    assert len(reports) == 4
+    assert reports[3]["errors"] == [
+        ("unsnappable", "ValueError: Some vertices are infinite or NaN.")
+    ]
+    assert reports[0]["names"] == names
+    assert reports[0]["displacements"][:4] == pytest.approx(lifts, abs=1e-5)
+    assert reports[0]["displacements"][4] is None
+    assert not reports[0]["written"]
+    assert reports[2]["errors"][0][0] == "unreadable"
+    assert _snapping.snap(tmp_path / "4L.stl")["errors"] == [
+        ("unreadable", "ValueError: The model has no triangles.")
+    ]
+    assert _snapping.format_report(_snapping.snap(tmp_path / ("3L" + suffix))) \
+        == "3L: 0 landmarks"
+    assert _csv_io.read(tmp_path / "1L.csv")[0] == tuple(lifted[0])
+
+    report = _snapping.snap(tmp_path / ("1L" + suffix), write=True,
+                            max_distance=.05)
+    assert report["written"]
+    assert report["errors"] == [("too far", "d is 0.1 from the surface")]
+    names_, points_ = _csv_io.read_named(report["csv"])
+    assert names_ == names
+    assert np.array(points_[:3]) == pytest.approx(on_surface[:3], abs=1e-4)
+    assert points_[3] == tuple(lifted[3])
+    assert points_[4] is None
+
+    # Snapping again shouldn't move anything so shouldn't rewrite anything.
+    text = Path(report["csv"]).read_text()
+    report = _snapping.snap(report["model"], write=True, max_distance=.05)
+    assert not report["written"]
+    assert Path(report["csv"]).read_text() == text
+
+
+def test_cli(tmp_path, capsys):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    shutil.copy(model, tmp_path)
+    (tmp_path / "1L.csv").write_text(
+        _csv_io.writes([Mesh(model).centers[0] + 1], names=["a"]))
+
+    assert _cli.main(["snap", str(tmp_path), "-j", "1"]) == 0
+    out = capsys.readouterr().out
+    assert "1L: 1 landmarks, max displacement" in out
+    assert "0 CSVs rewritten." in out
+
+    assert _cli.main(["snap", str(tmp_path), "-j", "1", "--json", "--write",
+                      "--max-distance", ".001"]) == 1
+    *reports, summary = map(json.loads, capsys.readouterr().out.splitlines())
+    assert summary["summary"]["errors"] == 1
+    assert summary["summary"]["written"] == 0
+    assert _cli.main(["snap", str(tmp_path), "-j", "1", "--max-distance",
+                      ".001"]) == 1
+    assert "1 errors." in capsys.readouterr().out
+
+    assert _cli.main(["snap", str(tmp_path), "-j", "1", "--write"]) == 0
+    assert "(rewritten)" in capsys.readouterr().out
+
+    assert str(_snapping.Summary()) == "0 landmarks in 0 models.\n" \
+                                       "0 CSVs rewritten."
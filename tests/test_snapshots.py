@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+from types import SimpleNamespace
+from pathlib import Path
+
+import pytest
+import numpy as np
+from motmot import Mesh
+from motmot.geometry import UnitVector
+import tomial_tooth_collection_api
+
+from tomial_clicky_tooth import _snapshots, _csv_io, _cli
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_preset_views():
+    views = _snapshots.preset_views()
+    assert list(views) == list(_snapshots.PRESET_NAMES)
+    assert views["Left"]["camera_position"].tolist() == [-1, 0, 0]
+    assert views["Top"]["up_view"].tolist() == [0, 1, 0]
+
+    # Swap x and y.
+    axes = np.array([[0, 1, 0], [1, 0, 0], [0, 0, -1]])
+    odometry = SimpleNamespace(axes=axes, occlusal=UnitVector([0, 0, -1]),
+                               forwards=UnitVector([1, 0, 0]))
+    views = _snapshots.preset_views(odometry)
+    assert views["Left"]["camera_position"].tolist() == [0, -1, 0]
+    assert views["Top"]["up_view"].tolist() == [1, 0, 0]
+    assert views["Occlusal"]["camera_position"].tolist() == [0, 0, -1]
+    assert views["Occlusal"]["up_view"].tolist() == [1, 0, 0]
+
+
+def test_snapshot():
+    mesh = Mesh(tomial_tooth_collection_api.model("1L"))
+    points = mesh.vertices[::2000].astype(float)
+    points[1] = np.nan
+
+    bare = _snapshots.snapshot(mesh, views=["Top", "Occlusal"], size=(200, 150))
+    # No odometry means no occlusal view.
+    assert list(bare) == ["Top"]
+    assert bare["Top"].shape == (150, 200, 3)
+    # Something other than the background should have been drawn.
+    background = np.array(_snapshots.Colors.BACKGROUND)
+    assert (bare["Top"] != background).any(axis=-1).mean() > .1
+
+    marked = _snapshots.snapshot(mesh, points, [str(i) for i in range(20)],
+                                 views=["Top"], size=(200, 150))
+    assert (marked["Top"] != bare["Top"]).any()
+
+    with pytest.raises(ValueError, match="Unknown view 'Up'"):
+        _snapshots.snapshot(mesh, views=["Up"])
+
+
+def test_review_dataset(tmp_path):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    suffix = "".join(model.suffixes)
+    dataset = tmp_path / "dataset"
+    dataset.mkdir()
+    for name in ["1L", "2L", "2L-copy"]:
+        shutil.copy(model, dataset / (name + suffix))
+    points = Mesh(model).vertices[:3]
+    (dataset / "1L.csv").write_text(
+        _csv_io.writes(points, names=["a", "<b>", "c"]))
+    (dataset / "3L.stl").write_bytes(b"not an STL")
+    output = tmp_path / "review"
+
+    # None of these models can be orientated so there's no occlusal view.
+    options = dict(views=["Occlusal", "Front", "Left"], size=(120, 90))
+    reports = list(_snapshots.review_dataset(dataset, output, jobs=2,
+                                             **options))
+    assert [i["rendered"] for i in reports] == [True, True, True, False]
+    assert reports[0]["images"] == ["1L-Front.png", "1L-Left.png"]
+    assert reports[0]["landmarks"] == 3
+    assert reports[1]["landmarks"] == 0
+    assert reports[3]["errors"][0][0] == "unreadable"
+    assert (output / "2L-copy-Left.png").exists()
+
+    # Nothing has changed so nothing needs re-rendering...
+    reports = list(_snapshots.review_dataset(dataset, output, jobs=1,
+                                             **options))
+    assert [i["rendered"] for i in reports] == [False] * 4
+    assert reports[0]["images"] == ["1L-Front.png", "1L-Left.png"]
+    # ...unless a snapshot goes missing...
+    (output / "2L-Left.png").unlink()
+    reports = list(_snapshots.review_dataset(dataset, output, jobs=1,
+                                             **options))
+    assert [i["rendered"] for i in reports] == [False, False, True, False]
+    assert reports[2]["images"] == ["2L-Front.png", "2L-Left.png"]
+    # ...or the landmarks change.
+    csv = dataset / "1L.csv"
+    os.utime(csv, (csv.stat().st_atime, csv.stat().st_mtime + 10))
+    reports = list(_snapshots.review_dataset(dataset, output, jobs=1,
+                                             **options))
+    assert [i["rendered"] for i in reports] == [True, False, False, False]
+
+    index = _snapshots.write_index(output, reports).read_text()
+    assert index.count("<tr") == 4
+    assert '<img src="1L-Front.png"' in index
+    assert "3 landmarks" in index
+    assert "unreadable: ValueError" in index
+
+
+def test_review_failure(tmp_path, monkeypatch):
+    """Rendering errors should be reported, not stop the rest of a dataset."""
+    model = Path(tomial_tooth_collection_api.model("1L"))
+
+    def snapshot(*args):
+        raise RuntimeError("No OpenGL")
+
+    monkeypatch.setattr(_snapshots, "snapshot", snapshot)
+    report = _snapshots.review(model, tmp_path, views=["Top"])
+    assert report["rendered"] is False
+    assert report["images"] == []
+    assert report["errors"] == [("unrenderable", "RuntimeError: No OpenGL")]
+
+
+def test_cli(tmp_path, capsys):
+    shutil.copy(tomial_tooth_collection_api.model("1L"), tmp_path)
+    output = tmp_path / "review"
+
+    args = ["review", str(tmp_path), str(output), "--views", "Top",
+            "--size", "60", "40", "-j", "1"]
+    assert _cli.main(args) == 0
+    out = capsys.readouterr().out
+    assert "1L: 1 snapshots" in out
+    assert "Rendered 1/1 models (0 already up to date)." in out
+    assert (output / "index.html").exists()
+
+    assert _cli.main(args + ["--json", "--no-labels"]) == 0
+    report, summary = map(json.loads, capsys.readouterr().out.splitlines())
+    assert report["images"] == ["1L-Top.png"]
+    assert summary["summary"]["up_to_date"] == 1
+    assert summary["index"] == str(output / "index.html")
+
+    (tmp_path / "2L.stl").write_bytes(b"")
+    assert _cli.main(args + ["--overwrite"]) == 1
+    out = capsys.readouterr().out
+    assert "1L: 1 snapshots" in out
+    assert "2L: failed\n    unreadable" in out
+    assert "1 errors." in out
+
+
+def test_no_qt(tmp_path):
+    """Rendering must work without Qt or a display."""
+    shutil.copy(tomial_tooth_collection_api.model("1L"), tmp_path)
+    code = "\n".join([
+        "import sys",
+        "from tomial_clicky_tooth import _cli",
+        f"_cli.main(['review', {str(tmp_path)!r}, {str(tmp_path / 'out')!r}, "
+        "'--views', 'Top', '--size', '60', '40', '-j', '1'])",
+        "print(' '.join(sys.modules))",
+    ])
+    env = {**os.environ, "QT_QPA_PLATFORM": "not-a-platform", "DISPLAY": ""}
+    output = subprocess.run([sys.executable, "-c", code], env=env,
+                            stdout=subprocess.PIPE, check=True).stdout
+    assert "PyQt5" not in output.decode().split()
+    assert (tmp_path / "out" / "1L-Top.png").exists()
+
+
+def test_thumbnail(tmp_path, monkeypatch):
+    source = Path(tomial_tooth_collection_api.model("1L"))
+    model = tmp_path / ("1L" + "".join(source.suffixes))
+    shutil.copy(source, model)
+    png = _snapshots.thumbnail(model, (64, 48))
+    assert png.startswith(b"\x89PNG")
+
+    # The second time should come from the cache...
+    def fail(*_, **__):
+        raise AssertionError
+
+    monkeypatch.setattr(_snapshots, "snapshot", fail)
+    assert _snapshots.thumbnail(model, (64, 48)) == png
+    # ...unless the size or the model's contents change.
+    with pytest.raises(AssertionError):
+        _snapshots.thumbnail(model, (32, 24))
+    shutil.copy(tomial_tooth_collection_api.model("2L"), model)
+    with pytest.raises(AssertionError):
+        _snapshots.thumbnail(model, (64, 48))
+
+    (tmp_path / "2L.stl").write_bytes(b"")
+    with pytest.raises(Exception):
+        _snapshots.thumbnail(tmp_path / "2L.stl")
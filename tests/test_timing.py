@@ -0,0 +1,63 @@
+import json
+import csv
+import threading
+
+import pytest
+
+from tomial_clicky_tooth import _timing
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_disabled():
+    self = _timing.Recorder()
+    with self.time("foo"):
+        pass
+    assert self.samples == {}
+    assert self.summary() == {}
+
+
+def test_recording(tmp_path):
+    self = _timing.Recorder(window=50, enabled=True)
+    for i in range(100):
+        self.record("foo", i, i / 1000)
+    with self.time("bar"):
+        pass
+    with pytest.raises(KeyError):
+        with self.time("baz"):
+            raise KeyError
+
+    # Only the most recent 50 samples should be retained.
+    assert len(self.samples["foo"]) == 50
+    assert self.percentiles("foo") == [.075, .095, .099]
+    summary = self.summary()
+    assert list(summary) == ["bar", "baz", "foo"]
+    assert summary["foo"] == {
+        "count": 50, "p50": .075, "p90": .095, "p99": .099, "max": .099
+    }  # yapf: disable
+    assert summary["bar"]["count"] == 1
+    assert summary["bar"]["max"] < .1
+
+    # Samples should be tagged with the thread that recorded them.
+    thread = threading.Thread(target=self.record, args=("foo", 1e9, 0),
+                              name="some thread")
+    thread.start()
+    thread.join()
+    assert self.samples["foo"][-1].thread == "some thread"
+
+    self.export(tmp_path / "timings.json")
+    content = json.loads((tmp_path / "timings.json").read_text())
+    assert content["summary"]["bar"] == summary["bar"]
+    assert len(content["samples"]) == 52
+    assert content["samples"][-1] == {
+        "name": "foo", "start": 1e9, "duration": 0, "thread": "some thread"
+    }  # yapf: disable
+
+    self.export(tmp_path / "timings.csv")
+    with open(tmp_path / "timings.csv", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["name", "start", "duration", "thread"]
+    assert len(rows) == 53
+
+    self.clear()
+    assert self.summary() == {}
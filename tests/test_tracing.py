@@ -0,0 +1,72 @@
+import json
+import threading
+
+import pytest
+
+from tomial_clicky_tooth import _tracing, _timing
+
+pytestmark = pytest.mark.order(1)
+
+
+def test_tracing(tmp_path):
+    path = tmp_path / "trace.json"
+    tracer = _tracing.start(path, buffer_size=10)
+    assert _tracing.tracer is tracer
+
+    with _timing.timed("foo"):
+        pass
+    with tracer.span("bar", "test"):
+        pass
+
+    def _worker():
+        for i in range(20):
+            tracer.complete("baz", i, 1)
+
+    thread = threading.Thread(target=_worker, name="some worker")
+    thread.start()
+    thread.join()
+
+    # Events should be written out in batches and the incomplete trace should
+    # be readable (by adding the missing closing bracket).
+    events = json.loads(path.read_text() + "]")
+    assert 10 <= len(events) < 25
+
+    # Restarting should finalise the old trace.
+    tracer = _tracing.start(tmp_path / "trace-2.json")
+    events = json.loads(path.read_text())
+    assert len(events) == 25
+    _tracing.stop()
+    assert _tracing.tracer is None
+    # Stopping twice is harmless as is using a stopped tracer.
+    _tracing.stop()
+    tracer.instant("too late")
+    tracer.flush()
+
+    complete = [i for i in events if i["ph"] == "X"]
+    assert [i["name"] for i in complete] == ["foo", "bar"] + ["baz"] * 20
+    assert complete[0]["cat"] == "timed"
+    assert complete[-1]["ts"] == 19e6
+    assert complete[-1]["dur"] == 1e6
+
+    threads = {
+        i["tid"]: i["args"]["name"]
+        for i in events if i["name"] == "thread_name"
+    }
+    assert threads[complete[0]["tid"]] == threading.current_thread().name
+    assert threads[complete[-1]["tid"]] == "some worker"
+
+    # Timing should go back to costing nothing.
+    with _timing.timed("foo"):
+        pass
+    assert json.loads((tmp_path / "trace-2.json").read_text())[1:] == []
+
+
+def test_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv(_tracing.ENV, raising=False)
+    _tracing.start_from_environment()
+    assert _tracing.tracer is None
+
+    monkeypatch.setenv(_tracing.ENV, str(tmp_path / "trace.json"))
+    _tracing.start_from_environment()
+    assert _tracing.tracer.path == str(tmp_path / "trace.json")
+    _tracing.stop()
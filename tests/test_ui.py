@@ -1,12 +1,16 @@
 import tempfile
+import time
+import json
 from pathlib import Path
 import shutil
 import os
+import threading
+from types import SimpleNamespace
 from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 import numpy as np
-from PyQt5 import QtTest, QtCore, QtGui
+from PyQt5 import QtTest, QtCore, QtGui, QtWidgets
 import pyperclip
 from vtkmodules.vtkRenderingCore import vtkCoordinate
 from motmot import geometry
@@ -15,11 +19,13 @@
 import tomial_tooth_collection_api
 
 from tomial_clicky_tooth._qapp import app
-from tomial_clicky_tooth import _csv_io
-from tomial_clicky_tooth._ui import UI
+from tomial_clicky_tooth import _csv_io, _timing, _tracing, _profiling, \
+    _registration, _server, _agreement
+from tomial_clicky_tooth._ui import UI, SERVER_ENV
 from tests import xvfb_size, select_file, CloseBlockingDialog, \
     ChooseMessageBoxButton
 from tests.test_csv import INVALID_CSVs, assert_text_equivalent
+from tests.test_registration import reference_dataset
 
 pytestmark = pytest.mark.order(5)
 
@@ -392,6 +398,30 @@ def _test_write(name):
     self.close()
 
 
+def test_load_by_name(tmp_path, monkeypatch):
+    """CSVs are read by landmark name rather than row position."""
+    csv = tmp_path / "1L.csv"
+    csv.write_text(
+        _csv_io.writes([(1, 2, 3), (4, 5, 6), (7, 8, 9)],
+                       names=["c", "obsolete", "a"]))
+    # Placed landmarks which the template doesn't have are warned about.
+    warnings = []
+    monkeypatch.setattr(QtWidgets.QMessageBox, "warning",
+                        lambda *args: warnings.append(args))
+    self = UI(["a", "b", "c"], points=csv)
+    assert len(warnings) == 1
+    assert warnings[0][2].endswith(": obsolete")
+    assert self.table[:] == [(7, 8, 9), None, (1, 2, 3)]
+    assert sorted(self.clicker.markers) == [0, 2]
+
+    # Unnamed CSVs are still read by position.
+    csv.write_text(_csv_io.writes([(1, 2, 3), None]))
+    self.points = csv
+    assert self.table[:] == [(1, 2, 3), None, None]
+    assert len(warnings) == 1
+    self.close()
+
+
 def key_press(widget, key, modifier=QtCore.Qt.NoModifier):
     """Send keyboard events."""
     event = QtGui.QKeyEvent(QtCore.QEvent.KeyPress, key, modifier)
@@ -588,6 +618,388 @@ def test_invalid_model(tmpdir):
     self.close()
 
 
+def test_no_saving_while_loading(tmp_path):
+    """The previous model's landmarks mustn't be saved as those of a model
+    which is still loading."""
+    files = [
+        Path(shutil.copy(tomial_tooth_collection_api.model(name), tmp_path))
+        for name in ["1L", "1U"]
+    ]
+    shutil.copy(Path(__file__).with_name("1L.csv"), tmp_path)
+    self = UI(Palmer.range())
+    self._open_model(files[0])
+    assert not np.isnan(self.points).all()
+
+    self._open_model(files[1], background=True)
+    assert np.isnan(self.points).all()
+    assert not self._history.modified
+    # Saving is visibly unavailable...
+    assert not self.table.save_action.isEnabled()
+    assert not self.table.save_as_action.isEnabled()
+    assert not self.table.save_button.isEnabled()
+    # ...and does nothing anyway.
+    self.table.save()
+    assert not (tmp_path / "1U.csv").exists()
+
+    while self._pending_load is not None:
+        app.processEvents()
+    assert self.table.save_action.isEnabled()
+    assert self.table.save_as_action.isEnabled()
+    self.close()
+
+
+def test_background_loading(tmp_path):
+    """Test opening models in a background thread."""
+    files = [
+        Path(shutil.copy(tomial_tooth_collection_api.model(name), tmp_path))
+        for name in ["1L", "1U"]
+    ]
+    invalid = Path(shutil.copy(Path(__file__).with_name("invalid.stl"),
+                               tmp_path))
+    shutil.copy(Path(__file__).with_name("1L.csv"), tmp_path)
+
+    def _wait():
+        while self._pending_load is not None:
+            app.processEvents()
+
+    self = UI(Palmer.range())
+    self.show()
+    app.processEvents()
+
+    self._open_model(files[0], background=True)
+    # The path is claimed immediately but the model follows later.
+    assert self.path == files[0]
+    assert self.model_name_indicator.text() == "1L (loading...)"
+    _wait()
+    assert self.clicker.mesh is not None
+    assert self.clicker.odometry is not None
+    assert self.model_name_indicator.text() == "1L"
+    assert len(self.clicker.markers) == 14
+
+    # A load which is superseded by another should be discarded.
+    self._open_model(files[1], background=True)
+    self._open_model(files[0], background=True)
+    _wait()
+    app.processEvents()
+    assert self.path == files[0]
+    assert self.model_name_indicator.text() == "1L"
+
+    with CloseBlockingDialog():
+        self._open_model(invalid, background=True)
+        _wait()
+    assert self.path == invalid
+    assert self.clicker.mesh is None
+
+    self.close()
+
+
+def test_propose_landmarks(tmp_path):
+    reference, dataset, expected = reference_dataset(tmp_path)
+    self = UI(["a", "b", "c", "d", "e"])
+    self.show()
+    app.processEvents()
+
+    # Without a model, there's nothing to register onto.
+    self.propose_landmarks()
+    assert self._reference is None
+
+    self._open_model(dataset / "2L.stl")
+    assert not self.table.proposed
+    with select_file(None):
+        action(self.menu_bar["&Edit"], "Propose Landmarks").trigger()
+    assert np.isnan(self.points).all()
+    with CloseBlockingDialog():
+        assert not self.choose_reference_model(dataset / "nonexistent.stl")
+
+    # Landmarks which are already placed should be left alone.
+    self.table[0] = (1, 2, 3)
+    with select_file(reference):
+        action(self.menu_bar["&Edit"], "Propose Landmarks").trigger()
+    assert self._reference.path == reference
+    assert self.points[0] == pytest.approx([1, 2, 3])
+    assert self.points[1:4] == pytest.approx(expected[1:], abs=1e-3)
+    assert np.isnan(self.points[4]).all()
+    assert self.table.proposed == {1, 2, 3}
+    assert self.table.table.item(1, 0).font().italic()
+    assert len(self.clicker.markers) == 4
+    assert self._history.modified
+
+    # Replacing a proposal turns it into a regular landmark.
+    self.table[1] = (4, 5, 6)
+    assert self.table.proposed == {2, 3}
+    assert not self.table.table.item(1, 0).font().italic()
+    self._log_state()
+    # Undo and redo restore which landmarks are proposals.
+    self.undo()
+    assert self.table.proposed == {1, 2, 3}
+    assert self.table.table.item(1, 0).font().italic()
+    self.undo()
+    assert self.table.proposed == set()
+    self.redo()
+    self.redo()
+    assert self.table.proposed == {2, 3}
+    assert self.table.table.item(2, 0).font().italic()
+    # As does saving.
+    self.table.save()
+    assert not self.table.proposed
+
+    # Precomputed proposals are shown as soon as an unannotated model opens.
+    shutil.copy(dataset / "2L.stl", dataset / "3L.stl")
+    reports = _registration.propose_dataset(dataset, [reference], jobs=1)
+    assert [i["written"] for i in reports] == [False, True]
+    self._open_model(dataset / "3L.stl")
+    assert self.table.proposed == {0, 1, 2, 3}
+    assert self.points[:4] == pytest.approx(expected, abs=1e-3)
+    assert not self._history.modified
+    # And are preferred over registering the reference model again.
+    del self.table[:]
+    self._reference = None
+    self.propose_landmarks()
+    assert self.table.proposed == {0, 1, 2, 3}
+
+    self.close()
+
+
+def test_snap_to_features(tmp_path):
+    model = Path(shutil.copy(tomial_tooth_collection_api.model("1L"), tmp_path))
+    self = UI(Palmer.range(), model)
+    self.show()
+    app.processEvents()
+
+    def _wait():
+        while self.clicker.features is None:
+            app.processEvents()
+
+    def _click(point):
+        self.clicker._left_click_callback(
+            SimpleNamespace(actor=self.clicker.mesh_plot.actor, point=point))
+
+    # Snapping is off by default so features aren't looked for.
+    assert self.clicker.features is None
+    action(self.menu_bar["&Edit"], "Snap To Features").trigger()
+    assert self.clicker.snap_to_features
+    _wait()
+    feature = self.clicker.features.points[0]
+
+    select_rows(self, 0)
+    _click(feature + [.3, .3, 0])
+    assert self.points[0] == pytest.approx(feature)
+    # Clicks with no feature nearby are left alone.
+    select_rows(self, 1)
+    _click(feature + [1e3, 0, 0])
+    assert self.points[1] == pytest.approx(feature + [1e3, 0, 0])
+
+    # Features are found afresh for each model opened.
+    self.table.save()
+    self._open_model(model)
+    assert self.clicker.features is None
+    _wait()
+    assert len(self.clicker.features) > 0
+
+    action(self.menu_bar["&Edit"], "Snap To Features").trigger()
+    select_rows(self, 2)
+    _click(feature + [.3, .3, 0])
+    assert self.points[2] == pytest.approx(feature + [.3, .3, 0])
+
+    self.close()
+
+
+def test_browse_dataset(tmp_path):
+    model = Path(tomial_tooth_collection_api.model("1L"))
+    first = Path(shutil.copy(model, tmp_path))
+    second = tmp_path / ("2L" + "".join(model.suffixes))
+    shutil.copy(model, second)
+    self = UI(Palmer.range())
+    self.show()
+    app.processEvents()
+
+    # No model open means no dataset to browse.
+    self.browse_dataset()
+    assert self._browser is None
+
+    self._open_model(first)
+    action(self.menu_bar["&File"], "Browse Dataset").trigger()
+    browser = self._browser
+    assert browser.model().paths == [first, second]
+    assert browser.currentIndex().row() == 0
+    # Reopening the browser reuses it.
+    self.browse_dataset()
+    assert self._browser is browser
+
+    browser.doubleClicked.emit(browser.model().index(1))
+    assert self.path == second
+
+    self.close()
+    assert browser.model().pending == 0
+
+
+def test_measure_geodesic(tmp_path):
+    model = Path(shutil.copy(tomial_tooth_collection_api.model("1L"), tmp_path))
+    self = UI(Palmer.range(), model)
+    self.show()
+    app.processEvents()
+    vertices = self.clicker.mesh.vertices
+    self.table[0] = vertices[0]
+    self.table[1] = vertices[200]
+    self.set_clicker_points(self.points)
+
+    # Needs exactly two placed landmarks.
+    select_rows(self, 0, 2)
+    action(self.menu_bar["&Edit"], "Measure Geodesic").trigger()
+    assert "Select two" in self.geodesic_indicator.text()
+    assert self.clicker.geodesic_plot is None
+
+    select_rows(self, 0, 1)
+    self.measure_geodesic()
+    names = self.table.names
+    text = self.geodesic_indicator.text()
+    assert text.startswith(f"{names[0]} to {names[1]}: ")
+    distance = self.clicker.graph.distance(vertices[0], vertices[200])
+    assert f"{distance:.2f} along the surface" in text
+    assert self.clicker.geodesic_plot is not None
+    graph = self.clicker.graph
+    # The graph is reused.
+    self.measure_geodesic()
+    assert self.clicker.graph is graph
+
+    # Moving a landmark makes the path stale.
+    select_rows(self, 1)
+    self.clicker.spawn_marker(vertices[300])
+    assert self.clicker.geodesic_plot is None
+    assert self.geodesic_indicator.text() == ""
+
+    select_rows(self, 0, 1)
+    self.measure_geodesic()
+    self.table.save()
+    self._open_model(model)
+    assert self.clicker.geodesic_plot is None
+    assert self.clicker.graph is None
+    assert self.geodesic_indicator.text() == ""
+    self.close()
+
+
+def test_open_qa_report(tmp_path):
+    model = Path(shutil.copy(tomial_tooth_collection_api.model("1L"), tmp_path))
+    self = UI(Palmer.range())
+    self.show()
+    names = self.table.names
+    flag = {"annotator": "alice", "kind": "outlier", "value": 9.}
+    report = {"models": [
+        {"model": "1L", "path": str(model), "flags": [
+            {**flag, "landmark": names[1]}, {**flag, "landmark": names[3]},
+            {**flag, "landmark": "not a landmark"}]},
+        {"model": "2L", "path": None, "flags": [{**flag, "landmark": "x"}]},
+        {"model": "3L", "path": None, "flags": []},
+    ]}  # yapf: disable
+    path = tmp_path / "qa.json"
+    _agreement.write_report(path, report)
+
+    with CloseBlockingDialog():
+        self.open_qa_report(tmp_path / "nonexistent.json")
+    assert self._qa_report is None
+
+    action(self.menu_bar["&File"], "Open QA Report")
+    self.open_qa_report(path)
+    items = self._qa_report
+    assert items.count() == 2
+    assert items.item(0).text() == "1L: 3 flags"
+    assert "outlier" in items.item(0).toolTip()
+
+    items.itemActivated.emit(items.item(0))
+    assert self.path == model
+    assert self.table.highlighted_rows() == [1, 3]
+
+    with CloseBlockingDialog():
+        items.itemActivated.emit(items.item(1))
+    assert self.path == model
+
+    self.close()
+    assert not items.isVisible()
+
+
+def test_annotation_server(tmp_path, monkeypatch):
+    model = Path(shutil.copy(tomial_tooth_collection_api.model("1L"), tmp_path))
+    csv = tmp_path / "1L.csv"
+    csv.write_text(_csv_io.writes([(1, 2, 3)], names=["a"]))
+    server = _server.serve(tmp_path, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    assert SERVER_ENV == _server.SERVER_ENV
+    monkeypatch.setenv(_server.SERVER_ENV, server.url)
+
+    def annotator(owner):
+        self = UI(["a", "b", "c"])
+        self.server.owner = owner
+        self.show()
+        return self
+
+    try:
+        alice = annotator("alice")
+        alice._open_model(model)
+        # The server has never seen this model so its CSV is used.
+        assert alice.points[0] == pytest.approx([1, 2, 3])
+        assert alice.model_name_indicator.text() == "1L"
+
+        # Someone else can look but not touch.
+        bob = annotator("bob")
+        with CloseBlockingDialog():
+            bob._open_model(model)
+        assert bob.model_name_indicator.text() == "1L (read only)"
+        bob.table[2] = (7, 8, 9)
+        bob._log_state()
+        with CloseBlockingDialog():
+            bob.table.save()
+        assert bob._history.modified
+
+        # The first save sends everything, later ones only what's changed.
+        alice.table[1] = (4, 5, 6)
+        alice._log_state()
+        alice.table.save()
+        assert not alice._history.modified
+        assert server.store.landmarks("1L")["points"] \
+            == [[1, 2, 3], [4, 5, 6], None]
+        sent = []
+        update = alice.server.update
+
+        def _update(model, names, *args):
+            sent.append(names)
+            return update(model, names, *args)
+
+        monkeypatch.setattr(alice.server, "update", _update)
+        del alice.table[0]
+        alice._log_state()
+        alice.table.save()
+        assert sent == [["a"]]
+        assert _csv_io.read(csv) == [None, (4, 5, 6), None]
+
+        # Closing releases the model.
+        alice.close()
+        bob._history.saved_position = bob._history.position
+        bob._open_model(model)
+        assert bob.model_name_indicator.text() == "1L"
+        assert bob.points[1] == pytest.approx([4, 5, 6])
+        assert np.isnan(bob.points[0]).all()
+
+        # Saving over changes made since they were loaded is refused.
+        bob._revision -= 1
+        bob.table[2] = (7, 8, 9)
+        bob._log_state()
+        with CloseBlockingDialog():
+            bob.table.save()
+        assert bob._history.modified
+        assert server.store.landmarks("1L")["points"][2] is None
+
+        # Disconnecting falls back to the (up to date) CSV.
+        with ChooseMessageBoxButton("Don't Save"):
+            bob.connect_to_server("")
+        assert bob.server is None
+        assert bob.points[1] == pytest.approx([4, 5, 6])
+        assert server.store.landmarks("1L")["holder"] is None
+        bob.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
 def test_show_licenses():
     self = UI(Palmer.range())
     self.show()
@@ -597,6 +1009,95 @@ def test_show_licenses():
     assert self._licenses.isVisible()
 
 
+def test_performance_overlay(tmp_path):
+    self = UI(Palmer.range())
+    self.show()
+    app.processEvents()
+    _timing.recorder.clear()
+
+    action(self.menu_bar["&Debug"], "Performance Overlay").trigger()
+    assert _timing.recorder.enabled
+    assert self._overlay.isVisible()
+    assert self._overlay.label.text().startswith("No timings recorded yet.")
+    assert "history states" in self._overlay.label.text()
+
+    self.clicker.spawn_marker((1, 2, 3))
+    self._overlay.refresh()
+    assert "log state" in self._overlay.label.text()
+    assert "update table" in self._overlay.label.text()
+
+    with select_file(tmp_path / "timings.csv"):
+        action(self.menu_bar["&Debug"], "Export Timings").trigger()
+    assert "log state" in (tmp_path / "timings.csv").read_text()
+    with select_file(None):
+        self.export_timings()
+
+    action(self.menu_bar["&Debug"], "Performance Overlay").trigger()
+    assert not self._overlay.isVisible()
+    assert not _timing.recorder.enabled
+
+    self.close()
+
+
+def test_record_trace(tmp_path):
+    self = UI(Palmer.range())
+    self.show()
+    app.processEvents()
+
+    # Cancelling the file dialog should cancel tracing.
+    with select_file(None):
+        action(self.menu_bar["&Debug"], "Record Trace").trigger()
+    assert not self._trace_action.isChecked()
+    assert _tracing.tracer is None
+
+    with select_file(tmp_path / "trace.json"):
+        action(self.menu_bar["&Debug"], "Record Trace").trigger()
+    assert self._trace_action.isChecked()
+    assert _tracing.tracer is not None
+
+    self.clicker.spawn_marker((1, 2, 3))
+    key_press(self.table.table, QtCore.Qt.Key_Down)
+    # Run the real event loop for a bit with something slow in it.
+    QtCore.QTimer.singleShot(0, lambda: time.sleep(.01))
+    QtCore.QTimer.singleShot(100, app.quit)
+    app.exec()
+
+    action(self.menu_bar["&Debug"], "Record Trace").trigger()
+    assert _tracing.tracer is None
+
+    events = json.loads((tmp_path / "trace.json").read_text())
+    names = {i["name"] for i in events}
+    assert {"marker_changed", "update table", "log state"} <= names
+    assert {"key press", "Qt events"} <= names
+
+    self.close()
+
+
+def test_profile(tmp_path):
+    self = UI(Palmer.range())
+    self.show()
+    app.processEvents()
+
+    action(self.menu_bar["&Debug"], "Profile").trigger()
+    assert self._profile_action.isChecked()
+    assert _profiling.profiler is not None
+    self.clicker.spawn_marker((1, 2, 3))
+    time.sleep(.05)
+
+    # Cancelling the file dialog discards the profile.
+    with select_file(None):
+        action(self.menu_bar["&Debug"], "Profile").trigger()
+    assert _profiling.profiler is None
+
+    self._profile_action.setChecked(True)
+    time.sleep(.05)
+    with select_file(tmp_path / "profile.prof"):
+        self._profile_action.setChecked(False)
+    assert (tmp_path / "profile.prof").exists()
+
+    self.close()
+
+
 def test_history(tmpdir):
     """Test undo/redo."""
     self = UI(Palmer.range())
@@ -708,3 +1209,16 @@ def test_save_prompt(tmp_path):
             self.switch_model(">")
         assert (tmp_path / "foo.csv").exists()
         assert self.path == files[1]
+
+
+def test_crop_base():
+    self = UI(Palmer.range(), tomial_tooth_collection_api.model("1L"))
+    crop = action(self.menu_bar["&Edit"], "Crop Base")
+    assert not self.clicker.crop
+    crop.trigger()
+    assert self.clicker.crop
+    assert self.clicker.mesh is not None
+    crop.trigger()
+    assert not self.clicker.crop
+    assert self.clicker.visible_mesh() is self.clicker.mesh
+    self.close()
@@ -0,0 +1,127 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from tomial_clicky_tooth import _validation, _cli, _csv_io
+from tomial_clicky_tooth._landmark_templates import LandmarksTemplate
+
+pytestmark = pytest.mark.order(1)
+
+HERE = Path(__file__).parent
+TEMPLATE = HERE / "asymmetric.yaml"
+UPPER = ["Something on the left", "UR1", "UR2", "UR3", "UR4"]
+
+
+def dataset_files():
+    """A dataset with one of each kind of problem."""
+    template = LandmarksTemplate.from_file(TEMPLATE)
+    lower = template.evaluate(_validation.JawType(arch_type="L"))
+    point = (1., 2., 3.)
+    model = HERE / "one-triangle.stl"
+    return {
+        **{f"{name}.stl": model for name in
+           ["1U", "2U", "3U", "4U", "5U", "6U", "1L", "8U"]},
+        "1U.csv": _csv_io.writes([point] * 5, names=UPPER),
+        "2U.csv": _csv_io.writes([point, None, point, point, point],
+                                 names=UPPER),
+        "3U.csv": _csv_io.writes([point] * 4, names=UPPER[:4]),
+        "4U.csv": _csv_io.writes([point] * 5, names=UPPER[::-1]),
+        "5U.csv": _csv_io.writes([point] * 6, names=UPPER + ["UL7"]),
+        "6U.csv": _csv_io.writes([point] * 4 + [(1, float("inf"), 2)],
+                                 names=UPPER),
+        "1L.csv": _csv_io.writes([point] * len(lower), names=lower),
+        # An invalid model name.
+        "cake.stl": model,
+        # And something which isn't a model at all.
+        "notes.txt": "Hello",
+    }
+
+
+EXPECTED_ERRORS = {
+    "1L": [],
+    "1U": [],
+    "2U": [("unset", "UR1")],
+    "3U": [("missing names", "UR4")],
+    "4U": [("wrong order", "Landmarks are not in the template's order.")],
+    "5U": [("unexpected names", "UL7")],
+    "6U": [("non-finite", "UR4 = (1.0, inf, 2.0)")],
+    "8U": [("missing csv", "8U.csv does not exist.")],
+}
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_validate_dataset(tmp_path, jobs, write_dataset):
+    write_dataset(dataset_files())
+    reports = list(_validation.validate_dataset(tmp_path, TEMPLATE, jobs=jobs))
+    assert [Path(i["model"]).name for i in reports] == [
+        "1L.stl", "1U.stl", "2U.stl", "3U.stl", "4U.stl", "5U.stl", "6U.stl",
+        "8U.stl", "cake.stl"
+    ]
+    errors = {Path(i["model"]).stem: i["errors"] for i in reports}
+    assert errors.pop("cake")[0][0] == "unknown arch type"
+    assert errors == EXPECTED_ERRORS
+
+    summary = _validation.Summary()
+    assert str(summary) == "0/0 models valid."
+    for report in reports:
+        summary.add(report)
+    summary = summary.to_dict()
+    assert summary["models"] == 9
+    assert summary["valid"] == 2
+    assert summary["errors"]["unset"] == 1
+    assert summary["placed_per_landmark"]["UR2"] == 6
+
+
+def test_optional(tmp_path, write_dataset):
+    write_dataset(dataset_files())
+    reports = _validation.validate_dataset(tmp_path, TEMPLATE, jobs=1,
+                                           optional=["UR1"])
+    report = next(i for i in reports if "2U" in i["model"])
+    assert report["errors"] == []
+    assert report["placed"] == ["Something on the left", "UR2", "UR3", "UR4"]
+
+
+def test_template_path():
+    assert _validation.template_path("MHB").name == "MHB.yaml"
+    assert _validation.template_path(TEMPLATE) == TEMPLATE
+    assert _validation.template_path("foo.yaml") == Path("foo.yaml")
+
+
+def test_no_template(tmp_path):
+    template = tmp_path / "upper-only.yaml"
+    template.write_text("upper:\n  - foo\n")
+    shutil.copy(HERE / "one-triangle.stl", tmp_path / "1L.stl")
+    report, = _validation.validate_dataset(tmp_path, template, jobs=1)
+    assert report["errors"][0][0] == "no template"
+
+    shutil.copy(HERE / "one-triangle.stl", tmp_path / "1U.stl")
+    (tmp_path / "1U.csv").write_bytes(b"\xff\xfe\x00")
+    _, report = _validation.validate_dataset(tmp_path, template, jobs=1)
+    assert report["errors"][0][0] == "unreadable csv"
+
+
+def test_cli(tmp_path, capsys, write_dataset):
+    write_dataset(dataset_files())
+    assert _cli.main(["validate", str(tmp_path), "--template",
+                      str(TEMPLATE), "-j", "1"]) == 1
+    out = capsys.readouterr().out
+    assert "OK    1U\n" in out
+    assert "FAIL  2U\n      unset: UR1\n" in out
+    assert "2/9 models valid." in out
+
+    assert _cli.main(["validate", str(tmp_path), "--template",
+                      str(TEMPLATE), "-j", "1", "-q"]) == 1
+    assert "OK    1U" not in capsys.readouterr().out
+
+    assert _cli.main(["validate", str(tmp_path), "--template",
+                      str(TEMPLATE), "-j", "1", "--json"]) == 1
+    lines = [json.loads(i) for i in capsys.readouterr().out.splitlines()]
+    assert len(lines) == 10
+    assert lines[-1]["summary"]["invalid"] == 7
+
+    for path in [*tmp_path.glob("*U.*"), tmp_path / "cake.stl"]:
+        path.unlink()
+    assert _cli.main(["validate", str(tmp_path), "--template",
+                      str(TEMPLATE), "-j", "1"]) == 0
@@ -0,0 +1,79 @@
+import time
+import threading
+
+import pytest
+
+from tomial_clicky_tooth import _watchdog, _timing, _cache
+
+pytestmark = pytest.mark.order(1)
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.01)
+
+
+def test_stall(tmp_path):
+    log = tmp_path / "stalls.log"
+    watchdog = _watchdog.Watchdog(threshold=.1, interval=.01,
+                                  thread=threading.current_thread(), path=log)
+    watchdog.start()
+    try:
+        # Keep beating: no stalls.
+        for _ in range(20):
+            watchdog.beat()
+            time.sleep(.01)
+        assert not watchdog.stalls
+
+        # Stop beating whilst inside a timed block.
+        with _timing.timed("something slow"):
+            with _timing.timed("something slower"):
+                wait_for(lambda: watchdog.stalls)
+        stall, = watchdog.stalls
+        assert stall.operations == ["something slow", "something slower"]
+        assert "test_stall" in stall.stack
+        assert "ongoing" in str(stall)
+
+        # Recover.
+        watchdog.beat()
+        wait_for(lambda: stall.duration is not None)
+        assert stall.duration >= .1
+        assert "something slow > something slower" in str(stall)
+    finally:
+        watchdog.stop()
+
+    text = log.read_text()
+    assert "something slow > something slower" in text
+    assert "test_stall" in text
+    assert "Recovered after" in text
+
+
+def test_log_path(monkeypatch, tmp_path):
+    monkeypatch.delenv(_watchdog.LOG_ENV, raising=False)
+    assert _watchdog.log_path() == _cache.cache_root() / "stalls.log"
+    monkeypatch.setenv(_watchdog.LOG_ENV, str(tmp_path / "foo.log"))
+    assert _watchdog.log_path() == str(tmp_path / "foo.log")
+
+
+def test_watch_qt(tmp_path):
+    from PyQt5 import QtWidgets
+    from tomial_clicky_tooth._qapp import app
+
+    parent = QtWidgets.QWidget()
+    watchdog = _watchdog.watch_qt(parent, threshold=.2, interval=.01,
+                                  path=tmp_path / "stalls.log")
+    try:
+        # The Qt timer should keep the heartbeat going.
+        end = time.monotonic() + .5
+        while time.monotonic() < end:
+            app.processEvents()
+        assert not watchdog.stalls
+
+        # Block the event loop.
+        time.sleep(.4)
+        assert len(watchdog.stalls) == 1
+    finally:
+        watchdog.stop()
+        parent.close()
@@ -1,6 +1,14 @@
-from . import _qapp
 from ._landmark_templates import LandmarksTemplate, LandmarksContext
-from ._ui import UI, main
+
+
+def __getattr__(name):
+    # The GUI components are loaded lazily so that the data APIs above can be
+    # used in headless batch jobs without paying for, or needing a display for,
+    # Qt and VTK.
+    if name in ("UI", "main"):
+        from . import _ui
+        return getattr(_ui, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def _PyInstaller_hook_dir():  # pragma: no cover
@@ -1,11 +1,18 @@
 import sys
+import multiprocessing
 from pathlib import Path
 
-from pangolin import Palmer
-
-from tomial_clicky_tooth._ui import main
+from tomial_clicky_tooth import _cli
 
 if __name__ == "__main__":
+    # Required by the background process pools in PyInstaller builds.
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] in _cli.COMMANDS:
+        sys.exit(_cli.main(sys.argv[1:]))
+
+    from pangolin import Palmer
+    from tomial_clicky_tooth._ui import main
+
     if len(sys.argv) > 1:
         path = Path(sys.argv[1])
         csv_path = path.with_suffix(".csv")
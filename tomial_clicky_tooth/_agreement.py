@@ -0,0 +1,388 @@
+"""Compare several annotators' landmarks for the same models and find the
+placements which look wrong.
+
+Each annotator's CSVs live in their own folder using the usual dataset layout.
+The report can be opened in the UI (File > Open QA Report) to jump straight to
+each flagged model.
+
+"""
+
+import json
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from tomial_clicky_tooth import _batch, _csv_io, _dataset
+
+
+class Annotations:
+    """Several annotators' landmarks, stacked.
+
+    Attributes:
+        folders (list[pathlib.Path]):
+            Where each annotator's CSVs were read from.
+        annotators (list[str]):
+            Each annotator's name (their folder's name).
+        models (list[str]):
+            Every model annotated by anyone, sorted.
+        names (list[str]):
+            Every landmark name in order of first appearance.
+        points (numpy.ndarray):
+            ``(annotators, models, landmarks, 3)`` coordinates. NaN wherever a
+            landmark is unset or an annotator has no CSV for a model.
+        errors (list[tuple]):
+            ``(csv, message)`` pairs for any CSV which couldn't be read.
+
+    """
+    def __init__(self, folders, annotators, models, names, points, errors=()):
+        self.folders = folders
+        self.annotators = annotators
+        self.models = models
+        self.names = names
+        self.points = points
+        self.errors = list(errors)
+
+
+def load(folders, names=None):
+    """Read every annotator's CSVs.
+
+    Args:
+        folders:
+            A folder of ``<model>.csv`` files per annotator.
+        names:
+            The landmarks to compare. Defaults to every name found.
+    Returns:
+        Annotations: The stacked landmarks.
+
+    """
+    folders = [Path(i) for i in folders]
+    tables = []
+    errors = []
+    for folder in folders:
+        table = {}
+        for csv in sorted(folder.glob("*.csv")):
+            if csv.name.endswith(".proposals.csv"):
+                continue
+            try:
+                table[csv.stem] = _csv_io.read_named(csv)
+            except (OSError, UnicodeDecodeError, ValueError) as ex:
+                errors.append((str(csv), f"{type(ex).__name__}: {ex}"))
+        tables.append(table)
+
+    models = sorted(set().union(*tables))
+    if names is None:
+        names = list(
+            dict.fromkeys(name for table in tables
+                          for (names_, _) in table.values()
+                          for name in names_))  # yapf: disable
+    columns = {name: i for (i, name) in enumerate(names)}
+    points = np.full((len(folders), len(models), len(names), 3), np.nan)
+    for (i, table) in enumerate(tables):
+        for (j, model) in enumerate(models):
+            if model not in table:
+                continue
+            ids, values = [], []
+            for (name, point) in zip(*table[model]):
+                if name in columns and point is not None:
+                    ids.append(columns[name])
+                    values.append(point)
+            points[i, j, ids] = np.array(values).reshape((-1, 3))
+
+    annotators = [i.name for i in folders]
+    if len(set(annotators)) < len(annotators):
+        annotators = [str(i) for i in folders]
+    return Annotations(folders, annotators, models, names, points, errors)
+
+
+def _nanmean(x, axis):
+    """Like :func:`numpy.nanmean` but without warnings for all NaN slices."""
+    valid = ~np.isnan(x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid, x, 0).sum(axis) / valid.sum(axis)
+
+
+def _nanmedian(x, axis):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(x, axis)
+
+
+def pairwise_distance(points):
+    """Get the mean distance between each pair of annotators' placements.
+
+    Args:
+        points (numpy.ndarray):
+            ``(annotators, ..., 3)`` placements.
+    Returns:
+        numpy.ndarray: ``(...)`` mean distances. NaN where fewer than two
+        annotators placed a landmark.
+
+    """
+    i, j = np.triu_indices(len(points), 1)
+    return _nanmean(np.linalg.norm(points[i] - points[j], axis=-1), 0)
+
+
+def _align(shapes, target, mask=True):
+    """Rotate and translate each of a batch of partial ``(n, landmarks, 3)``
+    shapes onto a partial ``(landmarks, 3)`` target, fitting only the
+    landmarks which both have (and **mask** allows) using Kabsch's algorithm.
+    Shapes with fewer than 3 landmarks to fit come out NaN."""
+    common = np.isfinite(shapes).all(-1) & np.isfinite(target).all(-1) & mask
+    weights = common[..., np.newaxis]
+    counts = common.sum(-1)[:, np.newaxis, np.newaxis]
+
+    def center(points):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(weights, points, 0).sum(1, keepdims=True) / counts
+
+    source_centers = center(shapes)
+    target_centers = center(target)
+    p = np.where(weights, shapes - source_centers, 0)
+    q = np.where(weights, target - target_centers, 0)
+    h = np.einsum("nli,nlj->nij", p, q)
+    u, _, vt = np.linalg.svd(np.nan_to_num(h))
+    # Never reflect.
+    flip = np.sign(np.linalg.det(u @ vt))
+    u[..., -1] *= np.where(flip == 0, 1, flip)[:, np.newaxis]
+    rotations = u @ vt
+    aligned = (shapes - source_centers) @ rotations + target_centers
+    aligned[counts[:, 0, 0] < 3] = np.nan
+    return aligned
+
+
+def _robust_align(shapes, target, passes=2):
+    """Like :func:`_align` but resistant to a few misplaced landmarks.
+
+    A least squares fit lets one badly misplaced landmark drag the whole shape
+    out of alignment, smearing its error over all the others. So refit
+    without each shape's worst fitting landmarks.
+
+    """
+    aligned = _align(shapes, target)
+    for _ in range(passes):
+        residuals = np.linalg.norm(aligned - target, axis=-1)
+        typical = _nanmedian(residuals, 1)[:, np.newaxis]
+        with np.errstate(invalid="ignore"):
+            aligned = _align(shapes, target, ~(residuals > 3 * typical))
+    return aligned
+
+
+def procrustes(points, iterations=20, tolerance=1e-6):
+    """Rigidly align many partial landmark sets to their mean shape.
+
+    Sizes are kept so that distances stay in model units.
+
+    Args:
+        points (numpy.ndarray):
+            ``(..., landmarks, 3)`` landmark sets with NaNs for missing
+            landmarks.
+    Returns:
+        (numpy.ndarray, numpy.ndarray): The aligned landmark sets (same shape
+        as **points**) and the ``(landmarks, 3)`` mean shape.
+
+    """
+    shapes = points.reshape((-1,) + points.shape[-2:])
+    if not len(shapes):
+        return points.copy(), np.full(points.shape[-2:], np.nan)
+    # Start from the most complete shape.
+    mean = shapes[np.isfinite(shapes).all(-1).sum(-1).argmax()]
+    mean = mean - _nanmean(mean, 0)
+    for _ in range(iterations):
+        aligned = _robust_align(shapes, mean)
+        # The median keeps a few misplaced landmarks from biasing the mean.
+        new = _nanmedian(aligned, 0)
+        # Pin the mean's position so that it can't drift.
+        new -= _nanmean(new, 0)
+        change = np.abs(new - mean)
+        # Landmarks gained or lost count as a big change.
+        change[np.isnan(new) != np.isnan(mean)] = np.inf
+        change = np.nan_to_num(change, nan=0).max(initial=0)
+        mean = new
+        if change < tolerance:
+            break
+    return _robust_align(shapes, mean).reshape(points.shape), mean
+
+
+def icc(points):
+    """Compute the ICC(2,1) of each landmark.
+
+    Models are the subjects and annotators the raters. Only models which
+    every annotator placed a landmark on count towards that landmark. The
+    coefficient is averaged over the x, y and z coordinates.
+
+    Args:
+        points (numpy.ndarray):
+            ``(annotators, models, landmarks, 3)`` placements (ideally
+            Procrustes aligned).
+    Returns:
+        numpy.ndarray: One ICC per landmark, NaN if fewer than two annotators
+        or two models.
+
+    """
+    k = len(points)
+    valid = np.isfinite(points).all(-1).all(0)[..., np.newaxis]
+    n = valid.sum(0)
+    y = np.where(valid, points, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grand = y.sum((0, 1)) / (n * k)
+        subjects = y.mean(0)
+        raters = y.sum(1) / n
+        ss_subjects = k * (valid * (subjects - grand)**2).sum(0)
+        ss_raters = n * ((raters - grand)**2).sum(0)
+        ss_total = (valid * (y - grand)**2).sum((0, 1))
+        ss_error = ss_total - ss_subjects - ss_raters
+        ms_subjects = ss_subjects / (n - 1)
+        ms_raters = ss_raters / (k - 1)
+        ms_error = ss_error / ((n - 1) * (k - 1))
+        out = (ms_subjects - ms_error) / (ms_subjects + (k - 1) * ms_error + k *
+                                          (ms_raters - ms_error) / n)
+    out = out.mean(-1)
+    out[(n[:, 0] < 2) | (k < 2)] = np.nan
+    return out
+
+
+def outlier_scores(distances, min_scale=.1):
+    """Score distances from a mean shape relative to the typical (median)
+    distance of each landmark.
+
+    A score of 4 means four times further from the mean shape than the typical
+    placement of that landmark. Distances (being vector norms) are heavily
+    right skewed so this is much less trigger happy than a z-score.
+
+    Args:
+        distances (numpy.ndarray):
+            ``(..., landmarks)`` distances.
+        min_scale (float):
+            A floor for each landmark's typical distance so that landmarks
+            which are placed almost identically every time don't turn
+            negligible deviations into huge scores.
+    Returns:
+        numpy.ndarray: Scores of the same shape as **distances**.
+
+    """
+    flat = distances.reshape((-1, distances.shape[-1]))
+    with np.errstate(invalid="ignore"):
+        return distances / np.fmax(_nanmedian(flat, 0), min_scale)
+
+
+def _finite(x):
+    """Make a number JSON friendly."""
+    return float(x) if np.isfinite(x) else None
+
+
+def analyse(annotations, tolerance=1., threshold=4., dataset=None):
+    """Measure agreement and flag suspicious placements.
+
+    Args:
+        annotations (Annotations):
+            See :func:`load`.
+        tolerance (float):
+            Flag placements further than this from the annotators' mean.
+        threshold (float):
+            Flag placements whose outlier score (see :func:`outlier_scores`)
+            exceeds this.
+        dataset:
+            The folder of models, used to link each model in the report to
+            its file. Defaults to looking in the annotators' folders.
+    Returns:
+        dict: A JSON serialisable report. ``"landmarks"`` gives each
+        landmark's ``"icc"``, ``"mean_distance"`` and number ``"placed"``.
+        ``"models"`` gives each model's ``"path"`` and ``"flags"``: a list of
+        ``{"annotator", "landmark", "kind", "value"}`` where **kind** is
+        ``"disagreement"`` (**value** is the distance from the annotators'
+        mean) or ``"outlier"`` (**value** is the outlier score).
+
+    """
+    points = annotations.points
+    disagreement = np.linalg.norm(points - _nanmean(points, 0), axis=-1)
+    aligned, mean = procrustes(points)
+    scores = outlier_scores(np.linalg.norm(aligned - mean, axis=-1))
+    mean_distance = _nanmean(pairwise_distance(points), 0)
+    agreement = icc(aligned)
+    placed = np.isfinite(points).all(-1).sum((0, 1))
+
+    flags = [[] for _ in annotations.models]
+    for (kind, values, limit) in [("disagreement", disagreement, tolerance),
+                                  ("outlier", scores, threshold)]:
+        with np.errstate(invalid="ignore"):
+            hits = np.nonzero(values > limit)
+        for (i, j, k) in zip(*hits):
+            flags[j].append({
+                "annotator": annotations.annotators[i],
+                "landmark": annotations.names[k],
+                "kind": kind,
+                "value": float(values[i, j, k]),
+            })
+
+    folders = [dataset] if dataset is not None else []
+    paths = {}
+    for folder in folders or annotations.folders:
+        for path in _dataset.model_paths(folder):
+            paths.setdefault(_dataset.model_name(path), str(path))
+
+    return {
+        "annotators": annotations.annotators,
+        "tolerance": tolerance,
+        "threshold": threshold,
+        "landmarks": [{
+            "name": name,
+            "icc": _finite(agreement[i]),
+            "mean_distance": _finite(mean_distance[i]),
+            "placed": int(placed[i]),
+        } for (i, name) in enumerate(annotations.names)],
+        "models": [{
+            "model": model,
+            "path": paths.get(model),
+            "flags": flags[i],
+        } for (i, model) in enumerate(annotations.models)],
+        "errors": annotations.errors,
+    }
+
+
+def write_report(path, report):
+    _batch.write_text(path, json.dumps(report, indent=1))
+
+
+def read_report(path):
+    """Read a report written by :func:`write_report`.
+
+    Raises:
+        ValueError: If the file isn't a report.
+
+    """
+    report = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(report, dict) or "models" not in report:
+        raise ValueError(f"{path} is not an agreement report.")
+    return report
+
+
+def format_flag(flag):
+    if flag["kind"] == "disagreement":
+        return (f"{flag['landmark']} by {flag['annotator']} is "
+                f"{flag['value']:.2f} from the other annotators")
+    return (f"{flag['landmark']} by {flag['annotator']} is an outlier "
+            f"(score {flag['value']:.1f})")
+
+
+def format_report(report):
+    """Format a report as a table of landmarks then a list of flagged
+    models."""
+    def number(x, format):
+        return "-" if x is None else format.format(x)
+
+    width = max([len(i["name"]) for i in report["landmarks"]] + [8])
+    lines = [f"{'Landmark':<{width}}     ICC  Distance  Placed"]
+    for landmark in report["landmarks"]:
+        lines.append(f"{landmark['name']:<{width}}  "
+                     f"{number(landmark['icc'], '{:.3f}'):>6}  "
+                     f"{number(landmark['mean_distance'], '{:.3f}'):>8}  "
+                     f"{landmark['placed']:>6}")
+    flagged = [i for i in report["models"] if i["flags"]]
+    for model in flagged:
+        lines.append(f"FLAG  {model['model']}")
+        lines.extend(f"      {format_flag(i)}" for i in model["flags"])
+    for (csv, message) in report["errors"]:
+        lines.append(f"ERROR {csv}: {message}")
+    lines.append(f"{len(flagged)}/{len(report['models'])} models flagged.")
+    return "\n".join(lines)
@@ -0,0 +1,55 @@
+"""Shared machinery for the headless batch jobs (see :mod:`_cli`)."""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+
+def imap(function, items, jobs=None, initializer=None, initargs=(),
+         chunksize=4):
+    """Apply a function to each item using a process pool.
+
+    Args:
+        function:
+            A picklable (i.e. module level) function taking one argument.
+        items:
+            The arguments to pass to **function**.
+        jobs:
+            The number of processes. Defaults to one per CPU. If 1, run in this
+            process instead (useful for debugging).
+        initializer:
+            A function to run once in each process before any work is done
+            (e.g. to load something which every item needs).
+        initargs:
+            Arguments for **initializer**.
+    Yields:
+        The results, in the same order as **items**, as soon as each is ready.
+
+    """
+    if jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(function, items)
+        return
+    with ProcessPoolExecutor(jobs, initializer=initializer,
+                             initargs=initargs) as pool:
+        yield from pool.map(function, items, chunksize=chunksize)
+
+
+def write_text(path, text):
+    """Overwrite a text file atomically so that an interrupted batch job can
+    never leave a half written file behind."""
+    write_bytes(path, text.encode("utf-8"))
+
+
+def write_bytes(path, data):
+    """Overwrite a binary file atomically. See :func:`write_text`."""
+    path = os.fspath(path)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+    except BaseException:  # pragma: no cover
+        os.remove(temp)
+        raise
@@ -0,0 +1,276 @@
+"""A scrollable grid of thumbnails of every model in a dataset, colored by how
+complete each model's landmarks are. Double clicking a tile opens that model.
+
+Only tiles which are scrolled into view are rendered. Rendering is done by
+:func:`_snapshots.thumbnail` in a small pool of background processes (VTK is
+not thread safe so it's kept out of the GUI process altogether) and cached on
+disk by model contents so that each model is only ever rendered once. Only a
+bounded number of thumbnails are held in memory so that browsing 10k models
+doesn't eat 10k thumbnails' worth of RAM.
+
+"""
+
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5 import QtWidgets, QtCore, QtGui
+
+from tomial_clicky_tooth import _csv_io, _dataset, _snapshots
+from tomial_clicky_tooth._colors import Colors
+from tomial_clicky_tooth._timing import timed
+
+
+def completion(model):
+    """Count a model's placed landmarks.
+
+    Returns:
+        A ``(placed, total)`` pair or None if the model has no landmarks file.
+
+    """
+    csv = _dataset.csv_path(model)
+    try:
+        points = _csv_io.read(csv)
+    except (OSError, UnicodeDecodeError, ValueError):
+        return None
+    return sum(i is not None for i in points), len(points)
+
+
+class StatusColors:
+    COMPLETE = QtGui.QColor(90, 170, 90)
+    PARTIAL = QtGui.QColor(220, 170, 60)
+    PROPOSED = QtGui.QColor(110, 150, 210)
+
+
+class ThumbnailModel(QtCore.QAbstractListModel):
+    """A list of models, their thumbnails and their completion statuses.
+
+    Thumbnails are only loaded when asked for via :meth:`request`.
+
+    Args:
+        paths:
+            Model filenames.
+        size:
+            Thumbnail ``(width, height)`` in pixels.
+        jobs:
+            The number of rendering processes.
+        capacity:
+            The maximum number of thumbnails to hold in memory.
+
+    """
+    def __init__(self, paths, size=(160, 120), jobs=2, capacity=1000,
+                 parent=None):
+        super().__init__(parent)
+        self.paths = list(paths)
+        self.size = size
+        self.jobs = jobs
+        self.capacity = capacity
+        self._rows = {path: i for (i, path) in enumerate(self.paths)}
+        # Least recently requested first.
+        self._thumbnails = collections.OrderedDict()
+        # Loads submitted to the executor...
+        self._pending = {}
+        # ...and those waiting their turn.
+        self._queue = collections.deque()
+        self._statuses = {}
+        self._executor = None
+        self._thumbnail_ready.connect(self._thumbnail_ready_cb)
+
+        self.placeholder = QtGui.QPixmap(*size)
+        self.placeholder.fill(QtGui.QColor(*Colors.BACKGROUND))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        path = self.paths[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return _dataset.model_name(path)
+        if role == QtCore.Qt.DecorationRole:
+            return self._thumbnails.get(path) or self.placeholder
+        if role == QtCore.Qt.ToolTipRole:
+            return f"{_dataset.model_name(path)}: {self.status_text(path)}"
+        if role == QtCore.Qt.BackgroundRole:
+            status = self.status(path)
+            if status == "proposed":
+                return QtGui.QBrush(StatusColors.PROPOSED)
+            if status is not None:
+                placed, total = status
+                if total and placed == total:
+                    return QtGui.QBrush(StatusColors.COMPLETE)
+                if placed:
+                    return QtGui.QBrush(StatusColors.PARTIAL)
+        return None
+
+    def status(self, path):
+        """Get a model's :func:`completion`, or ``"proposed"`` if it has
+        unreviewed proposals (see :mod:`_registration`) but no landmarks.
+
+        Statuses are re-read whenever the landmarks file changes.
+
+        """
+        csv = _dataset.csv_path(path)
+        try:
+            mtime = csv.stat().st_mtime
+        except OSError:
+            mtime = None
+        if path not in self._statuses or self._statuses[path][0] != mtime:
+            if mtime is None:
+                status = "proposed" if _dataset.proposals_path(path).exists() \
+                    else None
+            else:
+                status = completion(path)
+            self._statuses[path] = (mtime, status)
+        return self._statuses[path][1]
+
+    def status_text(self, path):
+        status = self.status(path)
+        if status is None:
+            return "not started"
+        if status == "proposed":
+            return "proposals only"
+        return "{}/{} landmarks".format(*status)
+
+    def request(self, rows):
+        """Load the thumbnails for some rows, abandoning any other pending
+        loads (i.e. for rows which have since been scrolled past)."""
+        wanted = [self.paths[i] for i in rows if 0 <= i < len(self.paths)]
+        for path in list(self._pending):
+            if path not in wanted and self._pending[path].cancel():
+                del self._pending[path]
+        self._queue.clear()
+        for path in wanted:
+            if path in self._thumbnails:
+                self._thumbnails.move_to_end(path)
+            elif path not in self._pending:
+                self._queue.append(path)
+        self._submit()
+
+    def _submit(self):
+        # A ProcessPoolExecutor moves submitted work into its call queue
+        # straight away, after which it can't be cancelled. Only give it as
+        # much as it can work on at once so that abandoning the rest works.
+        while self._queue and len(self._pending) < self.jobs:
+            path = self._queue.popleft()
+            if self._executor is None:
+                # Forking a process which has Qt and OpenGL initialised is
+                # asking for trouble.
+                self._executor = ProcessPoolExecutor(
+                    self.jobs, mp_context=multiprocessing.get_context("spawn"))
+            future = self._executor.submit(_snapshots.thumbnail, path,
+                                           self.size)
+            self._pending[path] = future
+            future.add_done_callback(
+                lambda future, path=path: self._emit_ready(path, future))
+
+    # Emitted from an executor thread but handled in the main thread.
+    _thumbnail_ready = QtCore.pyqtSignal(object, object)
+
+    def _emit_ready(self, path, future):
+        try:
+            self._thumbnail_ready.emit(path, future)
+        except RuntimeError:
+            # This model was deleted whilst the thumbnail was rendering.
+            pass
+
+    def _thumbnail_ready_cb(self, path, future):
+        if self._pending.get(path) is not future or future.cancelled():
+            return
+        del self._pending[path]
+        self._submit()
+        pixmap = QtGui.QPixmap()
+        with timed("load thumbnail"):
+            try:
+                pixmap.loadFromData(future.result(), "PNG")
+            except Exception:
+                # Leave unreadable models as placeholders rather than
+                # retrying them over and over.
+                pixmap = self.placeholder
+        self._thumbnails[path] = pixmap
+        while len(self._thumbnails) > self.capacity:
+            self._thumbnails.popitem(last=False)
+        index = self.index(self._rows[path])
+        self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+    @property
+    def pending(self):
+        return len(self._pending) + len(self._queue)
+
+    def shutdown(self):
+        """Stop the rendering processes."""
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._queue.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class DatasetBrowser(QtWidgets.QListView):
+    """A grid of :class:`ThumbnailModel` tiles.
+
+    Emits :attr:`model_chosen` with a model's filename when its tile is double
+    clicked.
+
+    """
+    model_chosen = QtCore.pyqtSignal(object)
+
+    def __init__(self, paths, size=(160, 120), jobs=2, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Dataset")
+        self.setModel(ThumbnailModel(paths, size, jobs, parent=self))
+        self.setViewMode(QtWidgets.QListView.IconMode)
+        self.setMovement(QtWidgets.QListView.Static)
+        self.setResizeMode(QtWidgets.QListView.Adjust)
+        self.setUniformItemSizes(True)
+        self.setVerticalScrollMode(QtWidgets.QListView.ScrollPerPixel)
+        self.setIconSize(QtCore.QSize(*size))
+        # A fixed grid makes working out which tiles are visible trivial.
+        self.setGridSize(QtCore.QSize(size[0] + 16, size[1] + 32))
+        self.resize(6 * (size[0] + 16) + 40, 4 * (size[1] + 32))
+
+        self.doubleClicked.connect(self._double_clicked_cb)
+
+        # Wait for scrolling to settle before requesting thumbnails.
+        self._timer = QtCore.QTimer(self, singleShot=True, interval=50,
+                                    timeout=self.request_visible)
+        self.verticalScrollBar().valueChanged.connect(self._timer.start)
+
+    def _double_clicked_cb(self, index):
+        self.model_chosen.emit(self.model().paths[index.row()])
+
+    def visible_rows(self):
+        """The range of rows which are at least partially in view."""
+        grid = self.gridSize()
+        viewport = self.viewport().rect()
+        columns = max(viewport.width() // grid.width(), 1)
+        top = self.verticalScrollBar().value() // grid.height()
+        bottom = (self.verticalScrollBar().value() + viewport.height()) \
+            // grid.height()
+        return range(top * columns,
+                     min((bottom + 1) * columns,
+                         self.model().rowCount()))
+
+    def request_visible(self):
+        self.model().request(self.visible_rows())
+
+    def scroll_to(self, path):
+        """Select and scroll to a model's tile."""
+        row = self.model()._rows.get(path)
+        if row is not None:
+            index = self.model().index(row)
+            self.setCurrentIndex(index)
+            self.scrollTo(index, QtWidgets.QListView.PositionAtCenter)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._timer.start()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._timer.start()
+
+    def closeEvent(self, event):
+        self.model().shutdown()
+        super().closeEvent(event)
@@ -0,0 +1,151 @@
+"""Persistent on-disk caching of results which are expensive to derive from a
+file but cheap to store.
+
+Entries are keyed by a hash of the source file's contents so that a cached
+result is never served for a file which has since changed. The cache lives in
+the platform's usual per-user cache directory unless overridden via the
+``TOMIAL_CLICKY_TOOTH_CACHE`` environment variable. Caching is strictly
+opportunistic - failing to read or write the cache is never an error.
+
+"""
+
+import io
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+CACHE_ENV = "TOMIAL_CLICKY_TOOTH_CACHE"
+
+
+def cache_root():
+    """The directory under which all caches are stored."""
+    if os.environ.get(CACHE_ENV):
+        return Path(os.environ[CACHE_ENV])
+    if sys.platform == "win32":  # pragma: no cover
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData/Local"
+    elif sys.platform == "darwin":  # pragma: no cover
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "tomial_clicky_tooth"
+
+
+def hash_bytes(data):
+    """Hash an in-memory blob of bytes into a cache key."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class Cache:
+    """A namespaced key/value store of files in the cache directory.
+
+    Args:
+        name:
+            A sub-directory name grouping similar entries.
+        version:
+            Bump this whenever the format of the stored values changes so that
+            stale entries are ignored rather than misinterpreted.
+        max_size:
+            If given, the total size in bytes which :meth:`prune` trims this
+            cache down to.
+
+    """
+    def __init__(self, name, version=1, max_size=None):
+        self.name = name
+        self.version = version
+        self.max_size = max_size
+
+    @property
+    def root(self):
+        # Deliberately re-evaluated each time so that changing the environment
+        # variable takes effect immediately.
+        return cache_root() / self.name
+
+    def path(self, key, suffix):
+        return self.root / f"{key}-v{self.version}{suffix}"
+
+    def read_bytes(self, key, suffix):
+        """Read a raw cache entry or return None if there isn't one."""
+        path = self.path(key, suffix)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        if self.max_size is not None:
+            # Mark it as recently used so that prune() keeps it.
+            try:
+                os.utime(path)
+            except OSError:  # pragma: no cover
+                pass
+        return data
+
+    def write_bytes(self, key, suffix, data):
+        """Write a raw cache entry atomically so that concurrent readers in
+        other processes never see a partially written file."""
+        path = self.path(key, suffix)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        except OSError:  # pragma: no cover
+            return False
+        return True
+
+    def read_json(self, key):
+        data = self.read_bytes(key, ".json")
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def write_json(self, key, value):
+        return self.write_bytes(key, ".json", json.dumps(value).encode())
+
+    def read_array(self, key):
+        data = self.read_bytes(key, ".npy")
+        if data is None:
+            return None
+        try:
+            return np.load(io.BytesIO(data), allow_pickle=False)
+        except (ValueError, EOFError):
+            return None
+
+    def write_array(self, key, array):
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return self.write_bytes(key, ".npy", buffer.getvalue())
+
+    def prune(self):
+        """Delete the least recently used entries until this cache takes up
+        no more than **max_size** bytes."""
+        if self.max_size is None:
+            return
+        try:
+            entries = [(i.stat().st_mtime, i.stat().st_size, i.path)
+                       for i in os.scandir(self.root)
+                       if not i.name.endswith(".tmp")]
+        except OSError:
+            return
+        total = 0
+        for (_, size, path) in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_size:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Another process got there first.
+                    pass
+
+    def clear(self):
+        """Delete every entry in this cache."""
+        if self.root.is_dir():
+            for path in self.root.iterdir():
+                os.remove(path)
@@ -0,0 +1,244 @@
+"""Weld a model's vertices and drop its degenerate and duplicate triangles.
+
+Cleaned meshes are cached against the model's triangles as ``.mesh.gz`` files
+(see :mod:`_meshfile`). The least recently used are pruned once the cache
+exceeds :attr:`CACHE_SIZE` bytes. motmot widens faces to ``intp`` so the real
+saving is that VTK gets about a sixth as many points as from an STL.
+
+"""
+
+import numpy as np
+
+from tomial_clicky_tooth import _batch, _cache, _dataset, _meshfile
+
+#: The most disk space, in bytes, which cached cleaned meshes may take up.
+CACHE_SIZE = 1 << 30
+
+_cleaning_cache = _cache.Cache("cleaning", version=3, max_size=CACHE_SIZE)
+
+
+def index_dtype(count):
+    """The smallest unsigned integer type able to index **count** items."""
+    for dtype in (np.uint16, np.uint32):
+        if count <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def nbytes(mesh):
+    """How much memory a mesh's geometry takes up, in bytes."""
+    if mesh.is_faces_mesh:
+        return mesh.vertices.nbytes + mesh.faces.nbytes
+    return mesh.vectors.nbytes
+
+
+def weld(vectors, tolerance=0.):
+    """Merge triangle corners at the same position into shared vertices.
+
+    Args:
+        vectors (numpy.ndarray):
+            A ``(n, 3, 3)`` array of triangles.
+        tolerance (float):
+            If non-zero, also merge corners which round to the same point on a
+            grid of this spacing. The first such corner's position is kept.
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The unique vertices, in order of
+        first use, and the ``(n, 3)`` faces indexing them.
+
+    """
+    points = np.ascontiguousarray(vectors).reshape((-1, 3))
+    # Adding zero normalises -0.0 to 0.0 so that the two compare equal
+    # bytewise.
+    keys = (np.round(points / tolerance) if tolerance else points) + 0.
+    keys = np.ascontiguousarray(keys)
+    rows = keys.view(np.dtype((np.void, keys.itemsize * 3))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    # np.unique() sorts. Renumber in order of first use to keep neighbouring
+    # triangles' vertices close together in memory.
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return points[first[order]], rank[inverse.ravel()].reshape((-1, 3))
+
+
+def clean(mesh, tolerance=0.):
+    """Weld a mesh's vertices and remove its degenerate and duplicate
+    triangles.
+
+    Args:
+        mesh (motmot.Mesh):
+            The mesh to clean. It isn't modified.
+        tolerance (float):
+            See :func:`weld`.
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray, dict]: The vertices, the faces (of
+        type :func:`index_dtype`) and a report with keys ``"triangles"`` (the
+        original count), ``"degenerate"`` and ``"duplicates"`` (how many
+        triangles were dropped for each reason), ``"vertices"`` (how many are
+        left) and ``"before"`` and ``"after"`` (the geometry's size in memory,
+        in bytes, as a :class:`motmot.Mesh`, see :func:`nbytes`).
+
+    """
+    vectors = np.asarray(mesh.vectors)
+    vertices, faces = weld(vectors, tolerance)
+
+    collapsed = (faces == np.roll(faces, 1, axis=1)).any(axis=1)
+    corners = vertices[faces]
+    flat = ~np.cross(corners[:, 1] - corners[:, 0],
+                     corners[:, 2] - corners[:, 0]).any(axis=1)
+    degenerate = collapsed | flat
+    faces = faces[~degenerate]
+
+    # Sorting each face's vertex ids makes reversed or rotated copies equal.
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    first.sort()
+    duplicates = len(faces) - len(first)
+    faces = faces[first]
+
+    used, faces = np.unique(faces, return_inverse=True)
+    vertices = vertices[used]
+    faces = faces.reshape((-1, 3)).astype(index_dtype(len(vertices)))
+
+    report = {
+        "triangles": len(vectors),
+        "degenerate": int(np.count_nonzero(degenerate)),
+        "duplicates": int(duplicates),
+        "vertices": len(vertices),
+        "before": nbytes(mesh),
+        # motmot holds faces as intp, however compactly they're stored.
+        "after": vertices.nbytes + faces.size * np.dtype(np.intp).itemsize,
+    }
+    return vertices, faces, report
+
+
+def load(mesh, tolerance=0.):
+    """Clean a mesh, or fetch its cleaned form from the cache.
+
+    Args:
+        mesh (motmot.Mesh):
+            The mesh to clean.
+        tolerance (float):
+            See :func:`weld`.
+    Returns:
+        tuple[motmot.Mesh, dict]: The cleaned mesh and the report from
+        :func:`clean`.
+
+    """
+    from motmot import Mesh
+
+    key = _cache.hash_bytes(
+        np.asarray(mesh.vectors).tobytes() + repr(float(tolerance)).encode())
+    report = _cleaning_cache.read_json(key)
+    data = _cleaning_cache.read_bytes(key, ".mesh.gz")
+    cleaned = None
+    if report is not None and data is not None:
+        try:
+            cleaned = _meshfile.decode(data, ".mesh.gz")
+        except (OSError, EOFError, ValueError):
+            pass
+    if cleaned is None:
+        vertices, faces, report = clean(mesh, tolerance)
+        cleaned = Mesh(vertices, faces)
+        _cleaning_cache.write_bytes(key, ".mesh.gz",
+                                    _meshfile.encode(cleaned, ".mesh.gz", 1))
+        _cleaning_cache.write_json(key, report)
+        _cleaning_cache.prune()
+    cleaned.path = mesh.path
+    return cleaned, report
+
+
+def _load_model(args):
+    (model, tolerance) = args
+    report = {"model": str(model), "errors": []}
+    try:
+        report.update(load(_dataset.read_mesh(model), tolerance)[1])
+    except Exception as ex:
+        report["errors"].append(("unreadable", f"{type(ex).__name__}: {ex}"))
+    return report
+
+
+def clean_dataset(root, tolerance=0., jobs=None):
+    """Clean every model in a dataset directory, filling the cache.
+
+    Args:
+        root:
+            The dataset directory.
+        tolerance:
+            See :func:`weld`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Yields:
+        dict: A report (see :func:`clean`) per model, in order, with extra
+        keys ``"model"`` and ``"errors"`` (a list of ``(kind, message)``
+        pairs). An unreadable model's report has only those two keys.
+
+    """
+    yield from _batch.imap(
+        _load_model, [(i, tolerance) for i in _dataset.model_paths(root)], jobs)
+
+
+def _megabytes(size):
+    return f"{size / 1e6:.2f} MB"
+
+
+class Summary:
+    """Aggregate cleaning reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.triangles = 0
+        self.degenerate = 0
+        self.duplicates = 0
+        self.before = 0
+        self.after = 0
+        self.errors = 0
+
+    def add(self, report):
+        self.models += 1
+        self.errors += len(report["errors"])
+        if "before" in report:
+            self.triangles += report["triangles"]
+            self.degenerate += report["degenerate"]
+            self.duplicates += report["duplicates"]
+            self.before += report["before"]
+            self.after += report["after"]
+
+    def to_dict(self):
+        return {
+            "models": self.models,
+            "triangles": self.triangles,
+            "degenerate": self.degenerate,
+            "duplicates": self.duplicates,
+            "before": self.before,
+            "after": self.after,
+            "errors": self.errors,
+        }
+
+    def __str__(self):
+        lines = [
+            f"{self.models} models, {self.degenerate}/{self.triangles} "
+            f"degenerate and {self.duplicates} duplicate triangles removed.",
+            f"Total size: {_megabytes(self.before)} -> "
+            f"{_megabytes(self.after)} "
+            f"({_megabytes(self.before - self.after)} saved)",
+        ]
+        if self.errors:
+            lines.append(f"{self.errors} errors.")
+        return "\n".join(lines)
+
+
+def format_report(report):
+    """Format a report as one line per model (plus one per error)."""
+    name = _dataset.model_name(report["model"])
+    lines = [f"{name}: unreadable"]
+    if "before" in report:
+        lines = [
+            f"{name}: {report['triangles']} triangles -> "
+            f"{report['vertices']} vertices, "
+            f"{report['degenerate']} degenerate, "
+            f"{report['duplicates']} duplicates, "
+            f"{_megabytes(report['before'])} -> "
+            f"{_megabytes(report['after'])}"
+        ]
+    return "\n".join(
+        lines +
+        [f"    {kind}: {message}" for (kind, message) in report["errors"]])
@@ -0,0 +1,510 @@
+"""Headless batch commands, ran as ``python -m tomial_clicky_tooth <command>``.
+
+Running ``python -m tomial_clicky_tooth`` without a command (or with a model
+filename) launches the UI instead. Nothing here may import Qt.
+
+"""
+
+import sys
+import json
+import argparse
+
+
+def validate(options):
+    from tomial_clicky_tooth import _validation
+
+    summary = _validation.Summary()
+    reports = _validation.validate_dataset(options.dataset, options.template,
+                                           options.primary, options.optional,
+                                           options.jobs)
+    for report in reports:
+        summary.add(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        elif report["errors"] or not options.quiet:
+            print(_validation.format_report(report), flush=True)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict()}))
+    else:
+        print(summary)
+    return 1 if summary.invalid else 0
+
+
+def _validate_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--template", required=True,
+        help="A landmarks template YAML file or the name of a bundled one "
+        "(e.g. MHB).")
+    parser.add_argument("--primary", action="store_true",
+                        help="The models are of deciduous teeth.")
+    parser.add_argument("--optional", nargs="*", default=[], metavar="NAME",
+                        help="Landmarks which may be left unset.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="Only list models with errors.")
+
+
+def snap(options):
+    from tomial_clicky_tooth import _snapping
+
+    summary = _snapping.Summary()
+    reports = _snapping.snap_dataset(options.dataset, options.write,
+                                     options.max_distance, options.tolerance,
+                                     options.jobs)
+    for report in reports:
+        summary.add(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        else:
+            print(_snapping.format_report(report), flush=True)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict()}))
+    else:
+        print(summary)
+    return 1 if summary.errors else 0
+
+
+def _snap_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--write", action="store_true",
+        help="Overwrite the CSVs with the snapped landmarks. "
+        "Otherwise just report how far they would move.")
+    parser.add_argument(
+        "--max-distance", type=float,
+        help="Leave landmarks further than this from the surface unmoved and "
+        "report them as errors.")
+    parser.add_argument(
+        "--tolerance", type=float, default=1e-6,
+        help="Don't rewrite CSVs whose landmarks move less than this.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+
+
+def migrate(options):
+    from tomial_clicky_tooth import _migration
+
+    summary = _migration.Summary()
+    reports = _migration.migrate_dataset(options.dataset, options.template,
+                                         options.primary, options.write,
+                                         options.drop, options.jobs)
+    for report in reports:
+        summary.add(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        elif report["changed"] or report["errors"] or not options.quiet:
+            print(_migration.format_report(report, options.diff), flush=True)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict()}))
+    else:
+        print(summary)
+    return 1 if summary.errors else 0
+
+
+def _migrate_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--template", required=True,
+        help="The new landmarks template YAML file or the name of a bundled "
+        "one (e.g. MHB).")
+    parser.add_argument("--primary", action="store_true",
+                        help="The models are of deciduous teeth.")
+    parser.add_argument(
+        "--write", action="store_true",
+        help="Overwrite the CSVs with the remapped landmarks. "
+        "Otherwise just report what would change.")
+    parser.add_argument(
+        "--drop", action="store_true",
+        help="Allow discarding placed landmarks which the "
+        "template no longer has.")
+    parser.add_argument("--diff", action="store_true",
+                        help="Show a diff of each CSV's changes.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="Only list CSVs which need changing.")
+
+
+def recompress(options):
+    from tomial_clicky_tooth import _recompression
+
+    summary = _recompression.Summary()
+    reports = _recompression.recompress_dataset(options.dataset, options.write,
+                                                options.repeats, options.jobs)
+    for report in reports:
+        summary.add(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        else:
+            print(_recompression.format_report(report), flush=True)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict()}))
+    else:
+        print(summary)
+    return 1 if summary.errors else 0
+
+
+def _recompress_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--write", action="store_true",
+        help="Replace models with their fastest decoding "
+        "format. Otherwise just benchmark.")
+    parser.add_argument(
+        "--repeats", type=int, default=3,
+        help="Decode each format this many times and keep the "
+        "fastest time. Defaults to 3.")
+    parser.add_argument(
+        "--jobs", "-j", type=int,
+        help="Number of processes. Defaults to one per CPU. "
+        "Use 1 for the most reliable timings.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+
+
+def scan(options):
+    from tomial_clicky_tooth import _scan
+
+    report = _scan.scan_dataset(options.dataset, options.tolerance,
+                                options.jobs)
+    if options.json:
+        print(json.dumps(report))
+    else:
+        print(_scan.format_report(report))
+    broken = any(i["errors"] for i in report["models"])
+    return 1 if broken or report["duplicates"] else 0
+
+
+def _scan_parser(parser):
+    parser.add_argument("dataset", help="A folder of models.")
+    parser.add_argument(
+        "--tolerance", type=float, default=.02,
+        help="Report models whose shapes differ by less than this fraction "
+        "as near duplicates. Defaults to 0.02.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output the report as JSON.")
+
+
+def clean(options):
+    from tomial_clicky_tooth import _cleaning
+
+    summary = _cleaning.Summary()
+    reports = _cleaning.clean_dataset(options.dataset, options.tolerance,
+                                      options.jobs)
+    for report in reports:
+        summary.add(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        else:
+            print(_cleaning.format_report(report), flush=True)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict()}))
+    else:
+        print(summary)
+    return 1 if summary.errors else 0
+
+
+def _clean_parser(parser):
+    parser.add_argument("dataset", help="A folder of models.")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.,
+        help="Also weld vertices which round to the same point on a grid of "
+        "this spacing. Defaults to only welding exact copies.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+
+
+def propose(options):
+    from tomial_clicky_tooth import _registration
+
+    summary = _registration.Summary()
+    reports = _registration.propose_dataset(options.dataset, options.reference,
+                                            options.affine, options.overwrite,
+                                            options.jobs)
+    for report in reports:
+        summary.add(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        elif not report["skipped"] or not options.quiet:
+            print(_registration.format_report(report), flush=True)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict()}))
+    else:
+        print(summary)
+    return 1 if summary.errors else 0
+
+
+def _propose_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--reference", required=True, nargs="+", metavar="MODEL",
+        help="Models with landmarks to register onto each model. Each model "
+        "uses the reference of the same arch type.")
+    parser.add_argument(
+        "--affine", action="store_true",
+        help="Allow scaling and shearing, not just rotation "
+        "and translation.")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Recompute existing proposals.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="Don't list skipped models.")
+
+
+def review(options):
+    from tomial_clicky_tooth import _snapshots
+
+    summary = _snapshots.Summary()
+    reports = []
+    for report in _snapshots.review_dataset(
+            options.dataset, options.output, options.views, options.size,
+            not options.no_labels, options.overwrite, options.jobs):
+        summary.add(report)
+        reports.append(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+        else:
+            print(_snapshots.format_report(report), flush=True)
+    index = _snapshots.write_index(options.output, reports)
+    if options.json:
+        print(json.dumps({"summary": summary.to_dict(), "index": str(index)}))
+    else:
+        print(summary)
+        print(f"Review at {index}")
+    return 1 if summary.errors else 0
+
+
+def _review_parser(parser):
+    from tomial_clicky_tooth._snapshots import VIEWS, DEFAULT_VIEWS
+
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument("output",
+                        help="A folder to write snapshots and index.html to.")
+    parser.add_argument(
+        "--views", nargs="+", choices=VIEWS, default=DEFAULT_VIEWS,
+        help="Which preset camera views to render. Defaults to "
+        f"{' '.join(DEFAULT_VIEWS)}.")
+    parser.add_argument("--size", nargs=2, type=int, default=(800, 600),
+                        metavar=("WIDTH", "HEIGHT"),
+                        help="Snapshot size in pixels.")
+    parser.add_argument("--no-labels", action="store_true",
+                        help="Don't label landmarks with their names.")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Re-render snapshots even if they're up to date.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model then a summary.")
+
+
+def measure(options):
+    from tomial_clicky_tooth import _measurements, _batch
+
+    reports = _measurements.measure_dataset(options.dataset, options.template,
+                                            options.primary, options.jobs)
+    if options.json:
+        for report in reports:
+            print(json.dumps(report))
+    elif not options.output:
+        print(_measurements.table(reports), end="")
+    if options.output:
+        _batch.write_text(options.output, _measurements.table(reports))
+    errors = [(report["model"], *error) for report in reports
+              for error in report["errors"]]
+    if not options.json:
+        for (model, kind, message) in errors:
+            print(f"{model}: {kind}: {message}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def _measure_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--template", required=True,
+        help="A landmarks template YAML file or the name of a bundled one "
+        "(e.g. MHB) declaring some measurements.")
+    parser.add_argument("--primary", action="store_true",
+                        help="The models are of deciduous teeth.")
+    parser.add_argument(
+        "--output", "-o", help="Write the table of measurements to this CSV "
+        "file instead of printing it.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model.")
+
+
+def geodesic(options):
+    from tomial_clicky_tooth import _geodesics, _measurements, _batch
+
+    reports = []
+    for report in _geodesics.measure_dataset(options.dataset, options.pair,
+                                             options.jobs):
+        reports.append(report)
+        if options.json:
+            print(json.dumps(report), flush=True)
+    if options.output:
+        _batch.write_text(options.output, _measurements.table(reports))
+    elif not options.json:
+        print(_measurements.table(reports), end="")
+    errors = [(report["model"], *error) for report in reports
+              for error in report["errors"]]
+    if not options.json:
+        for (model, kind, message) in errors:
+            print(f"{model}: {kind}: {message}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def _geodesic_parser(parser):
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--pair", nargs=2, action="append", required=True,
+        metavar=("FROM", "TO"),
+        help="Landmark names to measure between. May be given repeatedly.")
+    parser.add_argument(
+        "--output", "-o", help="Write the table of distances to this CSV file "
+        "instead of printing it.")
+    parser.add_argument("--jobs", "-j", type=int,
+                        help="Number of processes. Defaults to one per CPU.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output a JSON line per model.")
+
+
+def agreement(options):
+    from tomial_clicky_tooth import _agreement
+
+    annotations = _agreement.load(options.annotators)
+    report = _agreement.analyse(annotations, options.tolerance,
+                                options.threshold, options.dataset)
+    if options.output:
+        _agreement.write_report(options.output, report)
+    if options.json:
+        print(json.dumps(report))
+    else:
+        print(_agreement.format_report(report))
+    flagged = any(i["flags"] for i in report["models"])
+    return 1 if flagged or report["errors"] else 0
+
+
+def _agreement_parser(parser):
+    parser.add_argument(
+        "annotators", nargs="+", metavar="FOLDER",
+        help="A folder of <model>.csv landmark files per annotator.")
+    parser.add_argument(
+        "--dataset",
+        help="The folder of models. Used to link models in the report to "
+        "their files. Defaults to looking in the annotators' folders.")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.,
+        help="Flag landmarks further than this (in model units, usually mm) "
+        "from the annotators' mean. Defaults to 1.")
+    parser.add_argument(
+        "--threshold", type=float, default=4.,
+        help="Flag landmarks which, after aligning all models, are this many "
+        "times further from the mean shape than is typical. Defaults to 4.")
+    parser.add_argument(
+        "--output", "-o",
+        help="Write the report as JSON to this file, which can be opened in "
+        "the UI.")
+    parser.add_argument("--json", action="store_true",
+                        help="Output the report as JSON.")
+
+
+def serve(options):
+    from tomial_clicky_tooth import _server
+
+    server = _server.serve(options.dataset, options.database, options.host,
+                           options.port, options.verbose)
+    print(f"Serving {options.dataset} at {server.url}", flush=True)
+    print(f"Storing landmarks in {server.store.path}", flush=True)
+    print(f"Launch the UI with {_server.SERVER_ENV}={server.url} to use it.",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def _serve_parser(parser):
+    from tomial_clicky_tooth._server import DEFAULT_PORT
+
+    parser.add_argument("dataset", help="A folder of models and CSVs.")
+    parser.add_argument(
+        "--database",
+        help="The SQLite database to store landmarks in. Must be on a local "
+        "disk. Defaults to one per dataset in the local cache directory.")
+    parser.add_argument(
+        "--host", default="localhost",
+        help="The address to listen on. Use 0.0.0.0 to accept connections "
+        "from other machines.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"Defaults to {DEFAULT_PORT}.")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="Log every request.")
+
+
+COMMANDS = {
+    "validate": (validate, _validate_parser,
+                 "Check each model's landmarks CSV against a template."),
+    "snap": (snap, _snap_parser,
+             "Move landmarks onto the closest point on their model's surface."),
+    "migrate": (migrate, _migrate_parser,
+                "Reorder each model's landmarks CSV by name to match a changed "
+                "template."),
+    "recompress": (recompress, _recompress_parser,
+                   "Convert models to whichever format decodes fastest and "
+                   "benchmark decoding before and after."),
+    "scan": (scan, _scan_parser,
+             "Find unreadable, degenerate and duplicated models."),
+    "clean": (clean, _clean_parser,
+              "Weld vertices and remove degenerate and duplicate triangles "
+              "from each model, caching the results (up to 1GB, least "
+              "recently used first out), and report the memory saved."),
+    "propose": (propose, _propose_parser,
+                "Precompute proposed landmarks for unannotated models by "
+                "registering reference models onto them."),
+    "review": (review, _review_parser,
+               "Render snapshots of each model and its landmarks for review."),
+    "measure": (measure, _measure_parser,
+                "Evaluate a template's measurements (distances, angles and "
+                "offsets between landmarks) for each model."),
+    "geodesic": (geodesic, _geodesic_parser,
+                 "Measure distances between landmarks along each model's "
+                 "surface."),
+    "agreement": (agreement, _agreement_parser,
+                  "Compare several annotators' landmarks and flag outliers."),
+    "serve": (serve, _serve_parser,
+              "Run a server so that several annotators can work on a dataset "
+              "at once without overwriting each other."),
+}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m tomial_clicky_tooth")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for (name, (_, setup, help)) in COMMANDS.items():
+        setup(subparsers.add_parser(name, help=help, description=help))
+    options = parser.parse_args(args)
+    return COMMANDS[options.command][0](options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
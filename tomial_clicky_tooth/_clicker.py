@@ -4,13 +4,11 @@
 import numpy as np
 from PyQt5 import QtWidgets, QtCore
 import vtkplotlib as vpl
-from motmot import Mesh
 
-
-class Colors:
-    BACKGROUND = (40, 80, 150)
-    MARKER = "black"
-    HIGHLIGHTED = (.9, 0, 0)
+from tomial_clicky_tooth import _resources
+from tomial_clicky_tooth._colors import Colors
+from tomial_clicky_tooth._dataset import read_model
+from tomial_clicky_tooth._timing import timed
 
 
 class InvalidModelError(Exception):
@@ -25,6 +23,8 @@ class ClickableFigure(vpl.QtFigure2):
     * The landmark markers are stored in the markers attribute or can be read or
       written in bulk via the landmarks property.
     * Landmark highlighting is controlled via the highlight() method.
+    * The shortest path along the surface between two points can be drawn via
+      the show_geodesic() method.
     * A marker placed or removed by user interaction emits a marker_changed
       signal with the removed marker (or None) and the newly placed marker (or
       None as arguments.
@@ -51,6 +51,21 @@ def __init__(self, key_generator=None):
         self.path = None
         self.mesh = None
         self.odometry = None
+        # Snap clicks to the nearest feature (see _features.py) within
+        # snap_radius. features is set externally once they've been found.
+        self.features = None
+        self.snap_to_features = False
+        self.snap_radius = 1.
+        # Render only the top crop_depth (or _cropping.DEFAULT_DEPTH if None)
+        # of the model along its occlusal axis (see _cropping.py). The cropped
+        # mesh is kept for as long as the model is open so that cropping can
+        # be toggled without recomputing it.
+        self.crop = False
+        self.crop_depth = None
+        self._cropped = None
+        # The model's edge graph for measuring geodesics. Built on first use.
+        self.graph = None
+        self.geodesic_plot = None
 
         self.markers = {}
         if key_generator is None:
@@ -67,31 +82,49 @@ def __init__(self, key_generator=None):
         self._reset_camera = False
 
     def _left_click_callback(self, pick: vpl.interactive.pick):
+        if self.mesh_plot is None:  # pragma: no cover
+            return
         if pick.actor is self.mesh_plot.actor:  # pragma: no branch
-            self.spawn_marker(pick.point)
+            point = pick.point
+            if self.snap_to_features and self.features is not None:
+                point = self.features.snap(point, self.snap_radius)
+            self.spawn_marker(point)
 
     def _right_click_callback(self, pick: vpl.interactive.pick):
         if pick.actor is not None:  # pragma: no branch
             marker = self._nearest_marker(np.array(pick.point))
             if marker is not None:
                 self._remove_marker(marker.key)
-                self.marker_changed.emit(marker, None)
+                with timed("marker_changed"):
+                    self.marker_changed.emit(marker, None)
 
-    def open_model(self, path):
+    def open_model(self, path, preloaded=None):
         """Open a model and pre-orientate it.
 
         Preserve any existing landmarks. Create an error pop-up dialog if the
         model can't be read.
 
+        Args:
+            path:
+                The model's filename.
+            preloaded:
+                An optional :class:`concurrent.futures.Future` wrapping a call
+                to :func:`read_model` for this **path** (typically ran in a
+                background thread). If not provided then the model is read
+                synchronously.
+
         """
         self.close_model()
         self.path = path if isinstance(path, Path) else Path(path)
 
         # Read the model directly from file
         try:
-            mesh = Mesh(path)
+            if preloaded is None:
+                mesh, odometry = read_model(self.path, clean=True)
+            else:
+                mesh, odometry = preloaded.result()
         except:
-            path = path.resolve()
+            path = self.path.resolve()
             QtWidgets.QMessageBox.critical(
                 self, "Invalid model file",
                 f'<a href="{path.as_uri()}">{path.name}</a> located in '
@@ -100,29 +133,70 @@ def open_model(self, path):
             raise InvalidModelError
 
         self.mesh = mesh
-        self.mesh_plot = vpl.mesh_plot(mesh, fig=self)
+        self.odometry = odometry
+        self._plot_mesh()
 
-        try:
-            # Just because we can...
-            # Automatically set the camera angle to the occlusal view and set
-            # the directions for the preset camera direction buttons so that
-            # the shark matches the patient.
-            from tomial_odometry import Odometry
-            from pangolin import arch_type
-
-            self.odometry = Odometry(mesh, arch_type(Path(self.path).stem))
+        if odometry is not None:
+            # Set the camera angle to the occlusal view and set the directions
+            # for the preset camera direction buttons so that the shark matches
+            # the patient.
             self.view_buttons.init_default()
             self.view_buttons.rotate(self.odometry.axes)
             vpl.view(camera_position=self.odometry.occlusal,
                      up_view=self.odometry.forwards, fig=self)
 
-        except:
-            pass
-
         self.reset_camera()
 
     marker_changed = QtCore.pyqtSignal(object, object)
 
+    def visible_mesh(self):
+        """The part of the model which is rendered: either the whole mesh or,
+        if :attr:`crop` is enabled and the model could be orientated, just its
+        top :attr:`crop_depth`."""
+        from tomial_clicky_tooth import _cropping
+
+        if not self.crop or self.odometry is None or self.mesh is None:
+            return self.mesh
+        depth = _cropping.DEFAULT_DEPTH if self.crop_depth is None \
+            else self.crop_depth
+        if self._cropped is None or self._cropped[0] != depth:
+            with timed("crop model"):
+                self._cropped = (depth,
+                                 _cropping.crop(self.mesh,
+                                                self.odometry.occlusal, depth))
+        return self._cropped[1]
+
+    def _plot_mesh(self):
+        """(Re)create the mesh's actor from :meth:`visible_mesh`."""
+        if self.mesh_plot is not None:
+            self -= self.mesh_plot
+        mesh = self.visible_mesh()
+        if mesh.is_faces_mesh:
+            # Share vertices between triangles rather than giving VTK three
+            # copies of each.
+            mesh = (mesh.vertices, mesh.faces)
+        with timed("create mesh actor"):
+            self.mesh_plot = _resources.track("mesh plots",
+                                              vpl.mesh_plot(mesh, fig=self))
+
+    def set_crop(self, crop=True, depth=None):
+        """Enable or disable rendering only the top of the model, keeping the
+        camera where it is.
+
+        Args:
+            crop (bool):
+                Crop or show the whole model.
+            depth (float):
+                Optionally change :attr:`crop_depth` too.
+
+        """
+        self.crop = crop
+        if depth is not None:
+            self.crop_depth = depth
+        if self.mesh is not None:
+            self._plot_mesh()
+            self.update()
+
     def close_model(self):
         """Close the model. Do nothing is there is no model to close."""
         if self.mesh_plot is not None:
@@ -131,7 +205,27 @@ def close_model(self):
             self.mesh = None
             self.mesh_plot = None
             self.odometry = None
+            self.features = None
+            self.graph = None
         self.mesh_plot = None
+        self._cropped = None
+        self.clear_geodesic()
+
+    def resources(self):
+        """Count what's currently in the renderer.
+
+        Returns:
+            dict: The number of VTK ``"actors"`` and the ``"polydata bytes"``
+            held by their inputs.
+
+        """
+        actors = self.renderer.GetActors()
+        polydata = 0
+        for i in range(actors.GetNumberOfItems()):
+            mapper = actors.GetItemAsObject(i).GetMapper()
+            if mapper is not None and mapper.GetInput() is not None:
+                polydata += mapper.GetInput().GetActualMemorySize() * 1024
+        return {"actors": actors.GetNumberOfItems(), "polydata bytes": polydata}
 
     def _nearest_marker(self, xyz, max_distance=3):
         """Find the landmark marker closest to a given point. Returns None if no
@@ -153,11 +247,13 @@ def landmarks(self):
 
     @landmarks.setter
     def landmarks(self, landmarks):
-        self.clear()
-        for (i, j) in zip(*landmarks):
-            if j is not None and np.isfinite(j).all():
-                self._spawn_marker(j, i)
-        self.update()
+        with timed("create markers"):
+            self.clear()
+            for (i, j) in zip(*landmarks):
+                if j is not None and np.isfinite(j).all():
+                    self._spawn_marker(j, i)
+        with timed("render"):
+            self.update()
 
     def _remove_marker(self, key):
         marker = self.markers.pop(key)
@@ -178,6 +274,7 @@ def _spawn_marker(self, xyz, key=None):
 
         marker = vpl.scatter(xyz, color=Colors.MARKER, fig=self,
                              use_cursors=True)
+        _resources.track("markers", marker)
         marker.key = key
 
         self.markers[marker.key] = marker
@@ -185,7 +282,39 @@ def _spawn_marker(self, xyz, key=None):
 
     def spawn_marker(self, point, key=None):
         marker = self._spawn_marker(point, key)
-        self.marker_changed.emit(None, marker)
+        with timed("marker_changed"):
+            self.marker_changed.emit(None, marker)
+
+    def show_geodesic(self, a, b):
+        """Draw the shortest path along the model's surface between two
+        points, replacing any previous path.
+
+        Returns:
+            float: The path's length. Infinite if there is no such path, None
+            if there is no model open.
+
+        """
+        self.clear_geodesic()
+        if self.mesh is None:
+            return None
+        if self.graph is None:
+            from tomial_clicky_tooth._geodesics import MeshGraph
+
+            self.graph = MeshGraph.from_mesh(self.mesh)
+        with timed("geodesic"):
+            distance, points = self.graph.path(a, b)
+        if points is not None:
+            self.geodesic_plot = vpl.plot(points, color=Colors.HIGHLIGHTED,
+                                          line_width=3, fig=self)
+        self.update()
+        return distance
+
+    def clear_geodesic(self):
+        """Remove the path drawn by show_geodesic() if there is one."""
+        if self.geodesic_plot is not None:
+            self -= self.geodesic_plot
+            self.geodesic_plot = None
+            self.update()
 
     def highlight(self, keys):
         """Highlight the markers within a set of keys."""
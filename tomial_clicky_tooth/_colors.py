@@ -0,0 +1,7 @@
+"""Colours shared by the UI and the offscreen snapshot renderer."""
+
+
+class Colors:
+    BACKGROUND = (40, 80, 150)
+    MARKER = "black"
+    HIGHLIGHTED = (.9, 0, 0)
@@ -0,0 +1,63 @@
+"""Crop away a model's base so that only the part which gets landmarked is
+rendered.
+
+Everything more than a given depth below the model's highest point along its
+occlusal axis is dropped. The plinth and gingiva this removes are often more
+than half of the triangles.
+
+"""
+
+import numpy as np
+
+#: How far (in model units, usually mm) below the occlusal-most point to
+#: keep. Enough for the crowns plus a margin of gingiva.
+DEFAULT_DEPTH = 15.
+
+
+def crop_mask(vectors, occlusal, depth=DEFAULT_DEPTH):
+    """Select the triangles which reach within **depth** of a mesh's
+    occlusal-most point.
+
+    Args:
+        vectors (numpy.ndarray):
+            The mesh's ``(n, 3, 3)`` triangles.
+        occlusal (numpy.ndarray):
+            The unit vector pointing from the model's base towards its crowns.
+        depth (float):
+            How far below the highest point to keep.
+    Returns:
+        numpy.ndarray: A boolean per triangle. True to keep it.
+
+    """
+    vectors = np.asarray(vectors)
+    if not len(vectors):
+        return np.zeros(0, bool)
+    heights = (vectors @ np.asarray(occlusal, dtype=vectors.dtype)).max(axis=1)
+    return heights >= heights.max() - depth
+
+
+def crop(mesh, occlusal, depth=DEFAULT_DEPTH):
+    """Drop the base of a mesh.
+
+    Args:
+        mesh (motmot.Mesh):
+            The model.
+        occlusal (numpy.ndarray):
+            See :func:`crop_mask`.
+        depth (float):
+            See :func:`crop_mask`.
+    Returns:
+        motmot.Mesh: A new mesh of just the kept triangles or **mesh** itself
+        if they'd all be kept.
+
+    """
+    from motmot import Mesh
+
+    keep = crop_mask(mesh.vectors, occlusal, depth)
+    if keep.all():
+        return mesh
+    if mesh.is_faces_mesh:
+        # Leave out the vertices which only the dropped triangles used.
+        used, faces = np.unique(mesh.faces[keep], return_inverse=True)
+        return Mesh(mesh.vertices[used], faces.reshape((-1, 3)))
+    return Mesh(mesh.vectors[keep])
@@ -38,9 +38,25 @@ def parse_points(text):
 
 def read(path):
     """Read a landmarks CSV file."""
-    text = Path(path).read_text(encoding="utf-8")
+    return read_named(path)[1]
+
+
+def read_named(path):
+    """Read a landmarks CSV file, keeping the landmark names.
+
+    Returns:
+        A ``(names, points)`` pair of lists. Unset (or unparsable) points are
+        None.
+
+    """
+    return parse_named(Path(path).read_text(encoding="utf-8"))
+
+
+def parse_named(text):
+    """Parse the contents of a landmarks CSV file. See :func:`read_named`."""
     reader = csv.reader(io.StringIO(text))
 
+    names = []
     points = []
     for (i, (name, *point)) in enumerate(reader):
         if i == 0 and all(i.isalpha() for i in point):
@@ -51,9 +67,10 @@ def read(path):
                 point = None
         except ValueError:
             point = None
+        names.append(name)
         points.append(point)
 
-    return points
+    return names, points
 
 
 def writes(points, *, names=None):
@@ -0,0 +1,95 @@
+"""Locate and read models and their landmark files within a dataset
+directory."""
+
+import re
+from pathlib import Path
+
+from tomial_clicky_tooth import _resources
+from tomial_clicky_tooth._timing import timed
+
+SUFFIXES = [".stl", ".stl.gz", ".stl.bz2", ".stl.xz", ".mesh", ".mesh.gz"]
+SUFFIX_RE = re.compile("(.*)(" + "|".join(map(re.escape, SUFFIXES)) + ")$")
+
+
+def is_model(path):
+    """Test if a filename has a supported model file suffix."""
+    return SUFFIX_RE.match(Path(path).name) is not None
+
+
+def model_name(path):
+    """Strip the folder and the (possibly compound) suffix from a model's
+    filename. e.g. ``some/folder/1L.stl.xz -> 1L``."""
+    return SUFFIX_RE.match(Path(path).name)[1]
+
+
+def csv_path(path):
+    """The landmarks file path corresponding to a model file."""
+    path = Path(path)
+    return path.with_name(model_name(path) + ".csv")
+
+
+def model_paths(root):
+    """List all model files directly inside a directory, sorted by name."""
+    return sorted(i for i in Path(root).glob("*") if is_model(i))
+
+
+def proposals_path(path):
+    """The file of proposed (not yet reviewed) landmarks for a model. See
+    :mod:`tomial_clicky_tooth._registration`."""
+    path = Path(path)
+    return path.with_name(model_name(path) + ".proposals.csv")
+
+
+def read_mesh(path):
+    """Read a model's mesh from any of the formats in :attr:`SUFFIXES`
+    (see :mod:`tomial_clicky_tooth._meshfile` for the ``.mesh`` ones).
+
+    Returns:
+        motmot.Mesh:
+
+    """
+    from tomial_clicky_tooth import _meshfile
+
+    return _meshfile.read(path)
+
+
+def read_model(path, clean=False):
+    """Read a model and derive its orientation.
+
+    This is the slow part of opening a model. It touches neither Qt nor VTK so
+    it is safe to run in a background thread.
+
+    Args:
+        path:
+            The model's filename.
+        clean:
+            Weld the mesh's vertices and drop its degenerate and duplicate
+            triangles (see :mod:`tomial_clicky_tooth._cleaning`).
+
+    Returns:
+        A ``(mesh, odometry)`` pair. **odometry** is None if the model couldn't
+        be orientated (e.g. because it isn't a dental model).
+
+    Any exception raised by this function means that the file is unreadable.
+
+    """
+    with timed("read mesh"):
+        mesh = read_mesh(path)
+    if clean:
+        from tomial_clicky_tooth import _cleaning
+
+        with timed("clean mesh"):
+            mesh, _ = _cleaning.load(mesh)
+    _resources.track("meshes", mesh)
+    try:
+        # Just because we can...
+        # Automatically determine the patient's orientation so that the camera
+        # and the preset camera direction buttons can be aligned to match.
+        from tomial_odometry import Odometry
+        from pangolin import arch_type
+
+        with timed("odometry"):
+            odometry = Odometry(mesh, arch_type(Path(path).stem))
+    except:
+        odometry = None
+    return mesh, odometry
@@ -4,6 +4,7 @@
 import ptpython
 
 from tomial_clicky_tooth._ui import *
+from tomial_clicky_tooth import _watchdog, _profiling
 
 
 class Interact(QtCore.QThread):  # pragma: no cover
@@ -17,6 +18,8 @@ def run(self):
 
 def debug(names, path=None, points=None):
     self = UI(names, path, points)
+    # Inspect recent UI freezes with ``print(*watchdog.stalls)``.
+    watchdog = _watchdog.watch_qt(self)
     self.show()
     t = Interact({**locals(), **globals()})
     t.start()
@@ -0,0 +1,131 @@
+"""Find the points on a model where landmarks are likely to go so that clicks
+can be snapped onto them.
+
+Many landmarks (cusp tips, incisal edges, ridges) sit on local extrema which
+are fiddly to hit exactly by hand. The candidate features are the vertices
+which are local maxima of either:
+
+* Height along the model's occlusal axis (if it could be orientated).
+* Convexity: signed curvature averaged and smoothed around each vertex.
+
+Finding them takes about as long as reading the model so, in the UI, it's done
+once per model in a background thread and the results are cached (keyed by
+the model's geometry). Snapping a click then costs one KD-tree lookup.
+
+"""
+
+import numpy as np
+from pykdtree.kdtree import KDTree
+
+from tomial_clicky_tooth import _cache
+from tomial_clicky_tooth._timing import timed
+
+_features_cache = _cache.Cache("features")
+
+
+def _per_vertex(mesh, per_polygon):
+    """Average a per-triangle value over each vertex's triangles."""
+    faces = mesh.faces.ravel()
+    total = np.bincount(faces, np.repeat(per_polygon, mesh.per_polygon),
+                        minlength=len(mesh.vertices))
+    counts = np.bincount(faces, minlength=len(mesh.vertices))
+    with np.errstate(invalid="ignore"):
+        return total / counts
+
+
+def vertex_convexity(mesh, smoothing=2):
+    """Get a per-vertex measure of how convex (positive) or concave (negative)
+    a mesh is.
+
+    Args:
+        mesh (motmot.Mesh):
+            The mesh to measure.
+        smoothing (int):
+            How many times to average each vertex's value with its
+            neighbours' to suppress scanning noise.
+    Returns:
+        numpy.ndarray: An array with one value per vertex in
+        ``mesh.vertices``.
+
+    """
+    with np.errstate(invalid="ignore"):
+        signed = mesh.curvature.signed
+        per_polygon = np.nansum(signed, axis=1) \
+            / np.isfinite(signed).sum(axis=1).clip(min=1)
+    out = _per_vertex(mesh, per_polygon)
+    for _ in range(smoothing):
+        out = _per_vertex(mesh, out[mesh.faces].mean(axis=1))
+    return np.nan_to_num(out)
+
+
+def find_features(mesh, odometry=None, percentile=90):
+    """Find candidate landmark positions on a mesh.
+
+    Args:
+        mesh (motmot.Mesh):
+            The model.
+        odometry (tomial_odometry.Odometry):
+            The model's orientation or None if it couldn't be orientated.
+        percentile (float):
+            Only keep convexity maxima which are more convex than this
+            percentage of vertices. Flat regions have many insignificant ones.
+    Returns:
+        numpy.ndarray: The ``(n, 3)`` feature points. Vertices on the edge
+        of the mesh are never features.
+
+    """
+    vertices = mesh.vertices
+    if not len(vertices):
+        return np.empty((0, 3), vertices.dtype)
+    boundary = np.zeros(len(vertices), bool)
+    boundary[mesh.faces[(mesh.polygon_map == -1).any(axis=1)]] = True
+
+    ids = []
+    if odometry is not None:
+        ids.append(mesh.local_maxima(odometry.occlusal(vertices)))
+    convexity = vertex_convexity(mesh)
+    maxima = mesh.local_maxima(convexity)
+    threshold = max(np.percentile(convexity, percentile), 0)
+    ids.append(maxima[convexity[maxima] > threshold])
+
+    ids = np.unique(np.concatenate(ids))
+    return vertices[ids[~boundary[ids]]]
+
+
+class Features:
+    """A searchable set of feature points (see :func:`find_features`)."""
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+        self._kdtree = KDTree(self.points) if len(self.points) else None
+
+    def __len__(self):
+        return len(self.points)
+
+    def snap(self, point, radius=1.):
+        """Move a point to the nearest feature if there is one within
+        **radius**, otherwise return the point unchanged."""
+        if self._kdtree is None:
+            return point
+        distance, id = self._kdtree.query(
+            np.asarray(point, dtype=np.float64).reshape((1, 3)),
+            distance_upper_bound=radius)
+        if not np.isfinite(distance[0]):
+            return point
+        return self.points[id[0]]
+
+
+def load(mesh, odometry=None):
+    """Get a mesh's :class:`Features`, from the cache if possible.
+
+    This touches neither Qt nor VTK so can be ran in a background thread.
+
+    """
+    occlusal = b"" if odometry is None else \
+        np.asarray(odometry.occlusal, dtype=np.float64).tobytes()
+    key = _cache.hash_bytes(mesh.vectors.tobytes() + occlusal)
+    points = _features_cache.read_array(key)
+    if points is None:
+        with timed("find features"):
+            points = find_features(mesh, odometry)
+        _features_cache.write_array(key, points)
+    return Features(points)
@@ -0,0 +1,224 @@
+"""Measure distances between landmarks along a model's surface rather than
+straight through it.
+
+Paths follow the mesh's edges (see :class:`MeshGraph`) so they overestimate
+the true geodesic slightly, typically by a few percent.
+
+"""
+
+from pathlib import Path
+
+import numpy as np
+from pykdtree.kdtree import KDTree
+
+from tomial_clicky_tooth import _batch, _csv_io, _dataset
+from tomial_clicky_tooth._timing import timed
+
+
+class MeshGraph:
+    """The edges of a triangle mesh as a weighted graph in compressed sparse
+    row form.
+
+    Args:
+        vertices (numpy.ndarray):
+            ``(n, 3)`` unique vertices.
+        faces (numpy.ndarray):
+            ``(m, 3)`` indices into **vertices**.
+
+    """
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape((-1, 3))
+        faces = np.asarray(faces, dtype=np.intp).reshape((-1, 3))
+        n = len(self.vertices)
+
+        starts = faces.ravel()
+        ends = np.roll(faces, -1, axis=1).ravel()
+        # Both directions of every edge, deduplicated and sorted by start
+        # vertex by encoding each pair as a single integer.
+        codes = np.unique(np.concatenate([starts * n + ends,
+                                          ends * n + starts]))
+        starts, ends = np.divmod(codes, n)
+        keep = starts != ends
+        starts, ends = starts[keep], ends[keep]
+
+        self.indptr = np.searchsorted(starts, np.arange(n + 1))
+        self.indices = ends
+        self.weights = np.linalg.norm(
+            self.vertices[ends] - self.vertices[starts], axis=1)
+        self._kdtree = KDTree(self.vertices) if n else None
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """Build from a :class:`motmot.Mesh`."""
+        with timed("build mesh graph"):
+            return cls(mesh.vertices, mesh.faces)
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def _attach(self, point, k=4):
+        """Find the vertices to join a point to and how far away each is."""
+        point = np.asarray(point, dtype=np.float64).reshape((1, 3))
+        k = min(k, len(self))
+        distances, ids = self._kdtree.query(point, k=k)
+        return ids.reshape(k).astype(np.intp), distances.reshape(k)
+
+    def shortest_paths(self, sources, initial=0., targets=None, offsets=0.):
+        """Find the shortest distance from any source to every vertex.
+
+        Args:
+            sources (numpy.ndarray):
+                Vertex indices to start from.
+            initial (numpy.ndarray):
+                The distance already travelled to reach each source.
+            targets (numpy.ndarray):
+                If given, stop exploring once no shorter route to any of these
+                vertices is possible. Other vertices' distances may then be
+                left too long or infinite.
+            offsets (numpy.ndarray):
+                Additional distances from each target to wherever is really
+                being aimed for.
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray]: Each vertex's distance and
+            the previous vertex along its shortest path (-1 for sources and
+            unreached vertices).
+
+        """
+        sources = np.asarray(sources, dtype=np.intp).ravel()
+        initial = np.broadcast_to(np.asarray(initial, np.float64),
+                                  sources.shape)
+        distances = np.full(len(self), np.inf)
+        previous = np.full(len(self), -1, np.intp)
+        np.minimum.at(distances, sources, initial)
+        active = np.unique(sources)
+        bound = np.inf
+
+        while len(active):
+            if targets is not None:
+                bound = (distances[targets] + offsets).min()
+            # Expand each active vertex's slice of the edge arrays.
+            starts = self.indptr[active]
+            counts = self.indptr[active + 1] - starts
+            firsts = np.cumsum(counts) - counts
+            edges = np.arange(counts.sum()) - np.repeat(firsts - starts, counts)
+            u = np.repeat(active, counts)
+            v = self.indices[edges]
+            candidates = distances[u] + self.weights[edges]
+
+            better = (candidates < distances[v]) & (candidates < bound)
+            u, v, candidates = u[better], v[better], candidates[better]
+            np.minimum.at(distances, v, candidates)
+            won = candidates == distances[v]
+            previous[v[won]] = u[won]
+            active = np.unique(v[won])
+
+        return distances, previous
+
+    def path(self, a, b):
+        """Find the shortest path along the surface between two points.
+
+        Returns:
+            tuple[float, numpy.ndarray]: The path's length and its ``(n, 3)``
+            points, starting at **a** and ending at **b**. The length is
+            infinite and the points None if **a** and **b** are on
+            disconnected pieces of the mesh.
+
+        """
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        if not len(self):
+            return np.inf, None
+        sources, initial = self._attach(a)
+        targets, offsets = self._attach(b)
+        distances, previous = self.shortest_paths(sources, initial, targets,
+                                                  offsets)
+        totals = distances[targets] + offsets
+        best = totals.argmin()
+        if not np.isfinite(totals[best]):
+            return np.inf, None
+
+        ids = [targets[best]]
+        while previous[ids[-1]] != -1:
+            ids.append(previous[ids[-1]])
+        points = np.concatenate([[a], self.vertices[ids[::-1]], [b]])
+        return float(totals[best]), points
+
+    def distance(self, a, b):
+        """The length of :meth:`path`."""
+        return self.path(a, b)[0]
+
+
+def pair_name(a, b):
+    return f"{a} to {b}"
+
+
+def measure(model, pairs):
+    """Measure geodesic distances between pairs of one model's landmarks.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename. Its landmarks are read from
+            :func:`_dataset.csv_path`.
+        pairs (list[tuple[str, str]]):
+            Landmark names to measure between.
+    Returns:
+        dict: A report with keys ``"model"``, ``"measurements"`` (mapping
+        ``"<a> to <b>"`` for each pair to its distance or None if either
+        landmark is unset or they're on disconnected surfaces) and
+        ``"errors"`` (a list of ``(kind, message)`` pairs).
+
+    """
+    model = Path(model)
+    report = {
+        "model": str(model),
+        "measurements": {pair_name(*i): None for i in pairs},
+        "errors": [],
+    }
+    try:
+        names, points = _csv_io.read_named(_dataset.csv_path(model))
+        mesh = _dataset.read_mesh(model)
+        if not len(mesh):
+            raise ValueError("The model has no triangles.")
+    except Exception as ex:
+        report["errors"].append(("unreadable", f"{type(ex).__name__}: {ex}"))
+        return report
+
+    landmarks = dict(zip(names, points))
+    for name in dict.fromkeys(i for pair in pairs for i in pair):
+        if name not in landmarks:
+            report["errors"].append(("missing landmark", name))
+    graph = MeshGraph.from_mesh(mesh)
+    for (a, b) in pairs:
+        if landmarks.get(a) is None or landmarks.get(b) is None:
+            continue
+        distance = graph.distance(landmarks[a], landmarks[b])
+        if np.isfinite(distance):
+            report["measurements"][pair_name(a, b)] = distance
+    return report
+
+
+def _measure_in_worker(args):
+    return measure(*args)
+
+
+def measure_dataset(root, pairs, jobs=None):
+    """Measure geodesic distances for every model with landmarks in a dataset
+    directory.
+
+    Args:
+        root:
+            The dataset directory.
+        pairs:
+            See :func:`measure`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Yields:
+        dict: A report (see :func:`measure`) per model, in order.
+
+    """
+    pairs = [tuple(i) for i in pairs]
+    paths = [
+        i for i in _dataset.model_paths(root) if _dataset.csv_path(i).exists()
+    ]
+    yield from _batch.imap(_measure_in_worker, [(i, pairs) for i in paths],
+                           jobs)
@@ -5,6 +5,10 @@
 import strictyaml
 from pangolin import JawType, tooth_kinds
 
+from tomial_clicky_tooth import _cache
+
+_template_cache = _cache.Cache("templates")
+
 
 class LandmarksContext(dict):
     """A dict subclass containing information about a part of the mouth for
@@ -87,7 +91,7 @@ def expand_scope_modifiers(template):
 def _expand_scope_modifiers(template, jaw_type=JawType(primary="*"), *path):
     if isinstance(template, dict):
         for (key, sub_template) in template.items():
-            if key in ("name", "description"):
+            if key in ("name", "description", "measurements"):
                 continue
             try:
                 yield from _expand_scope_modifiers(
@@ -103,6 +107,100 @@ def _expand_scope_modifiers(template, jaw_type=JawType(primary="*"), *path):
                          f"landmarks - not a {type(template).__name__}.")
 
 
+class Measurement:
+    """A quantity derived from some landmarks (see
+    :meth:`LandmarksTemplate.measurements`).
+
+    Attributes:
+        name (str):
+            The measurement's name.
+        kind (str):
+            ``"distance"`` between two landmarks, ``"offset"`` from the first
+            landmark to the second, projected onto one of the model's
+            :attr:`AXES`, or ``"angle"`` (in degrees) at the second of three
+            landmarks.
+        landmarks (tuple[str]):
+            The landmark names.
+        axis (str):
+            The axis of an ``"offset"``, otherwise None.
+
+    """
+    KINDS = {"distance": 2, "offset": 2, "angle": 3}
+    # The rows of tomial_odometry.Odometry.axes.
+    AXES = ("right", "forwards", "up")
+
+    def __init__(self, name, kind, landmarks, axis=None):
+        self.name = name
+        self.kind = kind
+        self.landmarks = tuple(landmarks)
+        self.axis = axis
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "landmarks": list(self.landmarks),
+            "axis": self.axis,
+        }
+
+    def __repr__(self):
+        return f"Measurement({self.name!r}, {self.kind!r}, " \
+               f"{self.landmarks!r}, {self.axis!r})"
+
+
+def _check_measurement(rule):
+    """Raise a :class:`ParseError` if a measurement declaration is
+    malformed."""
+    if not isinstance(rule, dict) or not isinstance(rule.get("name"), str):
+        raise ParseError("Each measurement should be a mapping with a "
+                         "'name'.")
+    kinds = [i for i in Measurement.KINDS if i in rule]
+    if len(kinds) != 1:
+        raise ParseError(
+            f"Measurement '{rule['name']}' should have exactly one of the "
+            f"keys {', '.join(map(repr, Measurement.KINDS))}.")
+    kind = kinds[0]
+    landmarks = rule[kind]
+    if not isinstance(landmarks, list) or \
+            len(landmarks) != Measurement.KINDS[kind]:
+        raise ParseError(f"Measurement '{rule['name']}' should list "
+                         f"{Measurement.KINDS[kind]} landmarks.")
+    valid = {"name", kind} | ({"axis"} if kind == "offset" else set())
+    for key in rule:
+        if key not in valid:
+            raise InvalidKey(key, ("measurements", rule["name"]), sorted(valid))
+    if kind == "offset" and rule.get("axis") not in Measurement.AXES:
+        raise ParseError(f"Measurement '{rule['name']}' should have an "
+                         f"'axis' of {', '.join(map(repr, Measurement.AXES))}.")
+
+
+def _measurement_rules(template):
+    """Expand the scope modifiers of a template's ``measurements`` section,
+    checking each declaration along the way."""
+    if not isinstance(template, dict) or "measurements" not in template:
+        return []
+    out = list(_expand_scope_modifiers(template["measurements"]))
+    for (_, rules) in out:
+        for rule in rules:
+            _check_measurement(rule)
+    return out
+
+
+def _evaluate_measurement(rule, context):
+    kind = next(i for i in Measurement.KINDS if i in rule)
+    names = context(rule["name"])
+    landmarks = [context(i) for i in rule[kind]]
+    # Sequences (e.g. (4,5)) expand into one measurement per element.
+    count = max(map(len, [names] + landmarks))
+    for values in [names] + landmarks:
+        if len(values) not in (1, count):
+            raise ParseError(f"Measurement '{rule['name']}' expands to "
+                             f"mismatched numbers of names and landmarks.")
+    columns = [i * count if len(i) == 1 else i for i in [names] + landmarks]
+    for (name, *landmarks) in zip(*columns):
+        yield Measurement(name, kind, landmarks, rule.get("axis"))
+
+
 class LandmarksTemplate:
     """A generator for dental feature names.
 
@@ -116,14 +214,23 @@ class LandmarksTemplate:
     def __init__(self, template):
         self.template = template
         self.rules = expand_scope_modifiers(template)
+        self.measurement_rules = _measurement_rules(template)
 
     @classmethod
-    def from_file(cls, file):
-        """Create from a yaml file."""
+    def from_file(cls, file, cache=True):
+        """Create from a yaml file.
+
+        Parsing YAML is slow so successfully parsed templates are cached, keyed
+        by a hash of the file's contents. Loading an unchanged template again
+        (even from another process) skips straight to the parsed result.
+        Modified templates miss the cache and so go through full validation.
+        Set **cache** to false to bypass the cache entirely.
+
+        """
         if isinstance(file, io.IOBase):
-            return cls(strictyaml.load(file.read()).data)
+            return cls(_parse_yaml(file.read(), cache))
         with open(file, "r", encoding="utf-8") as f:
-            return cls.from_file(f)
+            return cls.from_file(f, cache)
 
     def evaluate(self, jaw_type: JawType):
         """Generate the landmark names for a given jaw type."""
@@ -147,6 +254,65 @@ def evaluate(self, jaw_type: JawType):
 
         return landmarks
 
+    def measurements(self, jaw_type: JawType):
+        """Generate the measurements declared for a given jaw type.
+
+        Measurements live under a template's optional ``measurements`` key
+        (which takes the same scope modifiers as the landmarks). Each is a
+        name plus one of ``distance``, ``offset`` (which also needs an
+        ``axis``) or ``angle`` listing landmark rules. Rules are expanded as
+        landmarks are, except that a rule containing ``(s)`` gives one
+        measurement per side::
+
+            measurements:
+              - name: (A) intermolar width
+                offset:
+                  - Tip of the (a)L6
+                  - Tip of the (a)R6
+                axis: right
+              - name: (A) (S) canine angle
+                angle:
+                  - Tip of the (a)(s)1
+                  - Tip of the (a)(s)3
+                  - Tip of the (a)(s)6
+
+        Returns:
+            list[Measurement]: Possibly empty.
+
+        """
+        for (_jaw_type, rules) in self.measurement_rules:
+            if _jaw_type.match(jaw_type, strict=True):
+                break
+        else:
+            return []
+
+        out = []
+        for rule in rules:
+            text = " ".join(
+                [rule["name"]] +
+                [i for kind in Measurement.KINDS for i in rule.get(kind, ())])
+            sides = ("L", "R") if re.search(r"\((s|S)\)", text) else (None,)
+            for side in sides:
+                out += _evaluate_measurement(rule,
+                                             LandmarksContext(jaw_type, side))
+        return out
+
+
+def _parse_yaml(text, cache=True):
+    """Parse a template's YAML, consulting the template cache first."""
+    if not cache:
+        return strictyaml.load(text).data
+    key = _cache.hash_bytes(text.encode())
+    data = _template_cache.read_json(key)
+    if data is None:
+        data = strictyaml.load(text).data
+        # Only cache templates which are structurally valid so that invalid
+        # ones always re-raise the appropriate error.
+        expand_scope_modifiers(data)
+        _measurement_rules(data)
+        _template_cache.write_json(key, data)
+    return data
+
 
 class ParseError(Exception):
     pass
@@ -0,0 +1,78 @@
+"""Collect the licenses of tomial_clicky_tooth and all of its dependencies.
+
+Scanning the installed packages takes seconds (more so in frozen builds) so the
+inventory is collected at most once per process, in a background thread which
+can be started well before the licenses viewer is opened. PyInstaller builds
+skip the scan entirely by collecting the inventory at freeze time (see
+``hook-tomial_clicky_tooth.py``) and bundling it as :data:`BUNDLED`.
+
+"""
+
+import pickle
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+
+from tomial_clicky_tooth._timing import timed
+
+BUNDLED = Path(__file__).with_name("licenses.pickle")
+
+_lock = threading.Lock()
+_future = None
+
+
+def collect():
+    """Gather a ``{name: lamancha component}`` mapping for every dependency.
+
+    This is the slow, uncached, part.
+
+    """
+    import pkg_resources
+    import lamancha
+
+    components = {"python": lamancha.python}
+    for distribution in pkg_resources.require("tomial_clicky_tooth"):
+        try:
+            component = lamancha.Distribution(distribution)
+        except (lamancha.exceptions.NoLicense,
+                lamancha.exceptions.FrozenEditable):
+            continue
+        components[component.name] = component
+    return components
+
+
+def _load():
+    with timed("collect licenses"):
+        if BUNDLED.exists():
+            with open(BUNDLED, "rb") as f:
+                return pickle.load(f)
+        return collect()
+
+
+def _run(future):
+    try:
+        future.set_result(_load())
+    except BaseException as ex:  # pragma: no cover
+        future.set_exception(ex)
+
+
+def prefetch():
+    """Start collecting the inventory in a background thread unless that has
+    already been done.
+
+    Returns:
+        concurrent.futures.Future:
+            The pending inventory.
+
+    """
+    global _future
+    with _lock:
+        if _future is None:
+            _future = Future()
+            threading.Thread(target=_run, args=(_future,), daemon=True).start()
+        return _future
+
+
+def inventory():
+    """Get the licenses inventory, blocking until it has been collected."""
+    return prefetch().result()
@@ -0,0 +1,244 @@
+"""Evaluate a landmarks template's measurements (see
+:meth:`LandmarksTemplate.measurements`) across a whole dataset.
+
+Each model's scores are cached against its landmarks, the measurements and
+its axes so that only changed models are re-evaluated.
+
+"""
+
+import io
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+from pangolin import JawType, arch_type
+
+from tomial_clicky_tooth import _batch, _cache, _csv_io, _dataset
+from tomial_clicky_tooth._landmark_templates import LandmarksTemplate, \
+    Measurement
+from tomial_clicky_tooth._validation import template_path
+
+_axes_cache = _cache.Cache("axes")
+_scores_cache = _cache.Cache("measurements")
+
+
+def evaluate(measurements, names, points, axes=None):
+    """Evaluate measurements for many models at once.
+
+    Args:
+        measurements (list[Measurement]):
+            What to measure.
+        names (list[str]):
+            The landmark names of the second axis of **points**.
+        points (numpy.ndarray):
+            ``(models, landmarks, 3)`` landmarks. NaN for unset ones.
+        axes (numpy.ndarray):
+            ``(models, 3, 3)`` odometry axes (see :attr:`Measurement.AXES`).
+            NaN (or None for all models) if unknown.
+    Returns:
+        numpy.ndarray: ``(models, measurements)`` values. NaN wherever a
+        landmark is unset or missing from **names**, or an offset's axes are
+        unknown.
+
+    """
+    points = np.asarray(points, dtype=np.float64)
+    # A trailing all NaN landmark for references to missing names and for
+    # padding 2 landmark measurements up to 3.
+    points = np.concatenate([points, np.full((len(points), 1, 3), np.nan)], 1)
+    columns = {name: i for (i, name) in enumerate(names)}
+    ids = np.full((len(measurements), 3), len(names), dtype=np.intp)
+    for (row, m) in zip(ids, measurements):
+        row[:len(m.landmarks)] = [
+            columns.get(i, len(names)) for i in m.landmarks
+        ]
+    a, b, c = np.moveaxis(points[:, ids], 2, 0)
+    kinds = np.array([m.kind for m in measurements])
+
+    with np.errstate(invalid="ignore"):
+        distances = np.linalg.norm(b - a, axis=-1)
+
+        if axes is None:
+            axes = np.full((len(points), 3, 3), np.nan)
+        axis_ids = [
+            Measurement.AXES.index(m.axis) if m.kind == "offset" else 0
+            for m in measurements
+        ]
+        offsets = np.einsum("mkj,mkj->mk", b - a, axes[:, axis_ids])
+
+        u = a - b
+        v = c - b
+        cosines = np.einsum("mkj,mkj->mk", u, v) / (np.linalg.norm(u, axis=-1) *
+                                                    np.linalg.norm(v, axis=-1))
+        angles = np.degrees(np.arccos(np.clip(cosines, -1, 1)))
+
+    return np.select([kinds == "distance", kinds == "offset"],
+                     [distances, offsets], angles)
+
+
+def odometry_axes(model):
+    """Get a model's odometry axes.
+
+    Returns:
+        numpy.ndarray: A ``(3, 3)`` array. All NaN if the model can't be read
+        or orientated.
+
+    """
+    try:
+        key = _cache.hash_bytes(Path(model).read_bytes())
+    except OSError:
+        return np.full((3, 3), np.nan)
+    axes = _axes_cache.read_array(key)
+    if axes is None:
+        try:
+            _, odometry = _dataset.read_model(model)
+        except Exception:
+            odometry = None
+        if odometry is None:
+            # Not cached since failing to orientate a model may be down to the
+            # environment (e.g. tomial_odometry not being installed).
+            return np.full((3, 3), np.nan)
+        axes = np.asarray(odometry.axes, dtype=np.float64)
+        _axes_cache.write_array(key, axes)
+    return axes
+
+
+def measure(models, measurements, jobs=None):
+    """Measure a group of models which share the same measurements.
+
+    Args:
+        models (list[pathlib.Path]):
+            Model filenames. Their landmarks are read from
+            :func:`_dataset.csv_path`.
+        measurements (list[Measurement]):
+            What to measure.
+        jobs:
+            The number of processes to find the models' axes with (if any of
+            the measurements need them).
+    Returns:
+        list[dict]: A report per model with keys ``"model"``,
+        ``"measurements"`` (mapping each name to its value or None) and
+        ``"errors"`` (a list of ``(kind, message)`` pairs).
+
+    """
+    models = [Path(i) for i in models]
+    reports = [{
+        "model": str(i),
+        "measurements": {},
+        "errors": []
+    } for i in models]
+    names = list(dict.fromkeys(i for m in measurements for i in m.landmarks))
+    spec = json.dumps([i.to_dict() for i in measurements]).encode()
+
+    csvs = []
+    for (model, report) in zip(models, reports):
+        path = _dataset.csv_path(model)
+        try:
+            csvs.append(path.read_bytes())
+        except OSError:
+            report["errors"].append(
+                ("missing csv", f"{path.name} does not exist."))
+            csvs.append(None)
+
+    if any(i.kind == "offset" for i in measurements):
+        readable = [i for (i, data) in zip(models, csvs) if data is not None]
+        found = dict(zip(readable, _batch.imap(odometry_axes, readable, jobs)))
+        axes = [found.get(i, np.full((3, 3), np.nan)) for i in models]
+        axes = np.array(axes).reshape((-1, 3, 3))
+    else:
+        axes = np.full((len(models), 3, 3), np.nan)
+
+    scores = np.full((len(models), len(measurements)), np.nan)
+    keys = [None] * len(models)
+    misses = []
+    for (i, data) in enumerate(csvs):
+        if data is None:
+            continue
+        keys[i] = _cache.hash_bytes(data + spec + axes[i].tobytes())
+        cached = _scores_cache.read_array(keys[i])
+        if cached is not None and cached.shape == (len(measurements),):
+            scores[i] = cached
+        else:
+            misses.append(i)
+
+    points = np.full((len(misses), len(names), 3), np.nan)
+    columns = {name: i for (i, name) in enumerate(names)}
+    for (row, i) in enumerate(misses):
+        try:
+            text = csvs[i].decode("utf-8")
+            for (name, point) in zip(*_csv_io.parse_named(text)):
+                if name in columns and point is not None:
+                    points[row, columns[name]] = point
+        except (UnicodeDecodeError, ValueError) as ex:
+            reports[i]["errors"].append(
+                ("unreadable csv", f"{type(ex).__name__}: {ex}"))
+            points[row] = np.nan
+            keys[i] = None
+    if misses:
+        scores[misses] = evaluate(measurements, names, points, axes[misses])
+    for i in misses:
+        if keys[i] is not None:
+            _scores_cache.write_array(keys[i], scores[i])
+
+    for (report, row) in zip(reports, scores):
+        report["measurements"] = {
+            m.name: float(x) if np.isfinite(x) else None
+            for (m, x) in zip(measurements, row)
+        }
+    return reports
+
+
+def measure_dataset(root, template, primary=False, jobs=None):
+    """Evaluate a template's measurements for every model in a dataset
+    directory.
+
+    Args:
+        root:
+            The dataset directory.
+        template:
+            A template filename or the name of a bundled template.
+        primary:
+            Whether the models are of deciduous teeth.
+        jobs:
+            The number of processes to use for finding models' axes. Defaults
+            to one per CPU.
+    Returns:
+        list[dict]: A report (see :func:`measure`) per model, in order.
+
+    """
+    template = LandmarksTemplate.from_file(template_path(template))
+    models = _dataset.model_paths(root)
+    reports = {}
+    groups = {}
+    for model in models:
+        try:
+            groups.setdefault(arch_type(_dataset.model_name(model)),
+                              []).append(model)
+        except Exception as ex:
+            reports[model] = {
+                "model": str(model),
+                "measurements": {},
+                "errors": [("unknown arch type", f"{type(ex).__name__}: {ex}")]
+            }
+    for (arch, group) in groups.items():
+        measurements = template.measurements(
+            JawType(arch_type=arch, primary=primary))
+        reports.update(zip(group, measure(group, measurements, jobs)))
+    return [reports[i] for i in models]
+
+
+def table(reports):
+    """Format reports as CSV text: a row per model and a column per
+    measurement (models of different jaw types have different measurements so
+    cells which don't apply are left blank)."""
+    columns = list(
+        dict.fromkeys(i for report in reports
+                      for i in report["measurements"]))  # yapf: disable
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["Model"] + columns)
+    for report in reports:
+        values = [report["measurements"].get(i) for i in columns]
+        writer.writerow([_dataset.model_name(report["model"])] +
+                        ["" if i is None else f"{i:.6g}" for i in values])
+    return out.getvalue()
@@ -0,0 +1,136 @@
+"""A compact, quick to decode container for models: ``.mesh`` and
+``.mesh.gz``.
+
+STL stores every triangle's three corners in full (plus a normal) so each
+vertex is repeated about six times and, once decompressed, has to be
+deduplicated again before anything can use the mesh's topology. These files
+instead store the unique vertices and the faces indexing into them::
+
+    header:   b"TCTMESH1", uint32 vertex count, uint32 face count
+    vertices: (n, 3) little endian float32
+    faces:    (m, 3) little endian uint32
+
+Each array is byte shuffled (all of the values' first bytes, then all of their
+second bytes, ...) which groups the slowly varying high bytes together so that
+gzip compresses them much better. Unshuffling is a single NumPy transpose.
+
+Vertices are kept as float32, exactly as STL stores them, so converting a
+model from STL is lossless. :func:`read` reads either these or STLs (optionally
+compressed) so :func:`_dataset.read_mesh` can use it for any model.
+
+"""
+
+import io
+import gzip
+import bz2
+import lzma
+import struct
+from pathlib import Path
+
+import numpy as np
+from motmot import Mesh
+
+from tomial_clicky_tooth import _dataset
+
+MAGIC = b"TCTMESH1"
+_HEADER = struct.Struct("<8sII")
+
+SUFFIXES = [".mesh", ".mesh.gz"]
+
+_DECOMPRESS = {
+    ".gz": gzip.decompress,
+    ".bz2": bz2.decompress,
+    ".xz": lzma.decompress,
+}
+
+
+def _shuffle(array):
+    return array.view(np.uint8).reshape((-1, 4)).T.tobytes()
+
+
+def _unshuffle(data, count, dtype):
+    bytes_ = np.frombuffer(data, np.uint8, count * 12).reshape((4, -1))
+    return np.ascontiguousarray(bytes_.T).view(dtype).reshape((count, 3))
+
+
+def encode(mesh, suffix=".mesh.gz", level=6):
+    """Serialise a mesh.
+
+    Args:
+        mesh (motmot.Mesh):
+            The mesh to write.
+        suffix (str):
+            Either ``".mesh"`` or ``".mesh.gz"``.
+        level (int):
+            The gzip compression level (1 to 9) if compressing.
+    Returns:
+        bytes: The file's contents.
+
+    """
+    if suffix not in SUFFIXES:
+        raise ValueError(f"Unsupported suffix {suffix!r}. Choose from "
+                         f"{SUFFIXES}.")
+    vertices = np.asarray(mesh.vertices, dtype="<f4")
+    faces = np.asarray(mesh.faces, dtype="<u4")
+    data = _HEADER.pack(MAGIC, len(vertices), len(faces)) \
+        + _shuffle(vertices) + _shuffle(faces)
+    if suffix == ".mesh.gz":
+        # mtime=0 so that the same mesh always encodes to the same bytes.
+        # gzip.compress() only takes an mtime from Python 3.8.
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=level,
+                           mtime=0) as f:
+            f.write(data)
+        data = buffer.getvalue()
+    return data
+
+
+def decode(data, suffix):
+    """Deserialise a mesh from the contents of a file.
+
+    Args:
+        data (bytes):
+            The file's contents.
+        suffix (str):
+            The file's (compound) suffix. Any of
+            :attr:`_dataset.SUFFIXES`.
+    Returns:
+        motmot.Mesh:
+
+    """
+    (inner, outer) = _split(suffix)
+    if outer:
+        data = _DECOMPRESS[outer](data)
+    if inner == ".stl":
+        return Mesh(io.BytesIO(data))
+
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated mesh file.")
+    (magic, n, m) = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a mesh file.")
+    if len(data) != _HEADER.size + 12 * (n + m):
+        raise ValueError("Truncated mesh file.")
+    vertices = _unshuffle(data[_HEADER.size:], n, "<f4")
+    faces = _unshuffle(data[_HEADER.size + 12 * n:], m, "<u4")
+    if m and faces.max() >= n:
+        raise ValueError("Face indices out of range.")
+    return Mesh(vertices, faces.astype(np.intp))
+
+
+def _split(suffix):
+    """Split a suffix such as ``.stl.gz`` into ``(".stl", ".gz")``."""
+    for outer in _DECOMPRESS:
+        if suffix.endswith(outer):
+            return suffix[:-len(outer)], outer
+    return suffix, ""
+
+
+def read(path):
+    """Read a model file of any supported format."""
+    path = Path(path)
+    match = _dataset.SUFFIX_RE.match(path.name)
+    if match is None or _split(match[2])[0] == ".stl":
+        # motmot reads STLs (and remembers the filename) by itself.
+        return Mesh(path)
+    return decode(path.read_bytes(), match[2])
@@ -0,0 +1,243 @@
+"""Bring a dataset's landmark files up to date after its template changes.
+
+Landmarks are matched by name. New ones are left unset and obsolete ones are
+discarded, which is refused for placed landmarks unless explicitly allowed.
+
+"""
+
+import collections
+import difflib
+from pathlib import Path
+
+from tomial_clicky_tooth import _batch, _csv_io, _dataset
+from tomial_clicky_tooth._landmark_templates import LandmarksTemplate, \
+    LandmarksUndefined
+from tomial_clicky_tooth._validation import template_path, expected_names
+
+
+def remap(names, points, wanted):
+    """Reorder landmarks to match a list of landmark names.
+
+    Args:
+        names (list[str]):
+            The names of **points**.
+        points (list):
+            A point (or None if unset) per name.
+        wanted (list):
+            The names to reorder to. They are compared as strings.
+    Returns:
+        tuple[list, list[str]]: A point (or None) per **wanted** name and the
+        names of any placed landmarks not in **wanted** (i.e. which have been
+        discarded).
+
+    If **names** and **wanted** have no names in common (e.g. an unnamed CSV)
+    then the points are assumed to already be in the right order. Should a
+    name be repeated, its first occurrence is used and any later placed ones
+    are discarded (so appear in the returned names as ``"name (row n)"``).
+
+    """
+    wanted = [str(i) for i in wanted]
+    points = list(points)
+    if not set(names) & set(wanted):
+        points += [None] * (len(wanted) - len(points))
+        dropped = [
+            name or f"#{i + 1}"
+            for (i, (name, point)) in enumerate(zip(names, points))
+            if i >= len(wanted) and point is not None
+        ]
+        return points[:len(wanted)], dropped
+
+    lookup = {}
+    repeats = []
+    for (i, (name, point)) in enumerate(zip(names, points)):
+        if name not in lookup:
+            lookup[name] = point
+        elif point is not None:
+            repeats.append(f"{name} (row {i + 1})")
+    keep = set(wanted)
+    dropped = [i for (i, point) in lookup.items()
+               if i not in keep and point is not None]  # yapf: disable
+    return [lookup.get(i) for i in wanted], dropped + repeats
+
+
+def migrate(model, template, primary=False, write=False, drop=False):
+    """Remap one model's landmarks to match a template.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename. Its landmarks are read from (and optionally
+            written back to) :func:`_dataset.csv_path`.
+        template (LandmarksTemplate):
+            The new template.
+        primary (bool):
+            Whether the models are of deciduous teeth.
+        write (bool):
+            Overwrite the CSV if it needs changing.
+        drop (bool):
+            Allow writing even if placed landmarks would be discarded.
+    Returns:
+        dict: A report with keys ``"model"``, ``"csv"``, ``"added"`` (names
+        new to the CSV), ``"removed"`` (names no longer in the template),
+        ``"dropped"`` (those of **removed** which were placed),
+        ``"changed"``, ``"written"``, ``"diff"`` (a unified diff of the CSV's
+        old and new contents) and ``"errors"`` (a list of ``(kind, message)``
+        pairs).
+
+    """
+    model = Path(model)
+    csv = _dataset.csv_path(model)
+    report = {
+        "model": str(model),
+        "csv": str(csv),
+        "added": [],
+        "removed": [],
+        "dropped": [],
+        "changed": False,
+        "written": False,
+        "diff": "",
+        "errors": [],
+    }
+    errors = report["errors"]
+
+    try:
+        wanted = expected_names(template, _dataset.model_name(model), primary)
+    except LandmarksUndefined as ex:
+        errors.append(("no template", str(ex)))
+        return report
+    except Exception as ex:
+        errors.append(("unknown arch type", f"{type(ex).__name__}: {ex}"))
+        return report
+    try:
+        names, old_points = _csv_io.read_named(csv)
+    except (OSError, UnicodeDecodeError, ValueError) as ex:
+        errors.append(("unreadable csv", f"{type(ex).__name__}: {ex}"))
+        return report
+
+    repeated = [i for (i, n) in collections.Counter(names).items() if n > 1]
+    if repeated:
+        errors.append(("duplicate names", ", ".join(repeated)))
+    points, report["dropped"] = remap(names, old_points, wanted)
+    report["added"] = [i for i in wanted if i not in names]
+    report["removed"] = [i for i in dict.fromkeys(names) if i not in wanted]
+    if names == wanted:
+        return report
+
+    new = _csv_io.writes(points, names=wanted)
+    report["changed"] = True
+    # Diff normalised copies so that only the landmarks' changes show, not
+    # differences in number formatting or line endings.
+    lines = difflib.unified_diff(
+        _csv_io.writes(old_points, names=names).splitlines(), new.splitlines(),
+        "a/" + csv.name, "b/" + csv.name, lineterm="")
+    report["diff"] = "\n".join(lines) + "\n"
+    if report["dropped"] and not drop:
+        errors.append(("would drop", ", ".join(report["dropped"])))
+    elif write:
+        _batch.write_text(csv, new)
+        report["written"] = True
+    return report
+
+
+# Each worker process parses the template once rather than once per model.
+_worker_template = None
+
+
+def _init_worker(template):
+    global _worker_template
+    _worker_template = LandmarksTemplate.from_file(template)
+
+
+def _migrate_in_worker(args):
+    return migrate(args[0], _worker_template, *args[1:])
+
+
+def migrate_dataset(root, template, primary=False, write=False, drop=False,
+                    jobs=None):
+    """Remap every model's landmarks in a dataset directory.
+
+    Args:
+        root:
+            The dataset directory.
+        template:
+            A template filename or the name of a bundled template.
+        primary:
+            Whether the models are of deciduous teeth.
+        write:
+            Overwrite CSVs which need changing. Otherwise just report.
+        drop:
+            See :func:`migrate`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Yields:
+        dict: A report (see :func:`migrate`) per model with landmarks, in
+        order.
+
+    """
+    paths = [
+        i for i in _dataset.model_paths(root) if _dataset.csv_path(i).exists()
+    ]
+    yield from _batch.imap(_migrate_in_worker,
+                           [(i, primary, write, drop) for i in paths], jobs,
+                           _init_worker, (template_path(template),))
+
+
+class Summary:
+    """Aggregate migration reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.changed = 0
+        self.written = 0
+        self.errors = collections.Counter()
+        self.added = collections.Counter()
+        self.removed = collections.Counter()
+
+    def add(self, report):
+        self.models += 1
+        self.changed += report["changed"]
+        self.written += report["written"]
+        self.errors.update(kind for (kind, _) in report["errors"])
+        self.added.update(report["added"])
+        self.removed.update(report["removed"])
+
+    def to_dict(self):
+        return {
+            "models": self.models,
+            "changed": self.changed,
+            "written": self.written,
+            "errors": dict(self.errors.most_common()),
+            "added": dict(self.added.most_common()),
+            "removed": dict(self.removed.most_common()),
+        }
+
+    def __str__(self):
+        lines = [
+            f"{self.changed}/{self.models} CSVs need migrating.",
+            f"{self.written} CSVs rewritten."
+        ]
+        if self.added:
+            lines.append("Added: " + ", ".join(self.added))
+        if self.removed:
+            lines.append("Removed: " + ", ".join(self.removed))
+        for (kind, count) in self.errors.most_common():
+            lines.append(f"  {kind}: {count}")
+        return "\n".join(lines)
+
+
+def format_report(report, diff=False):
+    """Format a report as one line per model (plus one per error and,
+    if **diff** is true, the diff)."""
+    name = _dataset.model_name(report["model"])
+    if not report["changed"]:
+        line = f"{name}: up to date"
+    else:
+        changes = [f"{len(report[i])} {i}" for i in ("added", "removed")
+                   if report[i]] or ["reordered"]  # yapf: disable
+        line = f"{name}: " + ", ".join(changes)
+    if report["written"]:
+        line += " (rewritten)"
+    lines = [line] + [
+        f"    {kind}: {message}" for (kind, message) in report["errors"]
+    ]
+    if diff and report["diff"]:
+        lines.append(report["diff"].rstrip("\n"))
+    return "\n".join(lines)
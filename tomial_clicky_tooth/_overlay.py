@@ -0,0 +1,64 @@
+from PyQt5 import QtWidgets, QtCore, QtGui
+
+from tomial_clicky_tooth import _timing, _resources
+
+
+def timings_section():
+    """Format the rolling timing percentiles as a plain text table."""
+    summary = _timing.recorder.summary()
+    if not summary:
+        return "No timings recorded yet."
+    lines = [f"{'':<20}{'n':>6}{'p50':>9}{'p90':>9}{'p99':>9}  (ms)"]
+    for (name, stats) in summary.items():
+        lines.append(f"{name[:20]:<20}{stats['count']:>6}" + "".join(
+            f"{stats[i] * 1000:>9.1f}" for i in ("p50", "p90", "p99")))
+    return "\n".join(lines)
+
+
+def resources_section(resources):
+    """Format a dictionary of resource counts as plain text, giving anything
+    measured in bytes human readable units."""
+    lines = []
+    for (name, value) in resources.items():
+        if name.endswith(" bytes"):
+            name = name[:-len(" bytes")]
+            value = _resources.format_bytes(value)
+        lines.append(f"{name[:20]:<20}{value:>15}")
+    return "\n".join(lines)
+
+
+class PerformanceOverlay(QtWidgets.QWidget):
+    """A small floating window showing live performance statistics.
+
+    The content is built from :attr:`sections`, a list of functions each
+    returning a block of plain text, and refreshed periodically whilst visible.
+
+    """
+    def __init__(self, parent=None, interval=500):
+        super().__init__(parent, QtCore.Qt.Tool)
+        self.setWindowTitle("Performance")
+        self.sections = [timings_section]
+
+        self.label = QtWidgets.QLabel()
+        self.label.setFont(
+            QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.label.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        self.setLayout(QtWidgets.QVBoxLayout())
+        self.layout().addWidget(self.label)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+
+    def refresh(self):
+        self.label.setText("\n\n".join(i() for i in self.sections))
+        self.adjustSize()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
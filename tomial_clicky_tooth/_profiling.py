@@ -0,0 +1,191 @@
+"""A sampling profiler which can be switched on and off mid-session.
+
+Unlike running under :mod:`cProfile`, this only costs anything whilst it's
+running and, even then, the running code isn't slowed down by tracing every
+function call. Instead, a background thread snapshots every thread's Python
+stack every **interval** seconds. Toggle it from the UI's debug menu (or
+:func:`start` and :func:`stop` from the debug shell, see :mod:`_debug`) around
+whatever is slow, then save the result as either:
+
+* A speedscope_ JSON file (``.json``) giving a flame graph per thread.
+* A :mod:`pstats` file (``.prof``), readable with :class:`pstats.Stats`,
+  snakeviz, etc. Being sampled, call counts are replaced by sample counts.
+
+.. _speedscope: https://www.speedscope.app
+
+"""
+
+import os
+import sys
+import json
+import time
+import marshal
+import threading
+import collections
+
+profiler = None
+
+
+class Profiler:
+    """Sample all threads' stacks until stopped.
+
+    Args:
+        interval:
+            The time (in seconds) between samples.
+
+    """
+    def __init__(self, interval=.01):
+        self.interval = interval
+        # Each unique (filename, first line, function name) seen.
+        self.frames = {}
+        # {thread identifier: (thread name, [stack, ...], [seconds, ...])}
+        # where each stack is a tuple of indices into frames, outermost first.
+        self.threads = {}
+        self.duration = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="sampling profiler")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def _frame_id(self, code):
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        try:
+            return self.frames[key]
+        except KeyError:
+            return self.frames.setdefault(key, len(self.frames))
+
+    def sample(self, weight):
+        """Record every other thread's current stack, attributing **weight**
+        seconds to each."""
+        names = None
+        for (ident, frame) in sys._current_frames().items():
+            if ident == threading.get_ident():
+                continue
+            if ident not in self.threads:
+                if names is None:
+                    names = {i.ident: i.name for i in threading.enumerate()}
+                self.threads[ident] = (names.get(ident, str(ident)), [], [])
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack = tuple(reversed(stack))
+
+            _, stacks, weights = self.threads[ident]
+            if stacks and stacks[-1] == stack:
+                # Merge repeats to keep long, idle sessions small.
+                weights[-1] += weight
+            else:
+                stacks.append(stack)
+                weights.append(weight)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            # Use the real time elapsed rather than the requested interval in
+            # case a busy interpreter delays this thread.
+            self.sample(now - last)
+            self.duration += now - last
+            last = now
+
+    def to_speedscope(self):
+        """Serialise as a speedscope_ sampled profile (one per thread)."""
+        frames = [{
+            "name": name,
+            "file": file,
+            "line": line
+        } for (file, line, name) in self.frames]
+        profiles = [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": [list(i) for i in stacks],
+            "weights": weights,
+        } for (name, stacks, weights) in self.threads.values()]
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "tomial_clicky_tooth",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        })  # yapf: disable
+
+    def to_pstats(self):
+        """Convert to the dictionary format :mod:`pstats` reads, using seconds
+        of sampled time."""
+        functions = list(self.frames)
+        # {function: [samples, own time, cumulative time]}
+        totals = collections.defaultdict(lambda: [0, 0., 0.])
+        # {callee: {caller: [samples, own time, cumulative time]}}
+        callers = collections.defaultdict(
+            lambda: collections.defaultdict(lambda: [0, 0., 0.]))
+
+        for (_, stacks, weights) in self.threads.values():
+            for (stack, weight) in zip(stacks, weights):
+                if not stack:  # pragma: no cover
+                    continue
+                totals[stack[-1]][1] += weight
+                # Count recursive functions only once per sample.
+                for i in set(stack):
+                    totals[i][0] += 1
+                    totals[i][2] += weight
+                for pair in set(zip(stack[:-1], stack[1:])):
+                    caller, callee = pair
+                    entry = callers[callee][caller]
+                    entry[0] += 1
+                    entry[2] += weight
+                    if callee == stack[-1]:
+                        entry[1] += weight
+
+        return {
+            functions[i]: (n, n, own, cumulative, {
+                functions[j]: (m, m, own_, cumulative_)
+                for (j, (m, own_, cumulative_)) in callers[i].items()
+            }) for (i, (n, own, cumulative)) in totals.items()
+        }
+
+    def save(self, path):
+        """Write to a ``.prof`` (pstats) or ``.json`` (speedscope) file."""
+        path = os.fspath(path)
+        if path.endswith((".prof", ".pstats")):
+            with open(path, "wb") as f:
+                marshal.dump(self.to_pstats(), f)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.to_speedscope())
+
+
+def start(interval=.01):
+    """Start profiling, unless already doing so."""
+    global profiler
+    if profiler is None:
+        profiler = Profiler(interval).start()
+    return profiler
+
+
+def stop():
+    """Stop profiling.
+
+    Returns:
+        Profiler: The finished profile (or None if not profiling).
+
+    """
+    global profiler
+    if profiler is None:
+        return None
+    profiler, _profiler = None, profiler
+    return _profiler.stop()
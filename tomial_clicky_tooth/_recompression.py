@@ -0,0 +1,217 @@
+"""Re-encode a dataset's models into whichever format decodes fastest.
+
+Each model is encoded as every one of :data:`CANDIDATES` and only replaced if
+the fastest to decode clearly beats the original, is no larger and holds
+exactly the same triangles.
+
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+
+from tomial_clicky_tooth import _batch, _dataset, _meshfile
+
+#: ``(suffix, gzip level)`` pairs to try.
+CANDIDATES = [(".mesh", None), (".mesh.gz", 1), (".mesh.gz", 6),
+              (".mesh.gz", 9)]
+
+
+def decode_time(data, suffix, repeats=3):
+    """Time decoding a model file's contents, taking the best of several
+    attempts to filter out noise.
+
+    Returns:
+        tuple[float, motmot.Mesh]: The time in seconds and the mesh.
+
+    """
+    best = np.inf
+    for _ in range(max(repeats, 1)):
+        start = time.perf_counter()
+        mesh = _meshfile.decode(data, suffix)
+        best = min(best, time.perf_counter() - start)
+    return best, mesh
+
+
+def recompress(model, write=False, repeats=3):
+    """Benchmark, and optionally convert, one model.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename.
+        write (bool):
+            Replace the model with its fastest decoding form (if that's any
+            faster).
+        repeats (int):
+            How many times to decode each format when timing it.
+    Returns:
+        dict: A report with keys ``"model"``, ``"before"`` and ``"after"``
+        (each a dict of ``"format"``, ``"size"`` in bytes and ``"decode"``
+        time in seconds), ``"candidates"`` (the same for every format tried),
+        ``"output"`` (the converted model's filename, or None if it's best
+        left as it is), ``"written"`` and ``"errors"`` (a list of
+        ``(kind, message)`` pairs).
+
+    """
+    model = Path(model)
+    suffix = _dataset.SUFFIX_RE.match(model.name)[2]
+    report = {
+        "model": str(model),
+        "before": None,
+        "after": None,
+        "candidates": [],
+        "output": None,
+        "written": False,
+        "errors": [],
+    }
+    try:
+        data = model.read_bytes()
+        seconds, mesh = decode_time(data, suffix, repeats)
+        if not len(mesh):
+            raise ValueError("The model has no triangles.")
+    except Exception as ex:
+        report["errors"].append(("unreadable", f"{type(ex).__name__}: {ex}"))
+        return report
+    report["before"] = report["after"] = {
+        "format": suffix,
+        "size": len(data),
+        "decode": seconds,
+    }
+
+    encoded = {}
+    for (candidate, level) in CANDIDATES:
+        name = candidate + (f" (level {level})" if level else "")
+        encoded[name] = _meshfile.encode(mesh, candidate, level)
+        seconds, copy = decode_time(encoded[name], candidate, repeats)
+        if not np.array_equal(copy.vectors, mesh.vectors):  # pragma: no cover
+            report["errors"].append(("lossy", f"{name} changes the mesh."))
+            continue
+        report["candidates"].append({
+            "format": name,
+            "size": len(encoded[name]),
+            "decode": seconds,
+        })
+
+    # Demand a clear improvement so that timing noise alone never causes a
+    # model to be rewritten. Re-encoding in the same format would only change
+    # the gzip level, which makes little difference to decoding.
+    threshold = .9 * report["before"]["decode"]
+    eligible = [
+        i for i in report["candidates"] if i["size"] <= len(data)
+        and i["decode"] < threshold and i["format"].split()[0] != suffix
+    ]
+    if not eligible:
+        return report
+    best = min(eligible, key=lambda i: i["decode"])
+    report["after"] = best
+    output = model.with_name(
+        _dataset.model_name(model) + best["format"].split()[0])
+    report["output"] = str(output)
+
+    if write:
+        if output.exists():
+            report["errors"].append(("exists", f"{output.name} already "
+                                     "exists."))
+            return report
+        _batch.write_bytes(output, encoded[best["format"]])
+        model.unlink()
+        report["written"] = True
+    return report
+
+
+def _recompress_in_worker(args):
+    return recompress(*args)
+
+
+def recompress_dataset(root, write=False, repeats=3, jobs=None):
+    """Benchmark, and optionally convert, every model in a dataset directory.
+
+    Args:
+        root:
+            The dataset directory.
+        write:
+            See :func:`recompress`.
+        repeats:
+            See :func:`recompress`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU. Decode
+            times are measured more precisely with fewer.
+    Yields:
+        dict: A report (see :func:`recompress`) per model, in order.
+
+    """
+    yield from _batch.imap(
+        _recompress_in_worker,
+        [(i, write, repeats) for i in _dataset.model_paths(root)], jobs)
+
+
+def _megabytes(size):
+    return f"{size / 1e6:.2f} MB"
+
+
+class Summary:
+    """Aggregate recompression reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.converted = 0
+        self.written = 0
+        self.errors = 0
+        self.before = {"size": 0, "decode": 0.}
+        self.after = {"size": 0, "decode": 0.}
+
+    def add(self, report):
+        self.models += 1
+        self.converted += report["output"] is not None
+        self.written += report["written"]
+        self.errors += len(report["errors"])
+        if report["before"] is not None:
+            for key in ("size", "decode"):
+                self.before[key] += report["before"][key]
+                self.after[key] += report["after"][key]
+
+    def to_dict(self):
+        return {
+            "models": self.models,
+            "converted": self.converted,
+            "written": self.written,
+            "errors": self.errors,
+            "before": dict(self.before),
+            "after": dict(self.after),
+        }
+
+    def __str__(self):
+        lines = [
+            f"{self.converted}/{self.models} models decode faster in another "
+            "format.",
+            f"Total size: {_megabytes(self.before['size'])} -> "
+            f"{_megabytes(self.after['size'])}",
+            f"Total decode time: {self.before['decode']:.3f}s -> "
+            f"{self.after['decode']:.3f}s",
+            f"{self.written} models converted.",
+        ]
+        if self.errors:
+            lines.append(f"{self.errors} errors.")
+        return "\n".join(lines)
+
+
+def format_report(report):
+    """Format a report as one line per model (plus one per error)."""
+    name = _dataset.model_name(report["model"])
+    lines = [f"{name}: unreadable"]
+    if report["before"] is not None:
+        (before, after) = (report["before"], report["after"])
+        line = (f"{name}: {before['format']} {_megabytes(before['size'])} "
+                f"{before['decode'] * 1000:.1f}ms")
+        if report["output"] is None:
+            line += " (already fastest)"
+        else:
+            line += (f" -> {after['format']} {_megabytes(after['size'])} "
+                     f"{after['decode'] * 1000:.1f}ms "
+                     f"({before['decode'] / after['decode']:.1f}x faster)")
+        if report["written"]:
+            line += " (converted)"
+        lines = [line]
+    return "\n".join(
+        lines +
+        [f"    {kind}: {message}" for (kind, message) in report["errors"]])
@@ -0,0 +1,488 @@
+"""Propose initial landmarks for a model by registering a reference model (a
+model whose landmarks are known) onto it.
+
+The reference is first roughly aligned with the model using both models'
+:class:`tomial_odometry.Odometry` axes (or just their centroids if either
+can't be orientated), then refined using the iterative closest point (ICP)
+algorithm on a random subsample of the reference's vertices. The reference's
+landmarks are then carried across by the resulting transform and snapped onto
+the model's surface.
+
+Reading and orientating each model is slow enough that, rather than making
+the annotator wait, a whole dataset can be processed ahead of time in a process
+pool::
+
+    python -m tomial_clicky_tooth propose path/to/dataset \\
+        --reference reference/1L.stl reference/1U.stl
+
+This writes the proposals for each model to :func:`_dataset.proposals_path`
+(``1L.proposals.csv`` next to ``1L.stl``) which the UI picks up automatically
+when a model without landmarks is opened. Proposals are only suggestions: the
+UI shows them in italics until they are saved or replaced.
+
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pangolin
+
+from tomial_clicky_tooth import _batch, _csv_io, _dataset, _snapping
+
+
+def transform(matrix, points):
+    """Apply a ``4x4`` homogeneous transformation matrix to ``(n, 3)``
+    points."""
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def _homogeneous(linear, translation):
+    out = np.eye(4)
+    out[:3, :3] = linear
+    out[:3, 3] = translation
+    return out
+
+
+def _nearest_rotation(matrix):
+    u, _, vt = np.linalg.svd(matrix)
+    return u @ np.diag([1, 1, np.sign(np.linalg.det(u @ vt))]) @ vt
+
+
+def rigid_fit(source, target):
+    """Find the rotation and translation which best map **source** points
+    onto **target** points in the least squares sense (Kabsch's algorithm).
+
+    Returns:
+        numpy.ndarray: A ``4x4`` homogeneous transformation matrix.
+
+    """
+    source_center = source.mean(axis=0)
+    target_center = target.mean(axis=0)
+    covariance = (source - source_center).T @ (target - target_center)
+    rotation = _nearest_rotation(covariance.T)
+    return _homogeneous(rotation, target_center - rotation @ source_center)
+
+
+def affine_fit(source, target):
+    """Like :func:`rigid_fit` but allowing any affine transformation (i.e.
+    also scaling and shearing)."""
+    padded = np.c_[source, np.ones(len(source))]
+    solution = np.linalg.lstsq(padded, target, rcond=None)[0]
+    return _homogeneous(solution[:3].T, solution[3])
+
+
+def initial_transform(source, target, source_odometry=None,
+                      target_odometry=None):
+    """Roughly align one mesh with another.
+
+    Args:
+        source (motmot.Mesh):
+            The mesh to be moved.
+        target (motmot.Mesh):
+            The mesh to move it onto.
+        source_odometry (tomial_odometry.Odometry):
+            **source**'s orientation.
+        target_odometry (tomial_odometry.Odometry):
+            **target**'s orientation.
+    Returns:
+        numpy.ndarray: A ``4x4`` homogeneous transformation matrix.
+
+    The centroids are always aligned. If both orientations are provided then
+    each mesh's odometry axes are aligned too. Otherwise the meshes are assumed
+    to already be orientated alike (which is usually true of scans from the
+    same scanner).
+
+    """
+    source_center = source.vertices.mean(axis=0, dtype=np.float64)
+    target_center = target.vertices.mean(axis=0, dtype=np.float64)
+    rotation = np.eye(3)
+    if source_odometry is not None and target_odometry is not None:
+        # Each matrix of axes maps its model's coordinates to its patient's.
+        target_axes = np.asarray(target_odometry.axes, dtype=np.float64)
+        source_axes = np.asarray(source_odometry.axes, dtype=np.float64)
+        rotation = _nearest_rotation(target_axes.T @ source_axes)
+    return _homogeneous(rotation, target_center - rotation @ source_center)
+
+
+def _skew(vector):
+    x, y, z = vector
+    return np.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+
+
+def point_to_plane_step(points, matched, normals):
+    """Find the small rigid motion which best moves each point onto the plane
+    through its match with the given normal.
+
+    This is the linearised (small angle) point-to-plane ICP step of Chen and
+    Medioni which converges far faster than fitting point to point
+    correspondences because points are free to slide along the surface.
+
+    Returns:
+        numpy.ndarray: A ``4x4`` homogeneous transformation matrix.
+
+    """
+    center = points.mean(axis=0)
+    points = points - center
+    matched = matched - center
+    a = np.c_[np.cross(points, normals), normals]
+    b = np.einsum("ij,ij->i", matched - points, normals)
+    (*angles, x, y, z) = np.linalg.lstsq(a, b, rcond=None)[0]
+    rotation = _nearest_rotation(np.eye(3) + _skew(angles))
+    return _homogeneous(rotation, center + [x, y, z] - rotation @ center)
+
+
+def icp(points, target, matrix=None, affine=False, iterations=50,
+        tolerance=1e-6, trim=.9):
+    """Refine a transformation which maps some points onto a mesh's surface
+    using the iterative closest point algorithm.
+
+    Args:
+        points (numpy.ndarray):
+            ``(n, 3)`` points sampled from the source surface.
+        target (motmot.Mesh):
+            The surface to register onto.
+        matrix (numpy.ndarray):
+            The initial ``4x4`` transformation (see :func:`initial_transform`).
+            Defaults to the identity.
+        affine (bool):
+            After converging rigidly, continue allowing affine transformations.
+        iterations (int):
+            The maximum number of iterations (per stage).
+        tolerance (float):
+            Stop once the RMS distance improves by less than this.
+        trim (float):
+            The fraction of closest correspondences to use in each iteration.
+            Excluding the furthest makes the fit robust to parts of either
+            model which the other doesn't have (e.g. a longer gum line).
+    Returns:
+        (numpy.ndarray, float):
+        The refined matrix and the RMS distance from the trimmed points to
+        their matched triangles' planes.
+
+    Each moved point is matched to the triangle whose center is nearest (found
+    using **target**'s KD-tree). The rigid stage uses
+    :func:`point_to_plane_step`. The affine stage uses :func:`affine_fit` to
+    fit each point to its projection onto its matched triangle's plane.
+
+    """
+    points = np.asarray(points, dtype=np.float64)
+    matrix = np.eye(4) if matrix is None else np.asarray(matrix, np.float64)
+    centers = target.centers.astype(np.float64)
+    normals = target.units.astype(np.float64)
+    dtype = target.kdtree.data.dtype
+
+    def correspondences(matrix):
+        moved = transform(matrix, points)
+        distances, ids = target.kdtree.query(moved.astype(dtype))
+        keep = distances <= np.percentile(distances, trim * 100)
+        moved, ids = moved[keep], ids[keep]
+        offsets = np.einsum("ij,ij->i", centers[ids] - moved, normals[ids])
+        rms = np.sqrt(np.mean(offsets**2))
+        return keep, moved, normals[ids], moved + offsets[:, np.newaxis] \
+            * normals[ids], rms
+
+    def rigid_step(matrix, keep, moved, normals, projected):
+        return point_to_plane_step(moved, projected, normals) @ matrix
+
+    def affine_step(matrix, keep, moved, normals, projected):
+        return affine_fit(points[keep], projected)
+
+    state = correspondences(matrix)
+    for step in [rigid_step, affine_step] if affine else [rigid_step]:
+        for _ in range(iterations):
+            candidate = step(matrix, *state[:-1])
+            new_state = correspondences(candidate)
+            if new_state[-1] > state[-1]:
+                break
+            improvement = state[-1] - new_state[-1]
+            matrix, state = candidate, new_state
+            if improvement < tolerance:
+                break
+    return matrix, state[-1]
+
+
+def sample_vertices(mesh, samples=2000, seed=0):
+    """Choose a reproducible random subset of a mesh's vertices."""
+    vertices = mesh.vertices.astype(np.float64)
+    if len(vertices) <= samples:
+        return vertices
+    random = np.random.default_rng(seed)
+    return vertices[random.choice(len(vertices), samples, replace=False)]
+
+
+def arch_type(path):
+    """Get a model's arch type from its filename or None if it has none."""
+    try:
+        return pangolin.arch_type(_dataset.model_name(path))
+    except Exception:
+        return None
+
+
+class Reference:
+    """A model with known landmarks, ready to be registered onto other models.
+
+    Args:
+        path:
+            The reference model's filename. Its landmarks are read from
+            :func:`_dataset.csv_path`.
+        samples:
+            How many vertices to use for :func:`icp`.
+
+    Raises:
+        OSError: If either file can't be read.
+        ValueError: If the model has no triangles.
+
+    """
+    def __init__(self, path, samples=2000):
+        self.path = Path(path)
+        self.arch_type = arch_type(self.path)
+        self.mesh, self.odometry = _dataset.read_model(self.path)
+        if not len(self.mesh):
+            raise ValueError(f"{self.path} has no triangles.")
+        self.names, points = _csv_io.read_named(_dataset.csv_path(self.path))
+        self.points = np.array(
+            [(np.nan,) * 3 if i is None else i for i in points],
+            dtype=np.float64).reshape((-1, 3))
+        self.samples = sample_vertices(self.mesh, samples)
+
+    def register(self, mesh, odometry=None, affine=False):
+        """Find the transform mapping this reference onto another mesh.
+
+        Returns:
+            (numpy.ndarray, float): See :func:`icp`.
+
+        """
+        matrix = initial_transform(self.mesh, mesh, self.odometry, odometry)
+        return icp(self.samples, mesh, matrix, affine)
+
+    def propose(self, mesh, odometry=None, affine=False):
+        """Transfer this reference's landmarks onto another mesh.
+
+        Returns:
+            (numpy.ndarray, float): The ``(n, 3)`` proposed points (in the
+            same order as :attr:`names`) and the registration's RMS error.
+
+        """
+        matrix, rms = self.register(mesh, odometry, affine)
+        return _snapping.closest_points(mesh, transform(matrix,
+                                                        self.points)), rms
+
+
+def choose_reference(references, model):
+    """Pick the reference of the same arch type as a model.
+
+    A reference whose arch type can't be determined is used for any model.
+
+    Raises:
+        LookupError: If there is no suitable reference.
+
+    """
+    arch = arch_type(model)
+    for reference in references:
+        if reference.arch_type == arch:
+            return reference
+    for reference in references:
+        if reference.arch_type is None:
+            return reference
+    raise LookupError(f"There is no reference model of arch type {arch}.")
+
+
+def match_names(names, points, wanted):
+    """Reorder proposed points to match a list of landmark names.
+
+    Landmarks in **wanted** but not in **names** are NaN. If the two lists have
+    no names in common but are the same length then they are assumed to be in
+    the same order.
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+    lookup = dict(zip(names, points))
+    if not lookup.keys() & set(wanted) and len(names) == len(wanted):
+        return points.copy()
+    return np.array([lookup.get(i, (np.nan,) * 3) for i in wanted],
+                    dtype=np.float64).reshape((-1, 3))
+
+
+def read_proposals(model):
+    """Read a model's precomputed proposals or return None if there are
+    none.
+
+    Returns:
+        (list[str], numpy.ndarray): Landmark names and points.
+
+    """
+    path = _dataset.proposals_path(model)
+    if not path.exists():
+        return None
+    names, points = _csv_io.read_named(path)
+    return names, np.array([(np.nan,) * 3 if i is None else i for i in points],
+                           dtype=np.float64).reshape((-1, 3))
+
+
+def propose(model, references, affine=False, overwrite=False):
+    """Precompute one model's proposed landmarks.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename.
+        references (list[Reference]):
+            Reference models to choose from (see :func:`choose_reference`).
+        affine (bool):
+            Allow affine rather than just rigid registration.
+        overwrite (bool):
+            Recompute proposals even if they already exist.
+    Returns:
+        dict: A report with keys ``"model"``, ``"proposals"`` (the output
+        filename), ``"reference"``, ``"rms"``, ``"placed"`` (the number of
+        landmarks proposed), ``"skipped"`` (the reason no proposals were
+        computed or None), ``"written"`` and ``"errors"`` (a list of
+        ``(kind, message)`` pairs).
+
+    Models which are references or which already have landmarks are skipped.
+
+    """
+    model = Path(model)
+    output = _dataset.proposals_path(model)
+    report = {
+        "model": str(model),
+        "proposals": str(output),
+        "reference": None,
+        "rms": None,
+        "placed": 0,
+        "skipped": None,
+        "written": False,
+        "errors": [],
+    }
+    if any(model.resolve() == i.path.resolve() for i in references):
+        report["skipped"] = "reference"
+    elif _dataset.csv_path(model).exists():
+        report["skipped"] = "annotated"
+    elif output.exists() and not overwrite:
+        report["skipped"] = "exists"
+    if report["skipped"]:
+        return report
+
+    try:
+        reference = choose_reference(references, model)
+    except LookupError as ex:
+        report["errors"].append(("no reference", str(ex)))
+        return report
+    report["reference"] = str(reference.path)
+    try:
+        mesh, odometry = _dataset.read_model(model)
+        if not len(mesh):
+            raise ValueError("The model has no triangles.")
+    except Exception as ex:
+        report["errors"].append(("unreadable", f"{type(ex).__name__}: {ex}"))
+        return report
+
+    points, rms = reference.propose(mesh, odometry, affine)
+    report["rms"] = float(rms)
+    report["placed"] = int(np.isfinite(points).all(axis=1).sum())
+    _batch.write_text(output, _csv_io.writes(points, names=reference.names))
+    report["written"] = True
+    return report
+
+
+# Each worker process reads the reference models once rather than once per
+# model.
+_worker_references = None
+
+
+def _init_worker(paths):
+    global _worker_references
+    _worker_references = [Reference(i) for i in paths]
+
+
+def _propose_in_worker(args):
+    return propose(args[0], _worker_references, *args[1:])
+
+
+def propose_dataset(root, references, affine=False, overwrite=False, jobs=None):
+    """Precompute proposed landmarks for every unannotated model in a dataset
+    directory.
+
+    Args:
+        root:
+            The dataset directory.
+        references:
+            Filenames of reference models (with landmarks). Each model is
+            registered to the one with the same arch type.
+        affine:
+            Allow affine rather than just rigid registration.
+        overwrite:
+            Recompute existing proposals.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Yields:
+        dict: A report (see :func:`propose`) per model, in order.
+
+    """
+    global _worker_references
+    try:
+        yield from _batch.imap(
+            _propose_in_worker,
+            [(i, affine, overwrite) for i in _dataset.model_paths(root)], jobs,
+            _init_worker, ([Path(i) for i in references],))
+    finally:
+        # If ran in this process (jobs=1), don't keep the references loaded.
+        _worker_references = None
+
+
+class Summary:
+    """Aggregate proposal reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.written = 0
+        self.skipped = 0
+        self.errors = 0
+        self.rms = []
+
+    def add(self, report):
+        self.models += 1
+        self.written += report["written"]
+        self.skipped += bool(report["skipped"])
+        self.errors += len(report["errors"])
+        if report["rms"] is not None:
+            self.rms.append(report["rms"])
+
+    def to_dict(self):
+        out = {
+            "models": self.models,
+            "written": self.written,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+        if self.rms:
+            out["median_rms"] = float(np.median(self.rms))
+            out["max_rms"] = float(np.max(self.rms))
+        return out
+
+    def __str__(self):
+        lines = [
+            f"Proposed landmarks for {self.written}/{self.models} models "
+            f"({self.skipped} skipped)."
+        ]
+        if self.rms:
+            stats = self.to_dict()
+            lines.append(f"Registration RMS: median {stats['median_rms']:.3g}, "
+                         f"max {stats['max_rms']:.3g}")
+        if self.errors:
+            lines.append(f"{self.errors} errors.")
+        return "\n".join(lines)
+
+
+def format_report(report):
+    """Format a report as one line per model (plus one per error)."""
+    name = _dataset.model_name(report["model"])
+    if report["skipped"]:
+        line = f"{name}: skipped ({report['skipped']})"
+    elif report["written"]:
+        line = f"{name}: {report['placed']} landmarks from " \
+               f"{_dataset.model_name(report['reference'])}, " \
+               f"RMS {report['rms']:.3g}"
+    else:
+        line = f"{name}: failed"
+    return "\n".join(
+        [line] +
+        [f"    {kind}: {message}" for (kind, message) in report["errors"]])
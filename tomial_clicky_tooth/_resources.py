@@ -0,0 +1,90 @@
+"""Account for the memory and objects held by a session, to catch leaks.
+
+Long lived objects which are expected to be released when a model is closed
+are registered with :func:`track` when created. :func:`live` then counts how
+many of them are still alive. If that creeps up as models are switched, then
+something is holding onto them. :func:`snapshot` gathers these counts and the
+process's resident memory. The UI adds what it can see itself (VTK actors,
+undo history, etc.), see ``UI.resources()``.
+
+"""
+
+import os
+import sys
+import weakref
+import collections
+
+import numpy as np
+
+_live = collections.defaultdict(weakref.WeakSet)
+
+
+def track(kind, obj):
+    """Register an object whose lifetime should be monitored.
+
+    Args:
+        kind:
+            A (plural) name to group it under e.g. ``"meshes"``.
+        obj:
+            Anything which can be weakly referenced.
+
+    Returns:
+        The unmodified **obj** for convenience.
+
+    """
+    _live[kind].add(obj)
+    return obj
+
+
+def live(kind):
+    """List the objects of a given kind which haven't yet been deleted."""
+    return list(_live[kind])
+
+
+def nbytes(obj):
+    """Estimate the memory held by an object's NumPy array attributes
+    (including lazily evaluated ones)."""
+    try:
+        attributes = vars(obj).values()
+    except TypeError:  # pragma: no cover
+        return 0
+    return sum(i.nbytes for i in attributes if isinstance(i, np.ndarray))
+
+
+def rss():
+    """The current resident memory size of this process in bytes (or None if
+    it can't be determined on this platform)."""
+    if sys.platform.startswith("linux"):
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    try:  # pragma: no cover
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:  # pragma: no cover
+        return None
+
+
+def snapshot():
+    """Count the tracked objects which are still alive.
+
+    Returns:
+        dict: Including ``"rss bytes"``, the count for each tracked kind of
+        object and ``"mesh bytes"`` for the arrays held by live meshes.
+
+    """
+    out = {"rss bytes": rss()}
+    for kind in sorted(_live):
+        out[kind] = len(_live[kind])
+    out["mesh bytes"] = sum(map(nbytes, live("meshes")))
+    return out
+
+
+def format_bytes(n):
+    """Format a memory size for humans."""
+    if n is None:
+        return "?"
+    for unit in ["B", "kB", "MB"]:
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
@@ -0,0 +1,243 @@
+"""Find broken and duplicated models in a dataset.
+
+Models are checked for being readable, non-empty, finite and free of zero area
+triangles, then compared by file hash, geometry hash and a pose invariant
+geometric fingerprint (to catch near duplicates). Results are cached against
+each file's path, size and modification time.
+
+"""
+
+import os
+import collections
+from pathlib import Path
+
+import numpy as np
+
+from tomial_clicky_tooth import _batch, _cache, _dataset, _meshfile
+
+_results_cache = _cache.Cache("scan")
+
+#: Bin edges, in multiples of a mesh's RMS radius, of the fingerprint's
+#: radial histogram.
+RADIAL_BINS = np.linspace(0, 3, 13)
+
+
+def fingerprint(mesh):
+    """Summarise a mesh's shape in a handful of numbers.
+
+    Args:
+        mesh (motmot.Mesh):
+            A non-empty mesh.
+    Returns:
+        numpy.ndarray: Its surface area, the standard deviations of its
+        surface along its three principal axes (largest first) then the
+        fraction of its surface area at each of :attr:`RADIAL_BINS` distances
+        from its centroid.
+
+    """
+    vectors = np.asarray(mesh.vectors, dtype=np.float64)
+    areas = np.linalg.norm(
+        np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0]),
+        axis=1) / 2
+    total = areas.sum()
+    weights = areas / total if total else np.full(len(areas), 1 / len(areas))
+    centers = vectors.mean(axis=1)
+    centroid = weights @ centers
+    offsets = centers - centroid
+    covariance = (offsets * weights[:, np.newaxis]).T @ offsets
+    spreads = np.sqrt(np.clip(np.linalg.eigvalsh(covariance)[::-1], 0, None))
+
+    radii = np.linalg.norm(offsets, axis=1)
+    rms = np.sqrt(weights @ radii**2) or 1.
+    histogram, _ = np.histogram(np.clip(radii / rms, 0, RADIAL_BINS[-1]),
+                                RADIAL_BINS, weights=weights)
+    return np.concatenate([[total], spreads, histogram])
+
+
+def difference(a, b):
+    """How different two fingerprints are, roughly as a fraction: the largest
+    relative difference in area or spread or the fraction of surface area
+    which has to move between radial bins."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    scales = np.maximum(np.abs(a[..., :4]), np.abs(b[..., :4]))
+    sizes = np.abs(a[..., :4] - b[..., :4]) / np.where(scales, scales, 1)
+    histograms = np.abs(a[..., 4:] - b[..., 4:]).sum(axis=-1) / 2
+    return np.maximum(sizes.max(axis=-1), histograms)
+
+
+def scan(model):
+    """Check one model file.
+
+    Returns:
+        dict: A report with keys ``"model"``, ``"hash"`` (of the file's
+        contents), ``"geometry"`` (a hash of its unique vertices),
+        ``"triangles"``, ``"fingerprint"`` (see :func:`fingerprint`) and
+        ``"errors"`` (a list of ``(kind, message)`` pairs). Everything but
+        **model** and **errors** is None if it can't be determined.
+
+    """
+    model = Path(model)
+    report = {
+        "model": str(model),
+        "hash": None,
+        "geometry": None,
+        "triangles": None,
+        "fingerprint": None,
+        "errors": [],
+    }
+    errors = report["errors"]
+    try:
+        data = model.read_bytes()
+        report["hash"] = _cache.hash_bytes(data)
+        suffix = _dataset.SUFFIX_RE.match(model.name)[2]
+        mesh = _meshfile.decode(data, suffix)
+        vectors = np.asarray(mesh.vectors, dtype=np.float32)
+    except Exception as ex:
+        errors.append(("unreadable", f"{type(ex).__name__}: {ex}"))
+        return report
+
+    report["triangles"] = len(vectors)
+    if not len(vectors):
+        errors.append(("empty", "The model has no triangles."))
+        return report
+    if not np.isfinite(vectors).all():
+        errors.append(("non-finite", "Some vertices are infinite or NaN."))
+        return report
+
+    vertices = np.unique(vectors.reshape((-1, 3)), axis=0)
+    report["geometry"] = _cache.hash_bytes(vertices.tobytes() +
+                                           str(len(vectors)).encode())
+    report["fingerprint"] = fingerprint(mesh).tolist()
+    cross = np.cross(vectors[:, 1] - vectors[:, 0],
+                     vectors[:, 2] - vectors[:, 0])
+    degenerate = np.count_nonzero(~cross.any(axis=1))
+    if degenerate == len(vectors):
+        errors.append(("degenerate", "Every triangle has zero area."))
+    elif degenerate:
+        errors.append(("degenerate", f"{degenerate} of {len(vectors)} "
+                       "triangles have zero area."))
+    return report
+
+
+def _cache_key(path):
+    """Identify a file's current version without reading it."""
+    stat = os.stat(path)
+    return _cache.hash_bytes(
+        f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+
+def find_duplicates(reports, tolerance=.02):
+    """Group models which are copies or near copies of each other.
+
+    Args:
+        reports (list[dict]):
+            Reports from :func:`scan`.
+        tolerance (float):
+            Models whose fingerprints :func:`difference` is below this are
+            near duplicates.
+    Returns:
+        list[dict]: Groups with keys ``"kind"`` (``"identical"``,
+        ``"same geometry"`` or ``"similar"``), ``"models"`` and, for similar
+        pairs, ``"difference"``.
+
+    """
+    groups = []
+    # Map models to another which they're an exact copy of.
+    copies = {}
+
+    def find(model):
+        while copies.get(model, model) != model:
+            model = copies[model]
+        return model
+
+    for (kind, key) in (("identical", "hash"), ("same geometry", "geometry")):
+        found = collections.defaultdict(list)
+        for report in reports:
+            if report[key] is not None:
+                found[report[key]].append(report["model"])
+        for models in found.values():
+            roots = list(dict.fromkeys(map(find, models)))
+            if len(roots) > 1:
+                groups.append({"kind": kind, "models": models})
+                for root in roots[1:]:
+                    copies[root] = roots[0]
+
+    # Only compare one of each group of exact copies.
+    usable = [
+        i for i in reports
+        if i["fingerprint"] is not None and find(i["model"]) == i["model"]
+    ]
+    fingerprints = np.array([i["fingerprint"] for i in usable],
+                            dtype=np.float64).reshape((len(usable), -1))
+    for i in range(len(usable)):
+        differences = difference(fingerprints[i], fingerprints[i + 1:])
+        for j in np.nonzero(differences < tolerance)[0]:
+            groups.append({
+                "kind": "similar",
+                "models": [usable[i]["model"], usable[i + 1 + j]["model"]],
+                "difference": float(differences[j]),
+            })
+    return groups
+
+
+def scan_dataset(root, tolerance=.02, jobs=None):
+    """Check every model in a dataset directory and look for duplicates.
+
+    Args:
+        root:
+            The dataset directory.
+        tolerance:
+            See :func:`find_duplicates`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Returns:
+        dict: A report with keys ``"models"`` (a report from :func:`scan` per
+        model), ``"duplicates"`` (see :func:`find_duplicates`) and
+        ``"scanned"`` (how many models had to be read rather than coming
+        from the cache).
+
+    """
+    paths = _dataset.model_paths(root)
+    reports = {}
+    keys = {}
+    misses = []
+    for path in paths:
+        keys[path] = _cache_key(path)
+        cached = _results_cache.read_json(keys[path])
+        if cached is not None:
+            # JSON turns tuples into lists.
+            cached["errors"] = [tuple(i) for i in cached["errors"]]
+            reports[path] = {**cached, "model": str(path)}
+        else:
+            misses.append(path)
+    for (path, report) in zip(misses, _batch.imap(scan, misses, jobs)):
+        reports[path] = report
+        _results_cache.write_json(keys[path], report)
+
+    models = [reports[i] for i in paths]
+    return {
+        "models": models,
+        "duplicates": find_duplicates(models, tolerance),
+        "scanned": len(misses),
+    }
+
+
+def format_report(report):
+    """Format a :func:`scan_dataset` report as lines of text."""
+    lines = []
+    for model in report["models"]:
+        for (kind, message) in model["errors"]:
+            lines.append(f"{_dataset.model_name(model['model'])}: {kind}: "
+                         f"{message}")
+    for group in report["duplicates"]:
+        names = ", ".join(Path(i).name for i in group["models"])
+        line = f"{group['kind']}: {names}"
+        if "difference" in group:
+            line += f" ({group['difference']:.2%} different)"
+        lines.append(line)
+    broken = sum(bool(i["errors"]) for i in report["models"])
+    lines.append(f"{len(report['models'])} models, {broken} with problems, "
+                 f"{len(report['duplicates'])} duplicate groups "
+                 f"({report['scanned']} read, the rest cached).")
+    return "\n".join(lines)
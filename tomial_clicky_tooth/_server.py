@@ -0,0 +1,472 @@
+"""An optional annotation server so that several annotators can work on one
+dataset at once without overwriting each other's landmarks.
+
+Without it, each UI writes its landmarks straight to ``<model>.csv`` so two
+people with the same model open silently clobber each other. With it, the
+landmarks live in a SQLite database owned by one server process which::
+
+    python -m tomial_clicky_tooth serve path/to/dataset --port 8765
+
+runs, and UIs launched with ``TOMIAL_CLICKY_TOOTH_SERVER=http://host:8765``
+(or connected via File > Connect To Server) go through it instead:
+
+* Opening a model takes out a *lease* on it. Only the lease holder may change
+  its landmarks. Leases expire if not renewed so a crashed UI never locks a
+  model forever.
+* Saving sends only the landmarks which have changed, all in one request
+  which is applied in one transaction.
+* Every update bumps the model's *revision*. An update based on an out of
+  date revision is rejected rather than reverting someone else's work.
+
+The server also writes each model's CSV back into the dataset after every
+update so that the batch tools (see :mod:`_cli`) carry on working unchanged.
+
+SQLite's write-ahead log (WAL) mode lets readers carry on while a write is in
+progress and each write is a short ``BEGIN IMMEDIATE`` transaction so dozens
+of clients never contend for long. WAL needs the database on a local disk of
+the machine running the server (not a network share, where datasets usually
+live) so it defaults to one per dataset in the local cache directory (see
+:func:`default_database`). Losing it loses only leases and revisions since the
+CSVs are always up to date. The protocol is plain JSON over HTTP (see
+:class:`Client`) and everything here is standard library only and never
+imports Qt.
+
+"""
+
+import json
+import time
+import socket
+import getpass
+import sqlite3
+import threading
+import contextlib
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from tomial_clicky_tooth import _batch, _cache, _csv_io
+from tomial_clicky_tooth._timing import timed
+
+SERVER_ENV = "TOMIAL_CLICKY_TOOTH_SERVER"
+DEFAULT_PORT = 8765
+LEASE_DURATION = 600.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    model TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL DEFAULT 0,
+    holder TEXT,
+    expires REAL
+);
+CREATE TABLE IF NOT EXISTS landmarks (
+    model TEXT NOT NULL,
+    name TEXT NOT NULL,
+    x REAL,
+    y REAL,
+    z REAL,
+    PRIMARY KEY (model, name)
+);
+"""
+
+
+class LeaseError(Exception):
+    """Someone else is annotating this model."""
+    def __init__(self, model, holder, expires):
+        self.model = model
+        self.holder = holder
+        self.expires = expires
+        if holder is None:
+            super().__init__(f"{model} has not been leased.")
+        else:
+            super().__init__(f"{model} is being annotated by {holder}.")
+
+
+class ConflictError(Exception):
+    """The landmarks have been changed since they were last read."""
+    def __init__(self, model, revision):
+        self.model = model
+        self.revision = revision
+        super().__init__(f"{model}'s landmarks have been changed by someone "
+                         f"else (now at revision {revision}).")
+
+
+def _check_model(model):
+    # Model names become filenames (see Store.export) so must not be able to
+    # point outside of the dataset.
+    if not model or model != Path(model).name or model.startswith("."):
+        raise ValueError(f"Invalid model name {model!r}.")
+
+
+def default_owner():
+    """Identify this user to the server."""
+    return f"{getpass.getuser()}@{socket.gethostname()}"
+
+
+class Store:
+    """The annotation database.
+
+    Every method is safe to call from any thread or process at the same time.
+
+    Args:
+        path:
+            The SQLite database filename. Created if it doesn't exist.
+        dataset:
+            If given, write ``<dataset>/<model>.csv`` after each update.
+        timeout:
+            How long to wait for another writer to finish before giving up.
+
+    """
+    def __init__(self, path, dataset=None, timeout=30.):
+        self.path = Path(path)
+        self.dataset = None if dataset is None else Path(dataset)
+        self.timeout = timeout
+        self._export_lock = threading.Lock()
+        with self._connect() as connection:
+            # Unlike the other settings, WAL mode is stored in the database.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One connection per call is cheap and avoids sharing connections
+        # between the server's threads.
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)
+        try:
+            connection.execute("PRAGMA synchronous=NORMAL")
+            yield connection
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Open a write transaction. Taking the write lock up front (rather
+        than on the first write) means that two transactions can never both
+        read and then deadlock trying to write."""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    @staticmethod
+    def _check_lease(connection, model, owner, now):
+        row = connection.execute(
+            "SELECT holder, expires FROM models WHERE model = ?",
+            (model,)).fetchone()
+        if row is not None and row[0] not in (None, owner) and row[1] > now:
+            raise LeaseError(model, *row)
+
+    def lease(self, model, owner, duration=LEASE_DURATION):
+        """Take out or renew the exclusive right to edit a model.
+
+        Returns:
+            float: When the lease expires (a :func:`time.time`).
+        Raises:
+            LeaseError: If someone else holds an unexpired lease.
+
+        """
+        _check_model(model)
+        now = time.time()
+        with self._transaction() as connection:
+            self._check_lease(connection, model, owner, now)
+            connection.execute(
+                "INSERT INTO models (model, holder, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (model) DO UPDATE "
+                "SET holder = excluded.holder, expires = excluded.expires",
+                (model, owner, now + duration))
+        return now + duration
+
+    def release(self, model, owner):
+        """Give up a lease. Does nothing if **owner** doesn't hold it."""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE models SET holder = NULL, expires = NULL "
+                "WHERE model = ? AND holder = ?", (model, owner))
+
+    def landmarks(self, model):
+        """Get a model's current landmarks.
+
+        Returns:
+            dict: With keys ``"names"``, ``"points"`` (``[x, y, z]`` or None
+            for unset ones), ``"revision"`` (0 if it has never been saved),
+            ``"holder"`` and ``"expires"`` (None if not leased).
+
+        """
+        # A read transaction gives a consistent snapshot without blocking (or
+        # being blocked by) writers.
+        with self._connect() as connection:
+            connection.execute("BEGIN")
+            row = connection.execute(
+                "SELECT revision, holder, expires FROM models WHERE model = ?",
+                (model,)).fetchone()
+            landmarks = connection.execute(
+                "SELECT name, x, y, z FROM landmarks WHERE model = ? "
+                "ORDER BY rowid", (model,)).fetchall()
+            connection.execute("COMMIT")
+        revision, holder, expires = row or (0, None, None)
+        if expires is not None and expires <= time.time():
+            holder = expires = None
+        return {
+            "names": [i[0] for i in landmarks],
+            "points": [
+                None if x is None else [x, y, z] for (_, x, y, z) in landmarks
+            ],
+            "revision": revision,
+            "holder": holder,
+            "expires": expires,
+        }
+
+    def update(self, model, owner, names, points, revision=None):
+        """Change some of a model's landmarks in one transaction.
+
+        Args:
+            model:
+                The model's name (see :func:`_dataset.model_name`).
+            owner:
+                Who is changing them. Must hold the model's lease.
+            names:
+                The landmarks to change. New names are appended in order.
+            points:
+                The new ``(x, y, z)`` of each landmark in **names** or None to
+                unset it.
+            revision:
+                The revision these changes were based on (see
+                :meth:`landmarks`). If given and the model has since moved on,
+                nothing is changed.
+        Returns:
+            int: The model's new revision.
+        Raises:
+            LeaseError: If **owner** doesn't hold the lease.
+            ConflictError: If **revision** is out of date.
+
+        """
+        _check_model(model)
+        rows = []
+        for (name, point) in zip(names, points):
+            point = (None,) * 3 if point is None else tuple(map(float, point))
+            if len(point) != 3:
+                raise ValueError(f"Invalid point {point} for {name}.")
+            rows.append((model, name, *point))
+        with self._transaction() as connection:
+            now = time.time()
+            self._check_lease(connection, model, owner, now)
+            row = connection.execute(
+                "SELECT revision, holder FROM models WHERE model = ?",
+                (model,)).fetchone()
+            current, holder = row or (0, None)
+            if holder != owner:
+                raise LeaseError(model, holder, None)
+            if revision is not None and revision != current:
+                raise ConflictError(model, current)
+            connection.executemany(
+                "INSERT INTO landmarks (model, name, x, y, z) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (model, name) DO UPDATE "
+                "SET x = excluded.x, y = excluded.y, z = excluded.z", rows)
+            connection.execute("UPDATE models SET revision = ? WHERE model = ?",
+                               (current + 1, model))
+        if self.dataset is not None:
+            self.export(model)
+        return current + 1
+
+    def export(self, model):
+        """Write a model's landmarks to its CSV in :attr:`dataset`."""
+        # Re-read under a lock so that concurrent exports can't overwrite a
+        # newer revision with an older one.
+        with self._export_lock:
+            landmarks = self.landmarks(model)
+            _batch.write_text(
+                self.dataset / f"{model}.csv",
+                _csv_io.writes(landmarks["points"], names=landmarks["names"]))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """The HTTP API. All requests and responses are JSON.
+
+    * ``GET /models/<model>``: :meth:`Store.landmarks`.
+    * ``POST /models/<model>/lease``: :meth:`Store.lease`.
+    * ``POST /models/<model>/release``: :meth:`Store.release`.
+    * ``POST /models/<model>/landmarks``: :meth:`Store.update`.
+
+    Lease and revision conflicts are returned as *409 Conflict*.
+
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _route(self):
+        parts = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "models":
+            return None, None
+        return urllib.parse.unquote(parts[1]), "/".join(parts[2:])
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        model, action = self._route()
+        if model is None or action:
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, self.server.store.landmarks(model))
+
+    def do_POST(self):
+        model, action = self._route()
+        store = self.server.store
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            owner = body["owner"]
+            with timed(f"serve {action}"):
+                if action == "lease":
+                    result = {
+                        "expires":
+                            store.lease(model, owner,
+                                        body.get("duration", LEASE_DURATION))
+                    }
+                elif action == "release":
+                    store.release(model, owner)
+                    result = {}
+                elif action == "landmarks":
+                    result = {
+                        "revision":
+                            store.update(model, owner, body["names"],
+                                         body["points"], body.get("revision"))
+                    }
+                else:
+                    return self._reply(404, {"error": "not found"})
+        except LeaseError as ex:
+            self._reply(409, {
+                "error": "lease",
+                "holder": ex.holder,
+                "expires": ex.expires
+            })
+        except ConflictError as ex:
+            self._reply(409, {"error": "conflict", "revision": ex.revision})
+        except (KeyError, TypeError, ValueError) as ex:
+            self._reply(400, {"error": f"{type(ex).__name__}: {ex}"})
+        else:
+            self._reply(200, result)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Server(ThreadingHTTPServer):
+    """Serve a :class:`Store` over HTTP, one thread per connection.
+
+    Call :meth:`serve_forever` to run it.
+
+    """
+    daemon_threads = True
+    # Allow for dozens of clients connecting at once.
+    request_queue_size = 128
+
+    def __init__(self, store, host="localhost", port=DEFAULT_PORT,
+                 verbose=False):
+        self.store = store
+        self.verbose = verbose
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class Client:
+    """Talk to a :class:`Server`. Has the same methods as :class:`Store`
+    minus the **owner** arguments.
+
+    Args:
+        url:
+            The server's address, e.g. ``http://localhost:8765``.
+        owner:
+            Who to take out leases as. Defaults to ``user@hostname``.
+        timeout:
+            Seconds to wait for a response.
+
+    Network failures raise :class:`OSError`.
+
+    """
+    def __init__(self, url, owner=None, timeout=10.):
+        self.url = url.rstrip("/")
+        self.owner = owner or default_owner()
+        self.timeout = timeout
+
+    def _request(self, model, action="", body=None):
+        url = f"{self.url}/models/{urllib.parse.quote(model, safe='')}"
+        if action:
+            url += "/" + action
+        data = None
+        if body is not None:
+            data = json.dumps({"owner": self.owner, **body}).encode()
+        request = urllib.request.Request(url, data,
+                                         {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as f:
+                return json.loads(f.read())
+        except urllib.error.HTTPError as ex:
+            if ex.code != 409:
+                raise
+            error = json.loads(ex.read())
+            if error["error"] == "lease":
+                raise LeaseError(model, error["holder"],
+                                 error["expires"]) from None
+            raise ConflictError(model, error["revision"]) from None
+
+    def lease(self, model, duration=LEASE_DURATION):
+        return self._request(model, "lease", {"duration": duration})["expires"]
+
+    def release(self, model):
+        self._request(model, "release", {})
+
+    def landmarks(self, model):
+        return self._request(model)
+
+    def update(self, model, names, points, revision=None):
+        points = [None if i is None else list(map(float, i)) for i in points]
+        return self._request(model, "landmarks", {
+            "names": list(names),
+            "points": points,
+            "revision": revision,
+        })["revision"]
+
+
+def default_database(dataset):
+    """Where a dataset's database is kept unless told otherwise: in the local
+    cache directory (see :func:`_cache.cache_root`), keyed by the dataset's
+    absolute path."""
+    dataset = Path(dataset).resolve()
+    key = _cache.hash_bytes(str(dataset).encode())[:16]
+    return _cache.cache_root() / "server" / f"{dataset.name}-{key}.sqlite"
+
+
+def serve(dataset, database=None, host="localhost", port=DEFAULT_PORT,
+          verbose=False):
+    """Create a server for a dataset.
+
+    Args:
+        dataset:
+            The dataset directory whose CSVs are kept up to date.
+        database:
+            The SQLite database, which must be on a local disk. Defaults to
+            :func:`default_database`.
+    Returns:
+        Server: Call its ``serve_forever()`` method to start serving.
+
+    """
+    dataset = Path(dataset)
+    if database is None:
+        database = default_database(dataset)
+        database.parent.mkdir(parents=True, exist_ok=True)
+    return Server(Store(database, dataset), host, port, verbose)
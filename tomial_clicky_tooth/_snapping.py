@@ -0,0 +1,289 @@
+"""Move landmarks which are slightly off a model's surface onto it.
+
+Landmarks imported from other tools or pasted in are often a little above or
+below the surface. :func:`snap_dataset` moves every landmark in every CSV of a
+dataset to the closest point on its model's surface (in a process pool),
+reporting how far each one moved and optionally rewriting the CSVs::
+
+    python -m tomial_clicky_tooth snap path/to/dataset [--write]
+
+Closest points are exact: candidate triangles are found using the mesh's
+KD-tree of triangle centers and then each is tested with a vectorised
+closest-point-on-triangle query.
+
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from tomial_clicky_tooth import _batch, _csv_io, _dataset
+
+
+def _dot(a, b):
+    return np.einsum("...i,...i->...", a, b)
+
+
+def closest_points_on_triangles(points, a, b, c):
+    """Find the closest point on each triangle ``(a, b, c)`` to each point.
+
+    All arguments are broadcastable arrays of 3D coordinates. This is the
+    vectorised form of the Voronoi region test from Ericson's *Real-Time
+    Collision Detection* (section 5.1.5).
+
+    """
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1 = _dot(ab, ap)
+    d2 = _dot(ac, ap)
+    d3 = _dot(ab, bp)
+    d4 = _dot(ac, bp)
+    d5 = _dot(ab, cp)
+    d6 = _dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Start with the projection onto the triangle's plane (correct if it
+        # lies inside the triangle) then overwrite with each edge or corner
+        # region which the point lies in front of. The later assignments take
+        # precedence in the case of degeneracies.
+        denominator = va + vb + vc
+        out = a + ab * (vb / denominator)[..., np.newaxis] \
+                + ac * (vc / denominator)[..., np.newaxis]
+        regions = [
+            # Edge BC.
+            ((va <= 0) & (d4 >= d3) & (d5 >= d6),
+             b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[..., None]),
+            # Edge AC.
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0),
+             a + ac * (d2 / (d2 - d6))[..., None]),
+            # Corner C.
+            ((d6 >= 0) & (d5 <= d6), c),
+            # Edge AB.
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0),
+             a + ab * (d1 / (d1 - d3))[..., None]),
+            # Corner B.
+            ((d3 >= 0) & (d4 <= d3), b),
+            # Corner A.
+            ((d1 <= 0) & (d2 <= 0), a),
+        ]  # yapf: disable
+        for (mask, region) in regions:
+            out = np.where(mask[..., np.newaxis], region, out)
+    return out
+
+
+def closest_points(mesh, points, k=8):
+    """Find the closest point on a mesh's surface to each of some points.
+
+    Args:
+        mesh (motmot.Mesh):
+            The surface.
+        points (numpy.ndarray):
+            An ``(n, 3)`` array of points. NaN points are ignored.
+        k (int):
+            How many candidate triangles to try for each point initially. Any
+            point for which that isn't enough to guarantee a correct answer is
+            retried with more.
+    Returns:
+        numpy.ndarray: The ``(n, 3)`` closest points.
+
+    """
+    points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+    out = np.full_like(points, np.nan)
+    vectors = mesh.vectors.astype(np.float64)
+    if not len(vectors):
+        return out
+    centers = vectors.mean(axis=1)
+    # No point on a triangle is further than this from its center.
+    radius = np.linalg.norm(vectors - centers[:, np.newaxis], axis=-1).max()
+
+    todo = np.nonzero(np.isfinite(points).all(axis=1))[0]
+    k = min(k, len(vectors))
+    while len(todo):
+        query = points[todo]
+        center_distances, ids = mesh.kdtree.query(
+            query.astype(mesh.kdtree.data.dtype), k=k)
+        center_distances = center_distances.reshape((len(todo), k))
+        candidates = vectors[ids.reshape((len(todo), k))]
+        nearest = closest_points_on_triangles(
+            query[:, np.newaxis], candidates[:, :, 0], candidates[:, :, 1],
+            candidates[:, :, 2])
+        distances = np.linalg.norm(nearest - query[:, np.newaxis], axis=-1)
+        distances[np.isnan(distances)] = np.inf
+        best = distances.argmin(axis=1)
+        rows = np.arange(len(todo))
+        out[todo] = nearest[rows, best]
+
+        # Any triangle not yet considered has its center further away than the
+        # furthest candidate's center. If even that is too far for any part of
+        # it to beat the best so far then the answer is final.
+        final = center_distances[:, -1] - radius >= distances[rows, best]
+        if k == len(vectors):
+            break
+        todo = todo[~final]
+        k = min(k * 4, len(vectors))
+    return out
+
+
+def snap(model, write=False, max_distance=None, tolerance=1e-6):
+    """Snap one model's landmarks onto its surface.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename. Its landmarks are read from (and optionally
+            written back to) :func:`_dataset.csv_path`.
+        write (bool):
+            Overwrite the CSV with the snapped landmarks.
+        max_distance (float):
+            Leave landmarks further than this from the surface where they are
+            and report them as errors. They're more likely to be mistakes than
+            slightly inaccurate.
+        tolerance (float):
+            Don't rewrite a CSV if no landmark moved further than this.
+    Returns:
+        dict: A report with keys ``"model"``, ``"csv"``, ``"names"``,
+        ``"displacements"`` (the distance each landmark moved or None if
+        unset), ``"written"`` and ``"errors"`` (a list of ``(kind, message)``
+        pairs).
+
+    """
+    model = Path(model)
+    csv = _dataset.csv_path(model)
+    report = {
+        "model": str(model),
+        "csv": str(csv),
+        "names": [],
+        "displacements": [],
+        "written": False,
+        "errors": [],
+    }
+    if not csv.exists():
+        return report
+    try:
+        names, points = _csv_io.read_named(csv)
+        mesh = _dataset.read_mesh(model)
+        if not len(mesh):
+            raise ValueError("The model has no triangles.")
+    except Exception as ex:
+        report["errors"].append(("unreadable", f"{type(ex).__name__}: {ex}"))
+        return report
+
+    points = np.array([(np.nan,) * 3 if i is None else i for i in points],
+                      dtype=np.float64).reshape((-1, 3))
+    try:
+        if not np.isfinite(mesh.vectors).all():
+            raise ValueError("Some vertices are infinite or NaN.")
+        snapped = closest_points(mesh, points)
+    except Exception as ex:
+        report["errors"].append(("unsnappable", f"{type(ex).__name__}: {ex}"))
+        return report
+    displacements = np.linalg.norm(snapped - points, axis=1)
+    if max_distance is not None:
+        for i in np.nonzero(displacements > max_distance)[0]:
+            report["errors"].append(
+                ("too far", f"{names[i]} is {displacements[i]:.3g} from the "
+                 "surface"))
+            snapped[i] = points[i]
+    report["names"] = names
+    report["displacements"] = [
+        None if np.isnan(i) else float(i) for i in displacements
+    ]
+
+    moved = np.linalg.norm(snapped - points, axis=1)
+    if write and np.nanmax(moved, initial=0) > tolerance:
+        _batch.write_text(csv, _csv_io.writes(snapped, names=names))
+        report["written"] = True
+    return report
+
+
+def _snap_in_worker(args):
+    return snap(*args)
+
+
+def snap_dataset(root, write=False, max_distance=None, tolerance=1e-6,
+                 jobs=None):
+    """Snap every model's landmarks in a dataset directory.
+
+    Args:
+        root:
+            The dataset directory.
+        write:
+            Overwrite the CSVs with the snapped landmarks.
+        max_distance:
+            See :func:`snap`.
+        tolerance:
+            See :func:`snap`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Yields:
+        dict: A report (see :func:`snap`) per model with landmarks, in order.
+
+    """
+    paths = [
+        i for i in _dataset.model_paths(root) if _dataset.csv_path(i).exists()
+    ]
+    yield from _batch.imap(_snap_in_worker,
+                           [(i, write, max_distance, tolerance) for i in paths],
+                           jobs)
+
+
+class Summary:
+    """Aggregate snapping reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.written = 0
+        self.errors = 0
+        self.displacements = []
+
+    def add(self, report):
+        self.models += 1
+        self.written += report["written"]
+        self.errors += len(report["errors"])
+        self.displacements += [
+            i for i in report["displacements"] if i is not None
+        ]
+
+    def to_dict(self):
+        out = {
+            "models": self.models,
+            "written": self.written,
+            "errors": self.errors,
+            "landmarks": len(self.displacements),
+        }
+        if self.displacements:
+            d = np.array(self.displacements)
+            p95 = np.percentile(d, 95)
+            out.update(mean=d.mean(), median=np.median(d), p95=p95, max=d.max())
+        return {i: float(j) if isinstance(j, np.floating) else j
+                for (i, j) in out.items()}  # yapf: disable
+
+    def __str__(self):
+        stats = self.to_dict()
+        lines = [f"{stats['landmarks']} landmarks in {self.models} models."]
+        if self.displacements:
+            lines.append("Displacement: " +
+                         ", ".join(f"{i} {stats[i]:.3g}"
+                                   for i in ("mean", "median", "p95", "max")))
+        lines.append(f"{self.written} CSVs rewritten.")
+        if self.errors:
+            lines.append(f"{self.errors} errors.")
+        return "\n".join(lines)
+
+
+def format_report(report):
+    """Format a report as one line per model (plus one per error)."""
+    name = _dataset.model_name(report["model"])
+    displacements = [i for i in report["displacements"] if i is not None]
+    line = f"{name}: {len(displacements)} landmarks"
+    if displacements:
+        line += f", max displacement {max(displacements):.3g}"
+    if report["written"]:
+        line += " (rewritten)"
+    return "\n".join(
+        [line] +
+        [f"    {kind}: {message}" for (kind, message) in report["errors"]])
@@ -0,0 +1,356 @@
+"""Render PNG snapshots of models and their landmarks for QA review without
+opening the UI.
+
+Rendering is offscreen so it needs no display, only OpenGL. VTK is only
+imported once something is rendered.
+
+"""
+
+import os
+import html
+from pathlib import Path
+
+import numpy as np
+
+from tomial_clicky_tooth import _batch, _cache, _csv_io, _dataset
+from tomial_clicky_tooth._colors import Colors
+
+# The same directions as vtkplotlib's QtFigure2 camera buttons.
+PRESET_NAMES = ("Right", "Left", "Front", "Back", "Top", "Bottom")
+VIEWS = ("Occlusal",) + PRESET_NAMES
+DEFAULT_VIEWS = ("Occlusal", "Front", "Left", "Right")
+
+
+def preset_views(odometry=None):
+    """Get the camera parameters for each preset view.
+
+    Args:
+        odometry (tomial_odometry.Odometry):
+            The model's orientation. If provided, the views are rotated to match
+            the patient (as :meth:`ClickableFigure.open_model` does to the UI's
+            camera buttons) and the ``"Occlusal"`` view (the UI's initial view)
+            is added.
+    Returns:
+        dict: Maps each view name to keyword arguments for
+        :func:`vtkplotlib.view`.
+
+    """
+    out = {}
+    for (i, name) in enumerate(PRESET_NAMES):
+        direction = np.eye(3)[i // 2] * (1, -1)[i % 2]
+        up = np.eye(3)[2] if i < 4 else np.eye(3)[1]
+        out[name] = {"camera_position": direction, "up_view": up}
+    if odometry is not None:
+        axes = np.asarray(odometry.axes, dtype=np.float64)
+        for view in out.values():
+            for key in view:
+                view[key] = view[key] @ axes
+        out["Occlusal"] = {
+            "camera_position": np.asarray(odometry.occlusal, np.float64),
+            "up_view": np.asarray(odometry.forwards, np.float64),
+        }
+    return out
+
+
+def snapshot(mesh, points=(), names=(), odometry=None, views=DEFAULT_VIEWS,
+             size=(800, 600), labels=True):
+    """Render a model and its landmarks offscreen.
+
+    Args:
+        mesh (motmot.Mesh):
+            The model.
+        points (numpy.ndarray):
+            ``(n, 3)`` landmarks. NaN (unset) ones are skipped.
+        names (list[str]):
+            The landmarks' names, used to label them if **labels** is true.
+        odometry (tomial_odometry.Odometry):
+            The model's orientation (see :func:`preset_views`).
+        views (list[str]):
+            Which views to render. Views which need an odometry are silently
+            skipped if there isn't one.
+        size (tuple[int, int]):
+            Image ``(width, height)`` in pixels.
+    Returns:
+        dict: Maps each view to an ``(height, width, 3)`` RGB image array.
+    Raises:
+        ValueError: For an unknown view name.
+
+    """
+    import vtkplotlib as vpl
+
+    for view in views:
+        if view not in VIEWS:
+            raise ValueError(f"Unknown view '{view}'. Views are {VIEWS}.")
+    presets = preset_views(odometry)
+    points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+    placed = np.isfinite(points).all(axis=1)
+
+    fig = vpl.figure()
+    try:
+        fig.background_color = Colors.BACKGROUND
+        fig.render_size = size
+        vpl.mesh_plot(mesh, fig=fig)
+        if placed.any():
+            vpl.scatter(points[placed], color=Colors.MARKER, fig=fig,
+                        use_cursors=True)
+        if labels:
+            scale = np.ptp(mesh.vertices, axis=0).max() / 60
+            for (name, point, placed_) in zip(names, points, placed):
+                if placed_:
+                    vpl.text3d(name, point + scale, scale=scale,
+                               color=Colors.HIGHLIGHTED, fig=fig)
+        out = {}
+        for view in views:
+            if view not in presets:
+                continue
+            vpl.view(**presets[view], fig=fig)
+            vpl.reset_camera(fig=fig)
+            out[view] = vpl.screenshot_fig(fig=fig, off_screen=True)[..., :3]
+        return out
+    finally:
+        fig.close()
+
+
+_thumbnail_cache = _cache.Cache("thumbnails")
+
+
+def thumbnail(model, size=(160, 120)):
+    """Render a small snapshot of a model (without its landmarks) for the
+    dataset browser.
+
+    The occlusal view is used if the model can be orientated, otherwise the
+    top view. Thumbnails are cached by the model file's contents so each is
+    only ever rendered once.
+
+    Returns:
+        bytes: A PNG image.
+    Raises:
+        Exception: If the model is unreadable.
+
+    """
+    import vtkplotlib as vpl
+
+    data = Path(model).read_bytes()
+    key = _cache.hash_bytes(data + repr(tuple(size)).encode())
+    png = _thumbnail_cache.read_bytes(key, ".png")
+    if png is None:
+        mesh, odometry = _dataset.read_model(model)
+        if not len(mesh):
+            raise ValueError(f"{model} has no triangles.")
+        view = "Occlusal" if odometry is not None else "Top"
+        image = snapshot(mesh, odometry=odometry, views=[view], size=size,
+                         labels=False)[view]
+        png = vpl.image_io.write(image, None, "png")
+        _thumbnail_cache.write_bytes(key, ".png", png)
+    return png
+
+
+def snapshot_path(model, output, view):
+    """Where a snapshot of a model is written to."""
+    return Path(output) / f"{_dataset.model_name(model)}-{view}.png"
+
+
+def _write_image(image, path):
+    import vtkplotlib as vpl
+
+    temp = path.with_name(path.stem + ".tmp.png")
+    vpl.image_io.write(image, temp)
+    os.replace(temp, path)
+
+
+def review(model, output, views=DEFAULT_VIEWS, size=(800, 600), labels=True,
+           overwrite=False):
+    """Render one model's snapshots.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename. Its landmarks (if any) are read from
+            :func:`_dataset.csv_path`.
+        output (pathlib.Path):
+            The folder to write ``<name>-<view>.png`` files to.
+        views, size, labels:
+            See :func:`snapshot`.
+        overwrite (bool):
+            Re-render even if the snapshots are up to date.
+    Returns:
+        dict: A report with keys ``"model"``, ``"images"`` (filenames
+        relative to **output**), ``"landmarks"`` (the number placed),
+        ``"rendered"``, and ``"errors"`` (a list of ``(kind, message)``
+        pairs).
+
+    """
+    model = Path(model)
+    csv = _dataset.csv_path(model)
+    report = {
+        "model": str(model),
+        "images": [],
+        "landmarks": 0,
+        "rendered": False,
+        "errors": [],
+    }
+    names, points = [], []
+    if csv.exists():
+        try:
+            names, points = _csv_io.read_named(csv)
+        except (OSError, UnicodeDecodeError, ValueError) as ex:
+            report["errors"].append(
+                ("unreadable csv", f"{type(ex).__name__}: {ex}"))
+    points = np.array([(np.nan,) * 3 if i is None else i for i in points],
+                      dtype=np.float64).reshape((-1, 3))
+    report["landmarks"] = int(np.isfinite(points).all(axis=1).sum())
+
+    # Skip models whose snapshots are all present and newer than their inputs.
+    # Only the occlusal view may be missing, and only if the model can't be
+    # orientated, which takes reading the model to find out.
+    sources = [model] + [csv] * csv.exists()
+    newest = max(i.stat().st_mtime for i in sources)
+    paths = {i: snapshot_path(model, output, i) for i in views}
+    existing = [i for i in paths.values() if i.exists()]
+    missing = {i for (i, path) in paths.items() if not path.exists()}
+    up_to_date = not overwrite and missing <= {"Occlusal"} and \
+        all(i.stat().st_mtime >= newest for i in existing)
+    if up_to_date and not missing:
+        report["images"] = [i.name for i in existing]
+        return report
+
+    try:
+        mesh, odometry = _dataset.read_model(model)
+        if not len(mesh):
+            raise ValueError("The model has no triangles.")
+    except Exception as ex:
+        report["errors"].append(("unreadable", f"{type(ex).__name__}: {ex}"))
+        return report
+    if up_to_date and odometry is None:
+        report["images"] = [i.name for i in existing]
+        return report
+
+    try:
+        images = snapshot(mesh, points, names, odometry, views, size, labels)
+        Path(output).mkdir(parents=True, exist_ok=True)
+        for (view, image) in images.items():
+            path = snapshot_path(model, output, view)
+            _write_image(image, path)
+            report["images"].append(path.name)
+    except Exception as ex:
+        report["errors"].append(("unrenderable", f"{type(ex).__name__}: {ex}"))
+        return report
+    report["rendered"] = True
+    return report
+
+
+def _review_in_worker(args):
+    return review(*args)
+
+
+def review_dataset(root, output, views=DEFAULT_VIEWS, size=(800, 600),
+                   labels=True, overwrite=False, jobs=None):
+    """Render snapshots of every model in a dataset directory.
+
+    Args:
+        root:
+            The dataset directory.
+        output:
+            The folder to write snapshots to.
+        views, size, labels, overwrite:
+            See :func:`review`.
+        jobs:
+            The number of processes to use. Defaults to one per CPU.
+    Yields:
+        dict: A report (see :func:`review`) per model, in order.
+
+    """
+    views = tuple(views)
+    yield from _batch.imap(
+        _review_in_worker,
+        [(i, output, views, tuple(size), labels, overwrite)
+         for i in _dataset.model_paths(root)], jobs)  # yapf: disable
+
+
+def write_index(output, reports, width=320):
+    """Write an ``index.html`` into **output** listing each model's
+    snapshots as a row of thumbnails which link to the full size images.
+
+    Returns:
+        pathlib.Path: The index's filename.
+
+    """
+    rows = []
+    for report in reports:
+        name = html.escape(_dataset.model_name(report["model"]))
+        cells = [
+            f"<th>{name}<br><small>{report['landmarks']} landmarks"
+            f"</small></th>"
+        ]
+        for image in report["images"]:
+            image = html.escape(image)
+            cells.append(f'<td><a href="{image}"><img src="{image}" '
+                         f'width="{width}" loading="lazy" alt="{image}">'
+                         f'</a></td>')
+        for (kind, message) in report["errors"]:
+            cells.append(f'<td class="error">{html.escape(kind)}: '
+                         f'{html.escape(message)}</td>')
+        rows.append(f'<tr id="{name}">{"".join(cells)}</tr>')
+
+    path = Path(output) / "index.html"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _batch.write_text(
+        path, "\n".join([
+            "<!DOCTYPE html>",
+            '<html><head><meta charset="utf-8"><title>Landmarks review</title>',
+            "<style>body { font-family: sans-serif; } th { text-align: left; } "
+            ".error { color: #c00; }</style></head><body>",
+            "<table>",
+            *rows,
+            "</table></body></html>",
+            "",
+        ]))
+    return path
+
+
+class Summary:
+    """Aggregate review reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.rendered = 0
+        self.up_to_date = 0
+        self.images = 0
+        self.errors = 0
+
+    def add(self, report):
+        self.models += 1
+        self.rendered += report["rendered"]
+        self.up_to_date += not report["rendered"] and bool(report["images"])
+        self.images += len(report["images"])
+        self.errors += len(report["errors"])
+
+    def to_dict(self):
+        return {
+            "models": self.models,
+            "rendered": self.rendered,
+            "up_to_date": self.up_to_date,
+            "images": self.images,
+            "errors": self.errors,
+        }
+
+    def __str__(self):
+        lines = [
+            f"Rendered {self.rendered}/{self.models} models "
+            f"({self.up_to_date} already up to date)."
+        ]
+        if self.errors:
+            lines.append(f"{self.errors} errors.")
+        return "\n".join(lines)
+
+
+def format_report(report):
+    """Format a report as one line per model (plus one per error)."""
+    name = _dataset.model_name(report["model"])
+    if report["rendered"]:
+        line = f"{name}: {len(report['images'])} snapshots"
+    elif report["images"]:
+        line = f"{name}: up to date"
+    else:
+        line = f"{name}: failed"
+    return "\n".join(
+        [line] +
+        [f"    {kind}: {message}" for (kind, message) in report["errors"]])
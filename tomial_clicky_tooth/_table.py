@@ -8,6 +8,7 @@
 
 from tomial_clicky_tooth._qapp import app
 from tomial_clicky_tooth import _misc, _csv_io
+from tomial_clicky_tooth._timing import timed
 
 
 class _QTable(QtWidgets.QTableWidget):
@@ -57,6 +58,8 @@ def __init__(self, names, parent=None):
 
         self.table = table = _QTable()
         self.points = {}
+        # Rows holding proposed (see propose()) rather than user placed points.
+        self.proposed = set()
 
         self.box = QtWidgets.QVBoxLayout()
         self.setLayout(self.box)
@@ -71,6 +74,8 @@ def __init__(self, names, parent=None):
         self.font = QtGui.QFont()
         self.font.setPixelSize(16)
         self.table.setFont(self.font)
+        self.proposed_font = QtGui.QFont(self.font)
+        self.proposed_font.setItalic(True)
 
         self.setup_buttons()
 
@@ -107,12 +112,14 @@ def setup_buttons(self):
 
     def setup_menu_bar(self, bar, window):
         """Populate a menu bar with this widget's actions."""
-        bar["&File"].addAction(
-            QtWidgets.QAction("&Save", window, triggered=self.save,
-                              shortcut=QtGui.QKeySequence.StandardKey.Save))
-        bar["&File"].addAction(
-            QtWidgets.QAction("Save &As", window, triggered=self.save_as,
-                              shortcut=QtGui.QKeySequence.StandardKey.SaveAs))
+        self.save_action = QtWidgets.QAction(
+            "&Save", window, triggered=self.save,
+            shortcut=QtGui.QKeySequence.StandardKey.Save)
+        bar["&File"].addAction(self.save_action)
+        self.save_as_action = QtWidgets.QAction(
+            "Save &As", window, triggered=self.save_as,
+            shortcut=QtGui.QKeySequence.StandardKey.SaveAs)
+        bar["&File"].addAction(self.save_as_action)
         bar["&Edit"].addSeparator()
         bar["&Edit"].addAction(
             QtWidgets.QAction("Cut", window, triggered=self.cut,
@@ -145,11 +152,11 @@ def load_table_contents(self, names):
 
     def clear_all(self):
         del self[:]
-        self.landmarks_changed.emit(np.array(self))
+        self._landmarks_changed()
 
     def delete(self):
         del self[self.highlighted_rows()]
-        self.landmarks_changed.emit(np.array(self))
+        self._landmarks_changed()
 
     def increment_selection(self):
         current_focus = self.highlighted_rows()
@@ -169,6 +176,10 @@ def highlighted_rows(self):
     landmarks_changed = QtCore.pyqtSignal(object)
     itemSelectionChanged = QtCore.pyqtSignal()
 
+    def _landmarks_changed(self):
+        with timed("landmarks_changed"):
+            self.landmarks_changed.emit(np.array(self))
+
     @_misc.multiitemsable
     @_misc.sliceable
     def __getitem__(self, index):
@@ -186,10 +197,48 @@ def __setitem__(self, index, point):
         else:
             texts = np.round(point, 3).astype(str)
             point = tuple(point)
+        # Rewriting a proposal with its own value (e.g. restoring the whole
+        # table on undo/redo) doesn't make it any less of a proposal.
+        if index in self.proposed and point != self.points.get(index):
+            self._mark_proposed(index, False)
         self.points[index] = point
         for (i, ax) in enumerate("XYZ"):
             self.table.item(index, self.COLUMN_NUMBERS[ax]).setText(texts[i])
 
+    def _mark_proposed(self, index, proposed):
+        font = self.proposed_font if proposed else None
+        for j in range(len(self.COLUMNS)):
+            self.table.item(index, j).setData(QtCore.Qt.FontRole, font)
+        if proposed:
+            self.proposed.add(index)
+        else:
+            self.proposed.discard(index)
+
+    def propose(self, points):
+        """Fill in unset landmarks with suggested positions.
+
+        Proposed landmarks are shown in italics until they are either replaced
+        or saved. Landmarks which are already set are left alone. No
+        landmarks_changed signal is emitted.
+
+        """
+        for (i, point) in enumerate(points):
+            if self[i] is None and np.isfinite(point).all():
+                self[i] = point
+                self._mark_proposed(i, True)
+
+    def set_proposed(self, rows):
+        """Mark exactly **rows** as proposed, leaving their points as they
+        are (e.g. when undoing)."""
+        for i in range(len(self)):
+            if (i in rows) != (i in self.proposed):
+                self._mark_proposed(i, i in rows)
+
+    def accept_proposals(self):
+        """Treat all proposed landmarks as if the user had placed them."""
+        for i in list(self.proposed):
+            self._mark_proposed(i, False)
+
     @_misc.multiitemsable
     @_misc.sliceable
     def __delitem__(self, index):
@@ -214,13 +263,22 @@ def save_as(self):
     def _save(self, path):
         if not path:
             return
-        with open(path, "wb") as f:
-            f.write(_csv_io.writes(np.array(self), names=self.names).encode())
+        with timed("save"):
+            if self.write(path) is False:
+                return
+        self.accept_proposals()
         history = self.parent()._history
         history.saved_position = history.position
         self.parent().setWindowModified(False)
         self.save_button.setDisabled(True)
 
+    def write(self, path):
+        """Write the landmarks to a CSV file. This may be overridden (the UI
+        does so to send them to an annotation server instead) by a function
+        which returns False if the landmarks couldn't be saved."""
+        with open(path, "wb") as f:
+            f.write(_csv_io.writes(np.array(self), names=self.names).encode())
+
     def default_csv_path(self):  # pragma: no cover
         return ""
 
@@ -244,7 +302,7 @@ def paste(self):
         start = rows[0] if rows else 0
         for (i, point) in zip(range(start, len(self)), points):
             self[i] = point
-        self.landmarks_changed.emit(np.array(self))
+        self._landmarks_changed()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+"""Lightweight timing instrumentation for the slow parts of the UI.
+
+Wrap anything worth measuring in :func:`timed`::
+
+    with timed("read mesh"):
+        mesh = Mesh(path)
+
+Recording is off by default, in which case :func:`timed` costs next to nothing.
+Turn it on either by setting the ``TOMIAL_CLICKY_TOOTH_TIMINGS`` environment
+variable to a non-empty value or at runtime via the UI's debug menu (which also
+shows the rolling percentiles in an overlay, see :mod:`_overlay`). Whilst a
+session trace is being recorded (see :mod:`_tracing`), timed blocks are also
+written to the trace.
+
+"""
+
+import os
+import io
+import csv
+import json
+import time
+import platform
+import threading
+import collections
+from contextlib import contextmanager
+
+from tomial_clicky_tooth import _tracing
+
+ENV = "TOMIAL_CLICKY_TOOTH_TIMINGS"
+
+Sample = collections.namedtuple("Sample", "name start duration thread")
+
+
+class Recorder:
+    """Collect timing samples, keeping only the most recent **window** samples
+    for each operation."""
+    def __init__(self, window=10_000, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.samples = {}
+        # The names of the timed blocks each thread is currently inside of,
+        # keyed by thread identifier. These are tracked regardless of whether
+        # recording is enabled so that the stall watchdog can always say what
+        # a frozen UI was doing.
+        self.active = {}
+
+    def record(self, name, start, duration):
+        try:
+            samples = self.samples[name]
+        except KeyError:
+            samples = self.samples.setdefault(
+                name, collections.deque(maxlen=self.window))
+        samples.append(
+            Sample(name, start, duration,
+                   threading.current_thread().name))
+
+    @contextmanager
+    def time(self, name):
+        """Time the body of a ``with`` block (if recording or tracing)."""
+        stack = self.active.setdefault(threading.get_ident(), [])
+        stack.append(name)
+        tracer = _tracing.tracer
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            if self.enabled or tracer is not None:
+                duration = time.perf_counter() - start
+                if self.enabled:
+                    self.record(name, start, duration)
+                if tracer is not None:
+                    tracer.complete(name, start, duration, "timed")
+
+    def clear(self):
+        self.samples.clear()
+
+    def percentiles(self, name, q=(50, 90, 99)):
+        """Get (nearest rank) percentiles of an operation's recent durations."""
+        durations = sorted(i.duration for i in list(self.samples[name]))
+        n = len(durations)
+        return [durations[min(n - 1, n * i // 100)] for i in q]
+
+    def summary(self):
+        """Summarise each operation's recent durations (in seconds).
+
+        Returns:
+            dict: ``{name: {"count": ..., "p50": ..., "p90": ..., "p99": ...,
+            "max": ...}}``
+
+        """
+        out = {}
+        for name in sorted(self.samples):
+            p50, p90, p99, p100 = self.percentiles(name, (50, 90, 99, 100))
+            out[name] = {
+                "count": len(self.samples[name]),
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+                "max": p100,
+            }
+        return out
+
+    def _all_samples(self):
+        samples = [
+            i for name in list(self.samples) for i in list(self.samples[name])
+        ]
+        return sorted(samples, key=lambda i: i.start)
+
+    def to_csv(self):
+        """Serialise the raw samples as CSV."""
+        file = io.StringIO()
+        writer = csv.writer(file)
+        writer.writerow(Sample._fields)
+        writer.writerows(self._all_samples())
+        return file.getvalue()
+
+    def to_json(self):
+        """Serialise the raw samples, a summary and some information about the
+        machine they were recorded on as JSON."""
+        return json.dumps({
+            "machine": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "summary": self.summary(),
+            "samples": [i._asdict() for i in self._all_samples()],
+        }, indent=1)  # yapf: disable
+
+    def export(self, path):
+        """Write the raw samples to a ``.json`` or ``.csv`` file."""
+        path = os.fspath(path)
+        text = self.to_json() if path.endswith(".json") else self.to_csv()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+
+recorder = Recorder(enabled=bool(os.environ.get(ENV)))
+timed = recorder.time
@@ -0,0 +1,229 @@
+"""Record whole annotation sessions as Chrome trace-event JSON.
+
+Traces can be opened with https://ui.perfetto.dev or ``about:tracing`` to see
+where the time goes between, say, a click and the table updating.
+
+Start tracing either via the UI's debug menu or for the whole session by
+setting the ``TOMIAL_CLICKY_TOOTH_TRACE`` environment variable to an output
+filename before launching.
+
+Every :func:`tomial_clicky_tooth._timing.timed` block becomes a trace event
+whilst tracing. Additionally, if a Qt application is running, each busy spell
+of the Qt event loop and each user input event are recorded.
+
+Events are buffered in memory and appended to the output file in batches so
+that tracing stays cheap without the buffer growing unboundedly over a long
+session. Chrome's trace format permits the closing ``]`` to be missing so even
+a trace from a session which crashed remains readable.
+
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+ENV = "TOMIAL_CLICKY_TOOTH_TRACE"
+
+tracer = None
+
+
+def _timestamp(seconds):
+    # Chrome traces use microseconds. Any origin is fine so long as it's
+    # consistent so use the same clock as _timing.
+    return round(seconds * 1e6, 1)
+
+
+class Tracer:
+    """Write trace events to a file.
+
+    Args:
+        path:
+            The output JSON filename.
+        buffer_size:
+            The number of events to hold in memory before writing them out.
+
+    """
+    def __init__(self, path, buffer_size=5000):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.pid = os.getpid()
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[")
+        self._empty = True
+        self._event(ph="M", name="process_name", tid=0,
+                    args={"name": "tomial_clicky_tooth"})
+
+    def _event(self, **event):
+        tid = event.setdefault("tid", threading.get_ident())
+        event["pid"] = self.pid
+        with self._lock:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                if tid:
+                    self._buffer.append(
+                        json.dumps({
+                            "ph": "M", "name": "thread_name", "pid": self.pid,
+                            "tid": tid,
+                            "args": {"name": threading.current_thread().name},
+                        }))  # yapf: disable
+            self._buffer.append(json.dumps(event))
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def complete(self, name, start, duration, category="", args=None):
+        """Record something which started at **start** and took **duration**
+        (both in seconds from :func:`time.perf_counter`)."""
+        self._event(ph="X", name=name, cat=category, ts=_timestamp(start),
+                    dur=_timestamp(duration), args=args or {})
+
+    def instant(self, name, category="", args=None):
+        """Record a point in time event."""
+        self._event(ph="i", s="t", name=name, cat=category,
+                    ts=_timestamp(time.perf_counter()), args=args or {})
+
+    @contextmanager
+    def span(self, name, category=""):
+        """Record the duration of a ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, time.perf_counter() - start, category)
+
+    def _flush(self):
+        if self._file.closed:
+            # Discard events from threads which didn't notice tracing stopping.
+            self._buffer.clear()
+        if not self._buffer:
+            return
+        self._file.write(("\n" if self._empty else ",\n") +
+                         ",\n".join(self._buffer))
+        self._empty = False
+        self._buffer.clear()
+        self._file.flush()
+
+    def flush(self):
+        """Write out any buffered events."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if not self._file.closed:
+                self._file.write("\n]\n")
+                self._file.close()
+
+
+def start(path, buffer_size=5000):
+    """Start tracing to a file, stopping any current trace first."""
+    global tracer
+    stop()
+    tracer = Tracer(path, buffer_size)
+    hook_qt()
+    return tracer
+
+
+def stop():
+    """Stop tracing and finish writing the trace file (if tracing)."""
+    global tracer
+    _unhook_qt()
+    if tracer is not None:
+        tracer, _tracer = None, tracer
+        _tracer.close()
+
+
+def start_from_environment():
+    """Start tracing if requested via the ``TOMIAL_CLICKY_TOOTH_TRACE``
+    environment variable."""
+    if os.environ.get(ENV) and tracer is None:
+        start(os.environ[ENV])
+
+
+atexit.register(stop)
+
+_qt_hooks = None
+
+
+def hook_qt():
+    """Start tracing the Qt event loop and user input events. Does nothing if
+    not tracing, if Qt isn't in use or if already hooked."""
+    global _qt_hooks
+    if tracer is None or _qt_hooks is not None:
+        return
+    QtCore = sys.modules.get("PyQt5.QtCore")
+    if QtCore is None or QtCore.QCoreApplication.instance() is None:
+        return  # pragma: no cover
+    _qt_hooks = _QtHooks(QtCore)
+
+
+def _unhook_qt():
+    global _qt_hooks
+    if _qt_hooks is not None:
+        _qt_hooks.disconnect()
+        _qt_hooks = None
+
+
+class _QtHooks:
+    # These are only connected whilst tracing so they cost nothing otherwise.
+
+    # Ignore the event loop waking up for things which took less than this many
+    # seconds, otherwise traces become dominated by trivial timer events.
+    MIN_BUSY = .001
+
+    def __init__(self, QtCore):
+        self._busy_since = None
+        self.app = QtCore.QCoreApplication.instance()
+        self.dispatcher = QtCore.QAbstractEventDispatcher.instance()
+        self.dispatcher.awake.connect(self._awake)
+        self.dispatcher.aboutToBlock.connect(self._about_to_block)
+
+        E = QtCore.QEvent
+        inputs = {
+            E.MouseButtonPress: "mouse press",
+            E.MouseButtonRelease: "mouse release",
+            E.KeyPress: "key press",
+            E.Wheel: "wheel",
+        }
+
+        last = [None]
+
+        class Filter(QtCore.QObject):
+            def eventFilter(self, obj, event):
+                name = inputs.get(event.type())
+                if name is not None and tracer is not None:
+                    # Input events propagate up through each parent widget
+                    # (each time passing through this filter). Only record them
+                    # the first time.
+                    key = (event.type(), event.timestamp())
+                    if key != last[0]:
+                        last[0] = key
+                        tracer.instant(name, "input",
+                                       {"target": type(obj).__name__})
+                return False
+
+        self.filter = Filter()
+        self.app.installEventFilter(self.filter)
+
+    def _awake(self):
+        self._busy_since = time.perf_counter()
+
+    def _about_to_block(self):
+        if self._busy_since is None or tracer is None:  # pragma: no cover
+            return
+        duration = time.perf_counter() - self._busy_since
+        if duration > self.MIN_BUSY:
+            tracer.complete("Qt events", self._busy_since, duration, "qt")
+        self._busy_since = None
+
+    def disconnect(self):
+        self.dispatcher.awake.disconnect(self._awake)
+        self.dispatcher.aboutToBlock.disconnect(self._about_to_block)
+        self.app.removeEventFilter(self.filter)
@@ -1,16 +1,25 @@
 import collections
 import os
-import re
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 from PyQt5 import QtWidgets, QtCore, QtGui
 
 from tomial_clicky_tooth._qapp import app
-from tomial_clicky_tooth import _csv_io
-from tomial_clicky_tooth._clicker import ClickableFigure, InvalidModelError
+from tomial_clicky_tooth import _csv_io, _dataset, _licenses, _timing, \
+    _tracing, _watchdog, _resources
+from tomial_clicky_tooth._timing import timed
+from tomial_clicky_tooth._clicker import ClickableFigure, InvalidModelError, \
+    read_model
 from tomial_clicky_tooth._table import LandmarkTable
+from tomial_clicky_tooth._overlay import PerformanceOverlay, \
+    resources_section
+
+# The same as _server.SERVER_ENV, which is only imported if it's set.
+SERVER_ENV = "TOMIAL_CLICKY_TOOTH_SERVER"
 
 
 class SwitchModelButton(QtWidgets.QPushButton):
@@ -58,12 +67,36 @@ def __init__(self, landmark_names, path=None, points=None, parent=None):
         self.setLayout(self.h_box)
 
         self._thread_lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1)
+        self._pending_load = None
+        self._model_read.connect(self._model_read_cb)
+        self._features_found.connect(self._features_found_cb)
+        self._overlay = None
+        self._reference = None
+        self._browser = None
+        self._qa_report = None
+
+        # An annotation server (see _server) or None to read and write CSVs
+        # directly.
+        self.server = None
+        if os.environ.get(SERVER_ENV):
+            from tomial_clicky_tooth import _server
+
+            self.server = _server.Client(os.environ[SERVER_ENV])
+        # The server's revision of the open model's landmarks or None if they
+        # didn't come from the server.
+        self._revision = None
+        # The landmarks, by name, as the server has them.
+        self._synced = {}
+        self._leased = None
+        self._lease_timer = QtCore.QTimer(self, timeout=self._renew_lease)
 
         ### table ###
         self.table = LandmarkTable(landmark_names)
         self.h_box.addWidget(self.table)
         # table button actions
         self.table.default_csv_path = self.csv_path
+        self.table.write = self._write_landmarks
 
         ### clicker ###
         self.clicker = ClickableFigure(key_generator=self.key_generator)
@@ -89,6 +122,8 @@ def __init__(self, landmark_names, path=None, points=None, parent=None):
         hbox.addWidget(self.model_number_indicator)
         hbox.addWidget(self.buttons[1])
         hbox.addStretch()
+        self.geodesic_indicator = QtWidgets.QLabel()
+        self.right_vbox.addWidget(self.geodesic_indicator)
 
         ### tie them together ###
 
@@ -109,7 +144,7 @@ def __init__(self, landmark_names, path=None, points=None, parent=None):
         # optionally start with some landmarks already picked
         if points is not None:
             self.points = points
-        self._history = History(self.points)
+        self._history = History(self.points, self.table.proposed)
         self._update_modified_state_indicators()
         self._open_model(path)
 
@@ -123,10 +158,37 @@ def setup_menu_bar(self, bar: LazyMenuBar):
         bar["&File"].addAction(
             QtWidgets.QAction("&Open", self, shortcut="Ctrl+O",
                               triggered=self.open_model))
+        bar["&File"].addAction(
+            QtWidgets.QAction("&Browse Dataset", self, shortcut="Ctrl+B",
+                              triggered=self.browse_dataset))
+        bar["&File"].addAction(
+            QtWidgets.QAction("Open &QA Report", self,
+                              triggered=self.open_qa_report))
+        bar["&File"].addAction(
+            QtWidgets.QAction("Connect To &Server", self,
+                              triggered=self.connect_to_server))
 
         bar["&Edit"].addAction(
             QtWidgets.QAction("Clear markers", self,
                               triggered=self.table.clear_all))
+        bar["&Edit"].addAction(
+            QtWidgets.QAction("&Propose Landmarks", self,
+                              shortcut="Ctrl+Shift+L",
+                              triggered=self.propose_landmarks))
+        bar["&Edit"].addAction(
+            QtWidgets.QAction("Choose &Reference Model", self,
+                              triggered=self.choose_reference_model))
+        self._snap_action = QtWidgets.QAction(
+            "Snap To &Features", self, checkable=True, shortcut="Ctrl+Shift+F",
+            toggled=self.set_snap_to_features)
+        bar["&Edit"].addAction(self._snap_action)
+        bar["&Edit"].addAction(
+            QtWidgets.QAction("Crop &Base", self, checkable=True,
+                              shortcut="Ctrl+Shift+B",
+                              toggled=self.clicker.set_crop))
+        bar["&Edit"].addAction(
+            QtWidgets.QAction("Measure &Geodesic", self, shortcut="Ctrl+G",
+                              triggered=self.measure_geodesic))
         bar["&Edit"].addSeparator()
         bar["&Edit"].addAction(
             QtWidgets.QAction("&Undo", self, triggered=self.undo,
@@ -141,47 +203,338 @@ def setup_menu_bar(self, bar: LazyMenuBar):
         bar["&About"].addAction(
             QtWidgets.QAction("Terms And Conditions", self,
                               triggered=self.show_licenses))
+        # Get a head start on collecting the licenses (which is slow) when the
+        # user looks like they're about to ask for them.
+        bar["&About"].aboutToShow.connect(_licenses.prefetch)
+
+        bar["&Debug"].addAction(
+            QtWidgets.QAction("Performance &Overlay", self, checkable=True,
+                              toggled=self.show_performance_overlay))
+        bar["&Debug"].addAction(
+            QtWidgets.QAction("&Export Timings", self,
+                              triggered=self.export_timings))
+        tracing = _tracing.tracer is not None
+        self._trace_action = QtWidgets.QAction("Record &Trace", self,
+                                               checkable=True, checked=tracing,
+                                               toggled=self.record_trace)
+        bar["&Debug"].addAction(self._trace_action)
+        self._profile_action = QtWidgets.QAction(
+            "&Profile", self, checkable=True, shortcut="Ctrl+Shift+P",
+            toggled=self.profile)
+        bar["&Debug"].addAction(self._profile_action)
 
         return bar
 
     def open_model(self):
         if not self.ask_to_save_unsaved_changes():
             return
-        filter = " ".join("*" + i for i in SUFFIXES)
+        filter = " ".join("*" + i for i in _dataset.SUFFIXES)
         options = dict(caption="Open an .STL file",
                        filter=f"3D Model file ({filter})")
 
         path, _ = QtWidgets.QFileDialog.getOpenFileName(self, **options)
         self._open_model(path)
 
-    def _open_model(self, path):
+    def _open_model(self, path, background=False):
+        """Open a model and its landmarks (if present).
+
+        If **background** is true, read the model in a background thread
+        leaving the UI responsive in the meantime. The model is added to the
+        renderer once it has been read.
+
+        """
         if not path:
             return
         if not self.ask_to_save_unsaved_changes():
             return
         path = Path(path) if not isinstance(path, Path) else path
+        self._release_lease()
         self.clicker.close_model()
-        try:
-            self.clicker.open_model(path)
-        except InvalidModelError:
+        self.geodesic_indicator.clear()
+
+        if self._pending_load is not None:
+            self._pending_load.cancel()
+            self._pending_load = None
+        if background:
+            # Claim the path immediately so that anything depending on which
+            # model is open (e.g. switching to the next model) works while the
+            # model is still loading.
+            self.clicker.path = path
+            # Don't leave the previous model's landmarks to be saved as this
+            # one's.
             del self.points
-        else:
-            csv_path = self.csv_path()
-            if Path(csv_path).exists():
-                self.points = csv_path
-            else:
+            self._history = History(self.points)
+            self.model_name_indicator.setText(
+                _dataset.model_name(path) + " (loading...)")
+            self._pending_load = future = self._loader.submit(
+                read_model, path, clean=True)
+            future.add_done_callback(
+                lambda future: self._model_read.emit(path, future))
+            self._update_modified_state_indicators()
+            return
+        self._show_model(path)
+
+    # Emitted from the background loader thread but, because Qt queues signals
+    # sent between threads, handled in the main thread.
+    _model_read = QtCore.pyqtSignal(object, object)
+
+    def _model_read_cb(self, path, future):
+        # Discard models which have since been superseded by another.
+        if future is not self._pending_load:
+            return
+        self._pending_load = None
+        self._show_model(path, future)
+
+    def _show_model(self, path, preloaded=None):
+        with timed("open model"):
+            try:
+                self.clicker.open_model(path, preloaded)
+            except InvalidModelError:
                 del self.points
+            else:
+                csv_path = self.csv_path()
+                # The server's copy, if there is one, supersedes the CSV.
+                if self._checkout():
+                    pass
+                elif Path(csv_path).exists():
+                    self.points = csv_path
+                else:
+                    del self.points
+                    self._show_precomputed_proposals()
+
+            name = _dataset.model_name(path)
+            if self._revision is not None and self._leased != name:
+                name += " (read only)"
+            self.model_name_indicator.setText(name)
+            files, index = self.files_index()
+            if index is not None:
+                self.model_number_indicator.setText(
+                    f"({index + 1}/{len(files)})")
+            else:
+                self.model_number_indicator.setText("")
 
-        self.model_name_indicator.setText(SUFFIX_RE.match(path.name)[1])
-        files, index = self.files_index()
-        if index is not None:
-            self.model_number_indicator.setText(f"({index + 1}/{len(files)})")
-        else:
-            self.model_number_indicator.setText("")
+            self._history = History(self.points, self.table.proposed)
+            with timed("render"):
+                self.clicker.update()
+            self._update_modified_state_indicators()
+            if self.clicker.snap_to_features:
+                self._find_features()
+
+    def set_snap_to_features(self, snap=True):
+        """Enable or disable snapping clicks onto nearby features such as cusp
+        tips (see :mod:`tomial_clicky_tooth._features`)."""
+        self.clicker.snap_to_features = snap
+        if snap and self.clicker.features is None:
+            self._find_features()
+
+    def _find_features(self):
+        """Find the open model's snapping features in the background."""
+        from tomial_clicky_tooth import _features
+
+        mesh = self.clicker.mesh
+        if mesh is None:
+            return
+        future = self._loader.submit(_features.load, mesh,
+                                     self.clicker.odometry)
+        future.add_done_callback(
+            lambda future: self._features_found.emit(mesh, future))
 
-        self._history = History(self.points)
-        self.clicker.update()
-        self._update_modified_state_indicators()
+    # Like _model_read, emitted from the loader thread.
+    _features_found = QtCore.pyqtSignal(object, object)
+
+    def _features_found_cb(self, mesh, future):
+        # Discard features of a model which has since been closed.
+        if mesh is self.clicker.mesh and future.exception() is None:
+            self.clicker.features = future.result()
+
+    def _show_precomputed_proposals(self):
+        """Fill the table with proposals from ``python -m tomial_clicky_tooth
+        propose`` if there are any for the open model."""
+        from tomial_clicky_tooth import _registration
+
+        try:
+            proposals = _registration.read_proposals(self.path)
+        except (OSError, ValueError):
+            return
+        if proposals is not None:
+            self.table.propose(
+                _registration.match_names(*proposals, self.table.names))
+            self.set_clicker_points(self.points)
+
+    def choose_reference_model(self, path=None):
+        """Choose a model with landmarks to register onto models to propose
+        their landmarks (see :meth:`propose_landmarks`).
+
+        Returns:
+            bool: True if a reference model was successfully loaded.
+
+        """
+        from tomial_clicky_tooth import _registration
+
+        if not path:
+            filter = " ".join("*" + i for i in _dataset.SUFFIXES)
+            options = dict(caption="Choose a reference model with landmarks",
+                           filter=f"3D Model file ({filter})")
+            path, _ = QtWidgets.QFileDialog.getOpenFileName(self, **options)
+            if not path:
+                return False
+        try:
+            with timed("read reference"):
+                self._reference = _registration.Reference(path)
+        except Exception as ex:
+            QtWidgets.QMessageBox.critical(
+                self, "Invalid reference model",
+                f"{Path(path).name} or its landmarks could not be read: {ex}")
+            return False
+        return True
+
+    def propose_landmarks(self):
+        """Fill in any unset landmarks with proposals.
+
+        Proposals are read from the open model's precomputed proposals file if
+        there is one. Otherwise they are computed by registering the reference
+        model onto the open model (prompting for a reference model if none has
+        been chosen yet).
+
+        """
+        from tomial_clicky_tooth import _registration
+
+        if self.clicker.mesh is None:
+            return
+        proposals = _registration.read_proposals(self.path)
+        if proposals is None:
+            if self._reference is None and not self.choose_reference_model():
+                return
+            with timed("propose"):
+                points, _ = self._reference.propose(self.clicker.mesh,
+                                                    self.clicker.odometry)
+            proposals = self._reference.names, points
+        self.table.propose(
+            _registration.match_names(*proposals, self.table.names))
+        self.set_clicker_points(self.points)
+        self._log_state()
+
+    def connect_to_server(self, url=None):
+        """Read and write landmarks via an annotation server (see
+        :mod:`tomial_clicky_tooth._server`) instead of directly to CSVs.
+
+        Args:
+            url:
+                The server's address. Prompted for if not provided. An empty
+                string disconnects.
+
+        """
+        from tomial_clicky_tooth import _server
+
+        if url is None:
+            default = f"http://localhost:{_server.DEFAULT_PORT}"
+            url, ok = QtWidgets.QInputDialog.getText(
+                self, "Connect To Server",
+                "Annotation server address (leave blank to disconnect):",
+                text=self.server.url if self.server else default)
+            if not ok:
+                return
+        if not self.ask_to_save_unsaved_changes():
+            return
+        self._release_lease()
+        self.server = _server.Client(url) if url else None
+        # Reload the landmarks from their new source.
+        if self.path is not None:
+            # Any unsaved changes have just been dealt with.
+            self._history.saved_position = self._history.position
+            self._open_model(self.path)
+
+    def _checkout(self):
+        """Lease the open model from the server (if there is one) and load its
+        landmarks.
+
+        Returns:
+            True if the landmarks came from the server or False if they should
+            be read from the CSV as usual (no server or the server has never
+            seen this model).
+
+        """
+        from tomial_clicky_tooth import _registration, _server
+
+        if self.server is None:
+            return False
+        model = _dataset.model_name(self.path)
+        try:
+            try:
+                self.server.lease(model)
+                self._leased = model
+                self._lease_timer.start(int(_server.LEASE_DURATION / 3 * 1000))
+            except _server.LeaseError as ex:
+                QtWidgets.QMessageBox.warning(
+                    self, "Model in use",
+                    f"{ex} Its landmarks can be viewed but not saved.")
+            landmarks = self.server.landmarks(model)
+        except OSError as ex:
+            QtWidgets.QMessageBox.warning(
+                self, "Server unavailable",
+                f"Couldn't reach {self.server.url} ({ex}). Falling back to "
+                "reading and writing the landmarks file directly.")
+            return False
+        self._revision = landmarks["revision"]
+        if not self._revision:
+            return False
+        self._synced = dict(zip(landmarks["names"], landmarks["points"]))
+        points = landmarks["points"]
+        points = [(np.nan,) * 3 if i is None else i for i in points]
+        self.points = _registration.match_names(landmarks["names"], points,
+                                                self.table.names)
+        return True
+
+    def _write_landmarks(self, path):
+        """Save the landmarks to the server if connected to one, otherwise to
+        a CSV. Only landmarks which differ from the server's copy are sent."""
+        from tomial_clicky_tooth import _server
+
+        if self._pending_load is not None:
+            # This model's landmarks haven't been loaded yet.
+            return False
+        if self._revision is None or Path(path) != Path(self.csv_path()):
+            return LandmarkTable.write(self.table, path)
+        names, points = [], []
+        for (name, point) in zip(self.table.names, self.table[:]):
+            if point is not None:
+                point = list(map(float, point))
+            if name not in self._synced or self._synced[name] != point:
+                names.append(name)
+                points.append(point)
+        if not names:
+            return True
+        try:
+            self._revision = self.server.update(_dataset.model_name(self.path),
+                                                names, points, self._revision)
+        except (_server.LeaseError, _server.ConflictError, OSError) as ex:
+            QtWidgets.QMessageBox.critical(self, "Landmarks not saved", str(ex))
+            return False
+        self._synced.update(zip(names, points))
+        return True
+
+    def _renew_lease(self):
+        from tomial_clicky_tooth import _server
+
+        if self._leased is not None:
+            try:
+                self.server.lease(self._leased)
+            except (_server.LeaseError, OSError):
+                # Saving will report the problem.
+                pass
+
+    def _release_lease(self):
+        """Forget the server's copy of the open model's landmarks."""
+        self._revision = None
+        self._synced = {}
+        self._lease_timer.stop()
+        if self._leased is not None:
+            try:
+                self.server.release(self._leased)
+            except OSError:
+                # It'll expire by itself eventually.
+                pass
+            self._leased = None
 
     def ask_to_save_unsaved_changes(self):
         """Prompt the user to save before doing something that will lose their
@@ -219,6 +572,34 @@ def ask_to_save_unsaved_changes(self):
             return False
         return True
 
+    def measure_geodesic(self):
+        """Show the shortest path along the surface between the two selected
+        landmarks and its length."""
+        self.clear_geodesic()
+        rows = [
+            i for i in self.table.highlighted_rows()
+            if self.table[i] is not None
+        ]
+        if len(rows) != 2 or self.clicker.mesh is None:
+            self.geodesic_indicator.setText(
+                "Select two placed landmarks to measure between.")
+            return
+        (a, b) = (self.table[i] for i in rows)
+        distance = self.clicker.show_geodesic(a, b)
+        names = [self.table.names[i] for i in rows]
+        if not np.isfinite(distance):
+            self.geodesic_indicator.setText(
+                f"{names[0]} and {names[1]} are on disconnected surfaces.")
+            return
+        straight = np.linalg.norm(np.subtract(a, b))
+        self.geodesic_indicator.setText(
+            f"{names[0]} to {names[1]}: {distance:.2f} along the surface "
+            f"({straight:.2f} straight)")
+
+    def clear_geodesic(self):
+        self.clicker.clear_geodesic()
+        self.geodesic_indicator.clear()
+
     def table_selection_changed_cb(self):
         """Highlights the markers on the model that are selected in the table"""
         rows = self.table.highlighted_rows()
@@ -232,17 +613,18 @@ def key_generator(self):
         return rows[0]
 
     def marker_changed_by_clicker_cb(self, old, new):
-        if old is not None:
-            del self.table[old.key]
-        if new is not None:
-            self.table[new.key] = new.point
-        self.table.increment_selection()
+        self.clear_geodesic()
+        with timed("update table"):
+            if old is not None:
+                del self.table[old.key]
+            if new is not None:
+                self.table[new.key] = new.point
+            self.table.increment_selection()
 
     def csv_path(self):
         """Save path for the CSV file."""
         if self.clicker.path is not None:
-            return self.clicker.path.with_name(
-                SUFFIX_RE.match(self.clicker.path.name)[1] + ".csv")
+            return _dataset.csv_path(self.clicker.path)
         return ""
 
     @property
@@ -252,10 +634,21 @@ def points(self):
     @points.setter
     def points(self, points):
         if isinstance(points, (str, os.PathLike)):
-            points = _csv_io.read(points)
+            # Match rows by name so that CSVs written for an older template
+            # (or in a different order) still land in the right rows.
+            from tomial_clicky_tooth import _migration
+
+            names, points = _csv_io.read_named(points)
+            points, dropped = _migration.remap(names, points, self.table.names)
+            if dropped:
+                QtWidgets.QMessageBox.warning(
+                    self, "Landmarks not in template",
+                    "These landmarks don't fit the current template and will "
+                    "be lost if the landmarks are saved: " + ", ".join(dropped))
 
         self.set_clicker_points(points)
-        self.table[:] = points
+        with timed("update table"):
+            self.table[:] = points
 
     @points.deleter
     def points(self):
@@ -264,6 +657,7 @@ def points(self):
         self.clicker.update()
 
     def set_clicker_points(self, points):
+        self.clear_geodesic()
         self.clicker.landmarks = np.arange(len(points)), points
         self.table_selection_changed_cb()
 
@@ -285,17 +679,15 @@ def files_index(self):
         filesystem, then return a pair of nones.
 
         """
-        if self.path is None:
-            return None, None
-        paths = [
-            i for i in self.clicker.path.parent.glob("*")
-            if SUFFIX_RE.match(i.name)
-        ]
-        try:
-            index = paths.index(self.clicker.path)
-        except ValueError:
-            return None, None
-        return paths, index
+        with timed("files index"):
+            if self.path is None:
+                return None, None
+            paths = _dataset.model_paths(self.clicker.path.parent)
+            try:
+                index = paths.index(self.clicker.path)
+            except ValueError:
+                return None, None
+            return paths, index
 
     @property
     def path(self):
@@ -315,6 +707,78 @@ def switch_model(self, direction):
             path = paths[(index + {"<": -1, ">": 1}[direction]) % len(paths)]
             self._open_model(path)
 
+    def browse_dataset(self):
+        """Show a thumbnail grid of every model in :meth:`files_index`.
+        Double clicking a thumbnail opens that model."""
+        from tomial_clicky_tooth._browser import DatasetBrowser
+
+        paths, _ = self.files_index()
+        if paths is None:
+            return
+        if self._browser is None or self._browser.model().paths != paths:
+            if self._browser is not None:
+                self._browser.close()
+            self._browser = DatasetBrowser(paths)
+            self._browser.model_chosen.connect(self._open_model)
+        self._browser.show()
+        self._browser.raise_()
+        self._browser.scroll_to(self.path)
+
+    def open_qa_report(self, path=None):
+        """Show a list of the models flagged by an agreement report (see
+        :mod:`tomial_clicky_tooth._agreement`). Double clicking one opens it
+        with its flagged landmarks selected."""
+        from tomial_clicky_tooth import _agreement
+
+        if not path:
+            path, _ = QtWidgets.QFileDialog.getOpenFileName(
+                self, caption="Open a QA report", filter="QA report (*.json)")
+            if not path:
+                return
+        try:
+            report = _agreement.read_report(path)
+        except (OSError, ValueError) as ex:
+            QtWidgets.QMessageBox.critical(
+                self, "Invalid QA report",
+                f"{Path(path).name} could not be read: {ex}")
+            return
+        if self._qa_report is not None:
+            self._qa_report.close()
+        self._qa_report = QtWidgets.QListWidget()
+        self._qa_report.setWindowTitle(f"QA Report - {Path(path).name}")
+        for model in report["models"]:
+            if not model["flags"]:
+                continue
+            item = QtWidgets.QListWidgetItem(
+                f"{model['model']}: {len(model['flags'])} flags")
+            item.setToolTip("\n".join(
+                map(_agreement.format_flag, model["flags"])))
+            item.setData(QtCore.Qt.UserRole, model)
+            self._qa_report.addItem(item)
+        self._qa_report.itemActivated.connect(self._qa_item_activated_cb)
+        self._qa_report.show()
+
+    def _qa_item_activated_cb(self, item):
+        model = item.data(QtCore.Qt.UserRole)
+        if model["path"] is None:
+            QtWidgets.QMessageBox.critical(
+                self, "Model not found",
+                f"The model file for {model['model']} could not be found.")
+            return
+        self._open_model(model["path"])
+        if self.path is None or Path(self.path) != Path(model["path"]):
+            return
+        flagged = {i["landmark"] for i in model["flags"]}
+        table = self.table.table
+        selection = QtCore.QItemSelection()
+        for (row, name) in enumerate(self.table.names):
+            if name in flagged:
+                selection.select(
+                    table.model().index(row, 0),
+                    table.model().index(row, self.table.shape[1] - 1))
+        table.selectionModel().select(selection,
+                                      QtCore.QItemSelectionModel.ClearAndSelect)
+
     def keyPressEvent(self, event):
         # No shift/ctrl/alt/etc keys pressed
         if int(event.modifiers() & (~QtCore.Qt.KeypadModifier)) == 0:
@@ -327,22 +791,19 @@ def keyPressEvent(self, event):
         self.table.table.keyPressEvent(event)
 
     def closeEvent(self, event):
+        if self._browser is not None:
+            self._browser.close()
+        if self._qa_report is not None:
+            self._qa_report.close()
+        self._release_lease()
         self.clicker.closeEvent(event)
 
     def show_licenses(self):
         """Open a licenses viewer window."""
 
-        import pkg_resources
         import lamancha.pyqt5
 
-        components = {"python": lamancha.python}
-        for distribution in pkg_resources.require("tomial_clicky_tooth"):
-            try:
-                component = lamancha.Distribution(distribution)
-            except (lamancha.exceptions.NoLicense,
-                    lamancha.exceptions.FrozenEditable):
-                continue
-            components[component.name] = component
+        components = _licenses.inventory()
 
         self._licenses = QtWidgets.QWidget()
         self._licenses.setLayout(QtWidgets.QVBoxLayout())
@@ -355,9 +816,89 @@ def show_licenses(self):
         lamancha.pyqt5.TermsAndConditions.centerise(self._licenses)
         self._licenses.show()
 
+    def show_performance_overlay(self, show=True):
+        """Show or hide a live view of the rolling timing statistics. Timings
+        are recorded whilst it is shown even if they were not enabled via the
+        environment."""
+        if show:
+            _timing.recorder.enabled = True
+            if self._overlay is None:
+                self._overlay = PerformanceOverlay(self)
+                self._overlay.sections.append(
+                    lambda: resources_section(self.resources()))
+            self._overlay.show()
+        elif self._overlay is not None:
+            _timing.recorder.enabled = bool(os.environ.get(_timing.ENV))
+            self._overlay.hide()
+
+    def resources(self):
+        """Count the objects and memory which should be released whenever a
+        model is closed (see :mod:`tomial_clicky_tooth._resources`).
+
+        Returns:
+            dict: ``{"rss bytes": ..., "actors": ..., "history bytes": ...}``
+            etc.
+
+        """
+        out = _resources.snapshot()
+        out.update(self.clicker.resources())
+        out["history states"] = len(self._history)
+        out["history bytes"] = sum(i.nbytes for i in self._history)
+        return out
+
+    def export_timings(self):
+        """Save all recorded timing samples to a JSON or CSV file."""
+        options = dict(
+            caption="Export timings",
+            directory="timings.json",
+            filter="JSON (*.json);;Basic Spreadsheet (*.csv)",
+        )
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, **options)
+        if path:
+            _timing.recorder.export(path)
+
+    def record_trace(self, record=True):
+        """Start or stop recording a Chrome trace (see
+        :mod:`tomial_clicky_tooth._tracing`). Starting prompts for where to
+        write the trace to."""
+        if not record:
+            _tracing.stop()
+            return
+        options = dict(
+            caption="Record trace to",
+            directory="trace.json",
+            filter="Chrome Trace (*.json)",
+        )
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, **options)
+        if path:
+            _tracing.start(path)
+        else:
+            self._trace_action.setChecked(False)
+
+    def profile(self, profile=True):
+        """Start or stop the sampling profiler (see
+        :mod:`tomial_clicky_tooth._profiling`). Stopping prompts for where to
+        save the profile to."""
+        from tomial_clicky_tooth import _profiling
+
+        if profile:
+            _profiling.start()
+            return
+        profiler = _profiling.stop()
+        if profiler is None:  # pragma: no cover
+            return
+        options = dict(
+            caption="Save profile",
+            directory=time.strftime("profile-%Y%m%d-%H%M%S.json"),
+            filter="Speedscope (*.json);;pstats (*.prof)",
+        )
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, **options)
+        if path:
+            profiler.save(path)
+
     def _log_state(self, *_):
         """Record the current landmark positions for undo/redo."""
-        with self._thread_lock:
+        with self._thread_lock, timed("log state"):
             self._history.position += 1
             # If the user has just pressed undo then overwrite (by removing) the
             # undone states.
@@ -365,41 +906,61 @@ def _log_state(self, *_):
                 self._history.pop()
             if self._history.saved_position >= len(self._history):
                 self._history.saved_position = -1
-            self._history.append(self.points)
+            self._history.append(self.points, self.table.proposed)
             self._update_modified_state_indicators()
 
     def _update_modified_state_indicators(self):
         self.setWindowModified(self._history.modified)
-        self.table.save_button.setEnabled(self._history.modified)
+        # There's nothing to save until a model which is loading in the
+        # background has its landmarks.
+        loading = self._pending_load is not None
+        self.table.save_button.setEnabled(self._history.modified
+                                          and not loading)
+        self.table.save_action.setEnabled(not loading)
+        self.table.save_as_action.setEnabled(not loading)
 
     def undo(self):
         """Undo a change made via user interaction."""
         with self._thread_lock:
             if self._history.position > 0:
                 self._history.position -= 1
-                self.points = self._history[self._history.position]
-                self._update_modified_state_indicators()
+                self._restore_state()
 
     def redo(self):
         """Reapply a change reverted by undo()."""
         with self._thread_lock:
             if self._history.position < len(self._history) - 1:
                 self._history.position += 1
-                self.points = self._history[self._history.position]
-                self._update_modified_state_indicators()
-
+                self._restore_state()
 
-SUFFIXES = [".stl", ".stl.gz", ".stl.bz2", ".stl.xz"]
-SUFFIX_RE = re.compile("(.*)(" + "|".join(map(re.escape, SUFFIXES)) + ")$")
+    def _restore_state(self):
+        position = self._history.position
+        self.points = self._history[position]
+        self.table.set_proposed(self._history.proposed[position])
+        self._update_modified_state_indicators()
 
 
 class History(collections.deque):
-    """A state history for undo/redo operations."""
-    def __init__(self, state):
+    """A state history for undo/redo operations.
+
+    Each state is the table's points. Which of them were proposals (see
+    :meth:`LandmarkTable.propose`) is kept alongside in :attr:`proposed`.
+
+    """
+    def __init__(self, state, proposed=()):
         self.position = 0
         self.saved_position = 0
+        self.proposed = [frozenset(proposed)]
         super().__init__([state])
 
+    def append(self, state, proposed=()):
+        super().append(state)
+        self.proposed.append(frozenset(proposed))
+
+    def pop(self):
+        self.proposed.pop()
+        return super().pop()
+
     @property
     def modified(self):
         """True if the current state has been modified since it was last saved
@@ -408,7 +969,16 @@ def modified(self):
 
 
 def main(names, path=None, points=None):
-    self = UI(names, path, points)
+    _tracing.start_from_environment()
+    self = UI(names, points=points)
+    self._watchdog = _watchdog.watch_qt(self)
     self.show()
+    # Paint the window before the slow job of loading a model.
+    app.processEvents()
+    self._open_model(path, background=True)
+    # Collect the licenses in the background too. Queuing it on the (single
+    # threaded) loader defers it until the initial model is in so that the two
+    # don't compete.
+    self._loader.submit(_licenses.prefetch)
     app.exec()
     return self
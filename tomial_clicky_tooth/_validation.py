@@ -0,0 +1,201 @@
+"""Check a whole dataset's landmark files against a landmarks template."""
+
+import math
+import collections
+from pathlib import Path
+
+from pangolin import JawType, arch_type
+
+from tomial_clicky_tooth import _batch, _csv_io, _dataset
+from tomial_clicky_tooth._landmark_templates import LandmarksTemplate, \
+    LandmarksUndefined
+
+
+def template_path(template):
+    """Resolve a template filename, or the name of a template shipped with
+    this package (e.g. ``"MHB"``), to a filename."""
+    if Path(template).exists():
+        return Path(template)
+    bundled = Path(__file__).parent / f"{template}.yaml"
+    return bundled if bundled.exists() else Path(template)
+
+
+def expected_names(template, name, primary=False):
+    """Get the landmark names a model should have.
+
+    Args:
+        template (LandmarksTemplate):
+            The template to evaluate.
+        name (str):
+            The model's name, from which its arch type is derived.
+        primary (bool):
+            Whether the models are of deciduous teeth.
+    Returns:
+        list[str]: The names.
+    Raises:
+        ValueError: If the arch type can't be determined.
+        LandmarksUndefined: If the template doesn't cover this arch type.
+
+    """
+    return template.evaluate(JawType(arch_type=arch_type(name),
+                                     primary=primary))
+
+
+def validate(model, template, primary=False, optional=()):
+    """Check one model's landmarks.
+
+    Args:
+        model (pathlib.Path):
+            The model's filename. Its landmarks are read from
+            :func:`_dataset.csv_path`.
+        template (LandmarksTemplate):
+            The template to compare against.
+        primary (bool):
+            Whether the models are of deciduous teeth.
+        optional (set[str]):
+            Names of landmarks which may be left unset.
+    Returns:
+        dict: A report with keys ``"model"``, ``"csv"``, ``"expected"`` (the
+        number of landmarks expected), ``"placed"`` (the names of those
+        actually set) and ``"errors"`` (a list of ``(kind, message)`` pairs).
+
+    """
+    model = Path(model)
+    csv = _dataset.csv_path(model)
+    report = {
+        "model": str(model),
+        "csv": str(csv),
+        "expected": 0,
+        "placed": [],
+        "errors": [],
+    }
+    errors = report["errors"]
+
+    try:
+        expected = expected_names(template, _dataset.model_name(model), primary)
+    except LandmarksUndefined as ex:
+        errors.append(("no template", str(ex)))
+        return report
+    except Exception as ex:
+        errors.append(("unknown arch type", f"{type(ex).__name__}: {ex}"))
+        return report
+    report["expected"] = len(expected)
+
+    if not csv.exists():
+        errors.append(("missing csv", f"{csv.name} does not exist."))
+        return report
+    try:
+        names, points = _csv_io.read_named(csv)
+    except (OSError, UnicodeDecodeError, ValueError) as ex:
+        errors.append(("unreadable csv", f"{type(ex).__name__}: {ex}"))
+        return report
+
+    if names != expected:
+        missing = [i for i in expected if i not in names]
+        unexpected = [i for i in names if i not in expected]
+        if missing:
+            errors.append(("missing names", ", ".join(missing)))
+        if unexpected:
+            errors.append(("unexpected names", ", ".join(unexpected)))
+        if not missing and not unexpected:
+            errors.append(("wrong order", "Landmarks are not in the "
+                           "template's order."))
+
+    for (name, point) in zip(names, points):
+        if point is None or all(map(math.isnan, point)):
+            if name in expected and name not in optional:
+                errors.append(("unset", name))
+        elif not all(map(math.isfinite, point)):
+            errors.append(("non-finite", f"{name} = {point}"))
+        else:
+            report["placed"].append(name)
+
+    return report
+
+
+# Each worker process parses the template once rather than once per model.
+_worker_template = None
+
+
+def _init_worker(template):
+    global _worker_template
+    _worker_template = LandmarksTemplate.from_file(template)
+
+
+def _validate_in_worker(args):
+    return validate(args[0], _worker_template, *args[1:])
+
+
+def validate_dataset(root, template, primary=False, optional=(), jobs=None):
+    """Check every model in a dataset directory.
+
+    Args:
+        root:
+            The dataset directory.
+        template:
+            A template filename or the name of a bundled template.
+        primary:
+            Whether the models are of deciduous teeth.
+        optional:
+            Names of landmarks which may be left unset.
+        jobs:
+            The number of processes to use. Defaults to one per CPU. If 1, run
+            in this process.
+    Yields:
+        dict: A report (see :func:`validate`) per model, in order.
+
+    """
+    optional = frozenset(optional)
+    yield from _batch.imap(
+        _validate_in_worker,
+        [(i, primary, optional) for i in _dataset.model_paths(root)], jobs,
+        _init_worker, (template_path(template),))
+
+
+class Summary:
+    """Aggregate validation reports as they come in."""
+    def __init__(self):
+        self.models = 0
+        self.invalid = 0
+        self.errors = collections.Counter()
+        self.placed = collections.Counter()
+        self.expected = 0
+
+    def add(self, report):
+        self.models += 1
+        self.invalid += bool(report["errors"])
+        self.errors.update(kind for (kind, _) in report["errors"])
+        self.placed.update(report["placed"])
+        self.expected += report["expected"]
+
+    def to_dict(self):
+        return {
+            "models": self.models,
+            "valid": self.models - self.invalid,
+            "invalid": self.invalid,
+            "errors": dict(self.errors.most_common()),
+            "placed": sum(self.placed.values()),
+            "expected": self.expected,
+            "placed_per_landmark": dict(self.placed.most_common()),
+        }
+
+    def __str__(self):
+        lines = [f"{self.models - self.invalid}/{self.models} models valid."]
+        if self.expected:
+            placed = sum(self.placed.values())
+            lines.append(f"{placed}/{self.expected} landmarks placed "
+                         f"({placed / self.expected:.1%}).")
+        for (kind, count) in self.errors.most_common():
+            lines.append(f"  {kind}: {count}")
+        return "\n".join(lines)
+
+
+def format_report(report):
+    """Format a report as a single line of text (or several if there are
+    errors)."""
+    name = _dataset.model_name(report["model"])
+    if not report["errors"]:
+        return f"OK    {name}"
+    return "\n".join(
+        [f"FAIL  {name}"] +
+        [f"      {kind}: {message}" for (kind, message) in report["errors"]])
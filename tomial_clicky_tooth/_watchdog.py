@@ -0,0 +1,136 @@
+"""Detect and diagnose the UI freezing.
+
+A :class:`Watchdog` thread expects a heartbeat from the thread it is watching
+(the Qt main thread, via :func:`watch_qt`). If the heartbeat stops for longer
+than a threshold, the watched thread's Python stack and whatever
+:func:`tomial_clicky_tooth._timing.timed` operations it is inside are captured
+and written to a rotating log file (by default ``stalls.log`` in the cache
+directory, override with the ``TOMIAL_CLICKY_TOOTH_STALL_LOG`` environment
+variable). The most recent stalls are also kept in memory in
+:attr:`Watchdog.stalls` for interactive inspection (see :mod:`_debug`).
+
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+import collections
+from logging.handlers import RotatingFileHandler
+
+from tomial_clicky_tooth import _cache, _timing
+
+LOG_ENV = "TOMIAL_CLICKY_TOOTH_STALL_LOG"
+
+
+def log_path():
+    """The stall log's filename."""
+    return os.environ.get(LOG_ENV) or _cache.cache_root() / "stalls.log"
+
+
+def _logger(path):
+    """Get a logger writing to a size-limited, rotating set of log files."""
+    logger = logging.getLogger(f"{__name__}:{path}")
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=1 << 20, backupCount=3,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class Stall:
+    """A record of one occasion when the watched thread stopped responding."""
+    def __init__(self, started, operations, stack):
+        self.started = started
+        self.operations = operations
+        self.stack = stack
+        # Filled in once the thread has recovered.
+        self.duration = None
+
+    def __str__(self):
+        duration = "ongoing" if self.duration is None \
+            else f"{self.duration:.1f} seconds"
+        started = time.strftime("%H:%M:%S", time.localtime(self.started))
+        operations = " > ".join(self.operations) or "unknown"
+        return f"Stall at {started} ({duration}) during: {operations}\n" \
+               f"{self.stack}"
+
+
+class Watchdog:
+    """Monitor a thread for stalls.
+
+    Args:
+        threshold:
+            How long (in seconds) without a heartbeat counts as a stall.
+        interval:
+            How often (in seconds) to check for a heartbeat.
+        thread:
+            The thread to watch. Defaults to the main thread.
+        path:
+            The log filename. Defaults to :func:`log_path`.
+
+    Call :meth:`beat` regularly from the watched thread.
+
+    """
+    def __init__(self, threshold=2., interval=.1, thread=None, path=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.thread_id = (thread or threading.main_thread()).ident
+        self.path = path or log_path()
+        self.stalls = collections.deque(maxlen=100)
+        self.last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="stall watchdog")
+
+    def beat(self):
+        self.last_beat = time.monotonic()
+
+    def start(self):
+        self.beat()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _capture(self, elapsed):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else ""
+        operations = list(_timing.recorder.active.get(self.thread_id, ()))
+        return Stall(time.time() - elapsed, operations, stack)
+
+    def _run(self):
+        logger = _logger(self.path)
+        stall = None
+        while not self._stop.wait(self.interval):
+            elapsed = time.monotonic() - self.last_beat
+            if stall is None:
+                if elapsed > self.threshold:
+                    stall = self._capture(elapsed)
+                    self.stalls.append(stall)
+                    logger.warning(str(stall))
+            elif elapsed < self.threshold:
+                stall.duration = time.time() - stall.started - elapsed
+                logger.info(f"Recovered after {stall.duration:.1f} seconds.")
+                stall = None
+
+
+def watch_qt(parent, **kwargs):
+    """Start a :class:`Watchdog` on the Qt main thread, with a heartbeat
+    driven by a timer owned by **parent**."""
+    from PyQt5 import QtCore
+
+    watchdog = Watchdog(**kwargs)
+    timer = QtCore.QTimer(parent)
+    timer.setInterval(int(watchdog.interval * 1000))
+    timer.timeout.connect(watchdog.beat)
+    timer.start()
+    return watchdog.start()
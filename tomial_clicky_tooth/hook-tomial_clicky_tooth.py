@@ -1,3 +1,20 @@
+import os
+import pickle
+import tempfile
+
 from PyInstaller.utils.hooks import collect_data_files
 
 datas = collect_data_files("tomial_clicky_tooth")
+
+# Collect the licenses inventory now, whilst the full environment is available,
+# so that the frozen application doesn't have to scan for it at runtime.
+try:
+    from tomial_clicky_tooth import _licenses
+
+    _path = os.path.join(tempfile.mkdtemp(), _licenses.BUNDLED.name)
+    with open(_path, "wb") as f:
+        pickle.dump(_licenses.collect(), f)
+    datas.append((_path, "tomial_clicky_tooth"))
+except Exception as ex:
+    # Fall back to collecting at runtime.
+    print("Failed to pre-collect tomial_clicky_tooth's licenses:", ex)